@@ -0,0 +1,164 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import time
+
+import pytest
+
+from app import aggregate_cache
+
+EMAIL = 'pm@example.com'
+AGGREGATES = ({'users': 1}, {'projects': 1}, {'bookings': 1}, {'rates': 1})
+
+
+@pytest.fixture
+def email():
+    aggregate_cache.clear_aggregates(EMAIL)
+    aggregate_cache.cache.delete(aggregate_cache.progress_key(EMAIL))
+    yield EMAIL
+    aggregate_cache.clear_aggregates(EMAIL)
+    aggregate_cache.cache.delete(aggregate_cache.progress_key(EMAIL))
+
+
+def test_progress_of_a_build(email):
+    assert aggregate_cache.get_progress(email) is None
+
+    def build():
+        aggregate_cache.report(email, 'projects', 2)
+        aggregate_cache.report(email, 'tasks', 1, 2)
+        progress = aggregate_cache.get_progress(email)
+        assert progress['status'] == aggregate_cache.STATUS_BUILDING
+        assert [(phase['phase'], phase['done'], phase['total']) for phase in progress['phases']] == [
+            ('projects', 2, None), ('tasks', 1, 2)]
+        return AGGREGATES
+
+    aggregate_cache.start_build(email, build)
+    assert aggregate_cache.get_progress(email)['status'] == aggregate_cache.PROGRESS_DONE
+
+    # reports outside of a build are dropped
+    aggregate_cache.report(email, 'tasks', 2, 2)
+    assert len(aggregate_cache.get_progress(email)['phases']) == 2
+
+
+def test_progress_of_a_failed_build(email):
+    def build():
+        aggregate_cache.report(email, 'projects', 2)
+        raise ValueError('OpenAir is down')
+
+    with pytest.raises(ValueError):
+        aggregate_cache.start_build(email, build)
+
+    progress = aggregate_cache.get_progress(email)
+    assert progress['status'] == aggregate_cache.PROGRESS_FAILED
+    assert [phase['phase'] for phase in progress['phases']] == ['projects']
+
+
+def _start_in_thread(email, build, **kwargs):
+    """ Run start_build in a thread, the returned dictionary gets its 'result' or its 'error' """
+    outcome = {}
+
+    def run():
+        try:
+            outcome['result'] = aggregate_cache.start_build(email, build, **kwargs)
+        except Exception, err:
+            outcome['error'] = err
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread, outcome
+
+
+def test_concurrent_builds_share_one_flight(email):
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def slow_build():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return AGGREGATES
+
+    leader, led = _start_in_thread(email, slow_build)
+    started.wait(5)
+    joiner, joined = _start_in_thread(email, slow_build)
+    # a caller that does not wait long enough is told the build is still running
+    assert aggregate_cache.start_build(email, slow_build, wait=0.05) == (None, aggregate_cache.STATUS_BUILDING)
+
+    release.set()
+    leader.join(5)
+    joiner.join(5)
+
+    assert len(calls) == 1
+    entry, status = led['result']
+    assert status == aggregate_cache.STATUS_BUILT
+    assert joined['result'] == (entry, aggregate_cache.STATUS_JOINED)
+    assert aggregate_cache.start_build(email, slow_build) == (entry, aggregate_cache.STATUS_CACHED)
+    assert not aggregate_cache._flights
+
+
+def test_failed_build_reaches_joiners_and_is_cleaned_up(email):
+    started, release = threading.Event(), threading.Event()
+
+    def failing_build():
+        started.set()
+        release.wait(5)
+        raise ValueError('OpenAir is down')
+
+    leader, led = _start_in_thread(email, failing_build)
+    started.wait(5)
+    joiner, joined = _start_in_thread(email, failing_build)
+    time.sleep(0.05)
+
+    release.set()
+    leader.join(5)
+    joiner.join(5)
+
+    assert isinstance(led['error'], ValueError)
+    assert joined['error'] is led['error']
+    assert not aggregate_cache._flights
+    assert aggregate_cache.get_entry(email) is None
+
+    # the next caller leads a build of its own
+    assert aggregate_cache.start_build(email, lambda: AGGREGATES)[1] == aggregate_cache.STATUS_BUILT
+
+
+def test_stale_entry_is_served_while_one_refresh_rebuilds_it(email):
+    stale = aggregate_cache.set_aggregates(email, *AGGREGATES)
+    stale['built_at'] -= aggregate_cache.AGGREGATE_SOFT_TIMEOUT + 1
+    aggregate_cache.cache.set(aggregate_cache.cache_key(email), stale)
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def slow_build():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return AGGREGATES
+
+    # pages are rendered from the stale entry without building
+    assert aggregate_cache.start_build(email, slow_build) == (stale, aggregate_cache.STATUS_STALE)
+
+    refresh, refreshed = _start_in_thread(email, slow_build, refresh=True)
+    started.wait(5)
+    # a second refresh, e.g. from another tab, gets the stale entry instead of building again
+    assert aggregate_cache.start_build(email, slow_build, refresh=True) == (stale, aggregate_cache.STATUS_STALE)
+
+    release.set()
+    refresh.join(5)
+
+    assert len(calls) == 1
+    fresh, status = refreshed['result']
+    assert status == aggregate_cache.STATUS_BUILT
+    assert fresh['built_at'] > stale['built_at']
+    assert aggregate_cache.start_build(email, slow_build) == (fresh, aggregate_cache.STATUS_CACHED)
@@ -0,0 +1,161 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from app.aggregation import build_aggregates, build_rollup_aggregates, build_task_view, build_views
+
+USERNAME = 'pm@example.com'
+
+
+def test_fees_and_hours(rows):
+    users_dict, projects_dict, bookings_dict, rates_dict = build_aggregates(USERNAME, **rows)
+
+    apollo = projects_dict[USERNAME][1]
+    # 12 hours at 800 a day plus a 50 expense
+    assert apollo['fees_worked'] == 12 / 8.00 * 800.0 + 50.0
+    assert apollo['tasks'][10] == {'name': 'Design', 'total_hours': 12.0}
+    assert apollo['hours_worked'] == 12.0
+    assert apollo['users'][7][10] == {'total_hours': 12.0, 'total_fees': 1200.0}
+    assert apollo['users'][7]['total_hrs_used'] == 12.0
+    assert apollo['users'][7]['expenses'] == 50.0
+    assert users_dict[USERNAME][7]['name'] == 'Montoya, Inigo'
+    assert rates_dict[USERNAME][7, 1]['rate'] == 800.0
+
+
+def test_unlisted_project_has_no_budget(rows):
+    projects_dict = build_aggregates(USERNAME, **rows)[1]
+
+    gemini = projects_dict[USERNAME][2]
+    assert 'budget' not in gemini
+    assert gemini['hours_worked'] == 8.0
+    assert gemini['fees_worked'] == 0.0
+
+
+def test_several_rows_and_rates(rows):
+    rows['tasks'].append({'project_id': 2, 'project_name': 'Gemini', 'project_task_id': 21,
+                          'project_task_name': 'Test', 'user_id': 7, 'hour': 4.0})
+    # a lower rate listed after the higher one does not win
+    rows['rates'].append({'user_id': 7, 'project_id': 1, 'rate': 600.0, 'currency': 'USD'})
+    projects_dict, bookings_dict, rates_dict = build_aggregates(USERNAME, **rows)[1:]
+
+    # the hours of every row add up, not only those of the first row of a project
+    assert projects_dict[USERNAME][2]['hours_worked'] == 12.0
+    assert rates_dict[USERNAME][7, 1]['rate'] == 800.0
+    assert projects_dict[USERNAME][1]['fees_worked'] == 12 / 8.00 * 800.0 + 50.0
+
+
+def test_project_known_only_from_tickets(rows):
+    rows['tickets'] += [{'project_id': 4, 'project_name': 'Mercury', 'user_id': 7, 'total': 20.0},
+                        {'project_id': 4, 'project_name': 'Mercury', 'user_id': 7, 'total': 5.0}]
+    projects_dict = build_aggregates(USERNAME, **rows)[1]
+
+    # the first expense counts like the others, whether the rows are single tickets or per user rollups
+    mercury = projects_dict[USERNAME][4]
+    assert mercury['fees_worked'] == 25.0
+    assert mercury['users'][7]['expenses'] == 25.0
+
+
+def test_bookings(rows):
+    bookings_dict = build_aggregates(USERNAME, **rows)[2]
+
+    apollo = bookings_dict[USERNAME][1]
+    assert apollo['tot_booked_hrs'] == 56.0
+    assert apollo['users_proj_hours'] == {7: 56.0}
+    assert apollo[10]['total_task_hrs'] == 40.0
+    assert apollo[10][7] == {'hours': 40.0, 'percentage': 50}
+    assert apollo[11][7]['hours'] == 16.0
+
+
+def test_rollups_match_rows(rows):
+    rollups = dict(rows)
+    rollups['task_rollups'] = [{'project_id': 1, 'project_name': 'Apollo', 'project_task_id': 10,
+                                'project_task_name': 'Design', 'user_id': 7, 'hours': 12.0, 'fees': 1200.0},
+                               {'project_id': 2, 'project_name': 'Gemini', 'project_task_id': 20,
+                                'project_task_name': 'Build', 'user_id': 7, 'hours': 8.0, 'fees': 0.0}]
+    rollups['ticket_rollups'] = rollups.pop('tickets')
+    # the two bookings of the user on task 10 are summed by the query
+    rollups['booking_rollups'] = [{'project_id': 1, 'project_task_id': 10, 'user_id': 7, 'hours': 40.0,
+                                   'percentage': 50},
+                                  {'project_id': 1, 'project_task_id': 11, 'user_id': 7, 'hours': 16.0,
+                                   'percentage': None}]
+    del rollups['bookings']
+    del rollups['tasks']
+
+    assert build_rollup_aggregates(USERNAME, **rollups) == build_aggregates(USERNAME, **rows)
+
+
+def test_views(rows):
+    rows['projects'].append(dict(rows['projects'][0], id=3, name='PTO'))
+    views = build_views(USERNAME, *build_aggregates(USERNAME, **rows))
+
+    # internal projects are left out of the index table but still have a project view
+    assert [row.id for row in views['project_rows']] == [1, 2]
+    assert set(views['projects']) == set([1, 2, 3])
+
+    apollo, gemini = views['project_rows']
+    assert apollo.burn_pie == '1.561/1.561'
+    assert apollo.burn_label == '125.00%'
+    assert apollo.budget_label == 'USD 1,000.00'
+    # 12 of the 56 booked hours worked
+    assert (apollo.pace, apollo.pace_note) == ('21.43%', None)
+    assert gemini.burn_pie is None and gemini.budget_label is None
+    assert gemini.pace_note == 'no bookings'
+
+    view = views['projects'][1]
+    assert view.fees_label == 'USD 1,250.00'
+    assert view.burn_label == '125.00%'
+    assert view.budget_days == '10.00'
+    assert view.tasks == [(10, 'Design')]
+    consultant, = view.consultants
+    assert consultant.name == 'Montoya, Inigo'
+    assert (consultant.days_used, consultant.days_left) == (1.5, 5.5)
+    # 1.5 days at 800 plus the 50 expense
+    assert consultant.fees_used == 'USD 1,250.00'
+    # 7 booked days at 800 less the fees used, expenses counted once
+    assert consultant.fees_left == 'USD 4,350.00'
+
+
+def test_task_view(rows):
+    aggregates = build_aggregates(USERNAME, **rows)
+    view = build_task_view(USERNAME, 1, 10, *aggregates)
+
+    assert (view.name, view.project_name) == ('Design', 'Apollo')
+    assert (view.hours_worked, view.hours_booked) == (12.0, 40.0)
+    consultant, = view.consultants
+    assert (consultant.days_used, consultant.days_left) == (1.5, 3.5)
+    assert consultant.fees_used == 'USD 1,200.00'
+
+    # nobody worked on the booked task 11 yet
+    view = build_task_view(USERNAME, 1, 11, *aggregates)
+    assert (view.name, view.project_name) == (None, 'Apollo')
+    assert (view.hours_worked, view.hours_booked) == (0.0, 16.0)
+    consultant, = view.consultants
+    assert (consultant.days_used, consultant.days_left) == (None, 2.0)
+
+    assert build_task_view(USERNAME, 1, 12, *aggregates) is None
+    assert build_task_view(USERNAME, 9, 10, *aggregates) is None
+
+
+def test_rollup_progress(rows):
+    task_rollups = [dict(task, hours=task['hour'], fees=0.0) for task in rows['tasks']]
+    phases = []
+
+    def progress(phase, done=None, total=None):
+        phases.append((phase, done, total))
+
+    build_rollup_aggregates(USERNAME, rows['projects'], rows['users'], task_rollups, rows['tickets'], rows['bookings'],
+                            rows['rates'], progress=progress)
+
+    # the rollups of Apollo and then of Gemini, which only appears in the rollups
+    assert phases == [('rates', 1, None), ('users', 1, None), ('projects', 1, None), ('tasks', 1, 1), ('tasks', 2, 2),
+                      ('tickets', None, None), ('bookings', 1, None)]
@@ -0,0 +1,249 @@
+#########################################################################################################################################
+# per-user cache of the dashboard aggregates (users_dict, projects_dict, bookings_dict, rates_dict) and of the view
+# models built from them, all stored in a single entry keyed by the associate's email so they always expire together
+import hashlib
+import logging
+import threading
+import time
+
+from werkzeug.contrib.cache import SimpleCache
+
+# bump whenever the shape of the aggregate dictionaries changes so stale entries are ignored
+CACHE_VERSION = 3
+
+# entries younger than the soft timeout are fresh, older ones are served stale until a refresh rebuilds them
+AGGREGATE_SOFT_TIMEOUT = 60 * 60 * 4  # 4 hours
+# entries are dropped after the hard timeout and the next request has to wait for a rebuild
+AGGREGATE_TIMEOUT = 60 * 60 * 24  # 24 hours
+# progress of the last build of an associate is kept this long, see report()
+PROGRESS_TIMEOUT = 60 * 10  # 10 minutes
+
+cache = SimpleCache()
+
+# builds currently in progress keyed by cache key, guarded by _flights_lock
+_flights = {}
+_flights_lock = threading.Lock()
+
+# statuses reported by start_build and get_or_build
+STATUS_CACHED = 'cached'
+STATUS_BUILT = 'built'
+STATUS_JOINED = 'joined'
+STATUS_STALE = 'stale'
+STATUS_BUILDING = 'building'
+
+# statuses of a finished build reported by get_progress, a running one has STATUS_BUILDING
+PROGRESS_DONE = 'done'
+PROGRESS_FAILED = 'failed'
+
+
+def cache_key(email):
+    """ Return the cache key for the associate identified by email """
+    return 'aggregates:v%d:%s' % (CACHE_VERSION, email.strip().lower())
+
+
+def progress_key(email):
+    """ Return the cache key of the build progress of the associate identified by email """
+    return 'progress:v%d:%s' % (CACHE_VERSION, email.strip().lower())
+
+
+def get_entry(email):
+    """
+    :param email: the associate's login email
+    :return: the cached entry dictionary or None if missing, expired or built with another CACHE_VERSION
+    """
+    if not email:
+        return None
+
+    entry = cache.get(cache_key(email))
+    if entry is None or entry.get('version') != CACHE_VERSION:
+        return None
+    return entry
+
+
+def get_aggregates(email):
+    """
+    :param email: the associate's login email
+    :return: tuple (users_dict, projects_dict, bookings_dict, rates_dict), all None if nothing is cached
+    """
+    return unpack(get_entry(email))
+
+
+def is_stale(entry, soft_timeout=AGGREGATE_SOFT_TIMEOUT):
+    """ True if entry was built more than soft_timeout seconds ago """
+    return time.time() - entry['built_at'] > soft_timeout
+
+
+def unpack(entry):
+    """ Return the four aggregate dictionaries held by entry, all None if entry is None """
+    if entry is None:
+        return None, None, None, None
+
+    return entry['users_dict'], entry['projects_dict'], entry['bookings_dict'], entry['rates_dict']
+
+
+def unpack_views(entry):
+    """ Return the view models held by entry, see aggregation.build_views(), None if entry is None or has none """
+    if entry is None:
+        return None
+
+    return entry.get('views')
+
+
+def etag(email, entry):
+    """
+    :param email: the associate's login email
+    :param entry: the associate's cached entry
+    :return: an ETag for the responses rendered from entry, it changes with CACHE_VERSION and whenever entry is rebuilt
+    """
+    return hashlib.sha1('%s:%r' % (cache_key(email), entry['built_at'])).hexdigest()
+
+
+def set_aggregates(email, users_dict, projects_dict, bookings_dict, rates_dict, views=None, timeout=AGGREGATE_TIMEOUT):
+    """ Store the four aggregate dictionaries and their view models for email as one entry and return that entry """
+    entry = {
+        'version': CACHE_VERSION,
+        'built_at': time.time(),
+        'users_dict': users_dict,
+        'projects_dict': projects_dict,
+        'bookings_dict': bookings_dict,
+        'rates_dict': rates_dict,
+        'views': views
+    }
+    cache.set(cache_key(email), entry, timeout=timeout)
+    return entry
+
+
+def clear_aggregates(email):
+    """ Drop the cached entry for email """
+    if email:
+        cache.delete(cache_key(email))
+
+
+class _Flight(object):
+    """ A single in-progress build that other callers for the same associate can wait on """
+    def __init__(self):
+        self.done = threading.Event()
+        self.entry = None
+        self.error = None
+
+    def finish(self):
+        self.done.set()
+
+
+def _set_progress(email, progress):
+    cache.set(progress_key(email), progress, timeout=PROGRESS_TIMEOUT)
+
+
+def _lead(email, key, flight, build, timeout):
+    """ Run build() as the leader of flight, cache its result and release any waiting callers """
+    progress = {'status': STATUS_BUILDING, 'started': time.time(), 'phases': []}
+    _set_progress(email, progress)
+    try:
+        # build() returns the four dictionaries, optionally followed by their view models
+        flight.entry = set_aggregates(email, *build(), timeout=timeout)
+    except Exception, err:
+        flight.error = err
+        raise
+    finally:
+        with _flights_lock:
+            _flights.pop(key, None)
+        flight.finish()
+        # report() may have stored phases since, the status is set on the latest copy
+        progress = cache.get(progress_key(email)) or progress
+        progress['status'] = PROGRESS_FAILED if flight.entry is None else PROGRESS_DONE
+        _set_progress(email, progress)
+    return flight.entry
+
+
+def start_build(email, build, wait=None, refresh=False, timeout=AGGREGATE_TIMEOUT):
+    """
+    Return the cached entry for email, building it with build() if needed. Only one build runs per associate at a
+    time: the caller that finds none running builds in its own request, concurrent callers wait for it up to wait
+    seconds and share its result.
+
+    Builds never run on background threads: on the python27 App Engine runtime a thread started by a request is
+    joined when the request ends and cannot outlive it, so a build is bound by the deadline of the request running
+    it. Stale entries are therefore only rebuilt when asked with refresh, by a request the user does not wait on.
+
+    :param email: the associate's login email
+    :param build: callable returning (users_dict, projects_dict, bookings_dict, rates_dict[, views])
+    :param wait: seconds to wait for a build running in another request, None to wait until it finishes
+    :param refresh: rebuild a stale entry instead of returning it
+    :param timeout: cache timeout for a freshly built entry
+    :return: tuple (entry, status) where status is one of STATUS_CACHED, STATUS_STALE, STATUS_BUILT or
+             STATUS_JOINED, or (None, STATUS_BUILDING) if the build of another request is still running
+    """
+    entry = get_entry(email)
+    if entry is not None and not is_stale(entry):
+        return entry, STATUS_CACHED
+    if entry is not None and not refresh:
+        return entry, STATUS_STALE
+
+    key = cache_key(email)
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _Flight()
+            _flights[key] = flight
+
+    if not leader:
+        if entry is not None:
+            # another request is already refreshing the stale entry
+            return entry, STATUS_STALE
+        if not flight.done.wait(wait):
+            return None, STATUS_BUILDING
+        if flight.error is not None:
+            raise flight.error
+        return flight.entry, STATUS_JOINED
+
+    # a build may have finished between the cache miss above and taking the lead
+    built = get_entry(email)
+    if built is not None and not is_stale(built):
+        with _flights_lock:
+            _flights.pop(key, None)
+        flight.entry = built
+        flight.finish()
+        return built, STATUS_CACHED
+
+    return _lead(email, key, flight, build, timeout), STATUS_BUILT
+
+
+def report(email, phase, done=None, total=None):
+    """
+    Record the progress of the build running for email, a no-op when there is none. Pass it, bound to the associate
+    with functools.partial, as the progress callback of aggregation.build_rollup_aggregates(). The progress is kept in
+    the cache next to the entry so that get_progress() reads it from any request.
+
+    :param phase: name of the phase, e.g. 'projects' or 'tasks'
+    :param done: items processed so far in the phase
+    :param total: items the phase will process, None if unknown
+    """
+    progress = cache.get(progress_key(email))
+    if progress is None or progress['status'] != STATUS_BUILDING:
+        return
+
+    progress['phases'].append({'phase': phase, 'done': done, 'total': total,
+                               'elapsed': round(time.time() - progress['started'], 3)})
+    _set_progress(email, progress)
+
+
+def get_progress(email):
+    """
+    :param email: the associate's login email
+    :return: dictionary {'status': STATUS_BUILDING, PROGRESS_DONE or PROGRESS_FAILED, 'started': time.time() of the
+             start, 'phases': [{'phase', 'done', 'total', 'elapsed'}, ...] as reported so far} of the associate's last
+             build, None if nothing was built within PROGRESS_TIMEOUT
+    """
+    if not email:
+        return None
+    return cache.get(progress_key(email))
+
+
+def get_or_build(email, build, timeout=AGGREGATE_TIMEOUT):
+    """
+    Return the cached entry for email, stale or not, building it with build() if there is none, see start_build().
+
+    :return: tuple (entry, status) where status is one of STATUS_CACHED, STATUS_STALE, STATUS_BUILT or STATUS_JOINED
+    """
+    return start_build(email, build, timeout=timeout)
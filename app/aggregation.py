@@ -0,0 +1,517 @@
+#########################################################################################################################################
+# aggregation engine for the dashboard
+# turns plain rows (dictionaries shaped like Model.to_dict()) into users_dict, projects_dict, bookings_dict and rates_dict
+# no Flask or session dependency so it can be benchmarked, profiled and run offline against fixtures
+from collections import namedtuple
+
+from app.oaxmlapi.utils import date_percent_difference
+
+
+def format_row_date(value):
+    """
+    :param value: a 'dd/mm/yyyy' or 'dd/mm/yyyy HH:MM:SS' string or None
+    :return: zero padded 'dd/mm/yyyy' string or 'None' as expected by date_percent_difference
+    """
+    if value is None:
+        return 'None'
+
+    my_day, my_mnth, my_yr = value.split(' ')[0].split('/')
+    return '{2}/{1:0>2}/{0:0>2}'.format(my_yr, my_mnth, my_day)
+
+
+class DashboardAggregator(object):
+    """
+    Accumulates the dashboard dictionaries for a single associate.
+
+    Arguments:
+        username (str): the associate's login email, used as the top level key of every dictionary
+
+    Rows must be added in the order rates, users, projects, tasks, tickets, bookings since fees worked on tasks
+    are priced with the rates already added.
+
+    """
+    def __init__(self, username):
+        self.username = username
+        self.users_name = username.strip()
+
+        self.users_dict = {self.users_name: {}}
+        self.projects_dict = {self.users_name: {}}
+        self.bookings_dict = {self.users_name: {}}
+        self.rates_dict = {}
+
+        self.users = self.users_dict[self.users_name]
+        self.projects = self.projects_dict[self.users_name]
+        self.bookings = self.bookings_dict[self.users_name]
+
+    def __str__(self):
+        return "DashboardAggregator for %s" % self.users_name
+
+    def add_rates(self, rates):
+        """
+        Index the rates by (user_id, project_id). A user with several rates on a project is priced at the highest one,
+        as the MAX(rate) of Task.get_my_task_rollups() does, rather than at whichever row the database returns last.
+        """
+        user_rates = self.rates_dict.setdefault(self.username, {})
+        for rate in rates:
+            key = rate['user_id'], rate['project_id']
+            known = user_rates.get(key)
+            if known is not None and float(known['rate'] or 0.00) >= float(rate['rate'] or 0.00):
+                continue
+            user_rates[key] = {
+                'rate': rate['rate'],
+                'currency': rate['currency']
+            }
+
+    def add_users(self, users):
+        """ Index the users by id """
+        for a_user in users:
+            self.users[a_user['id']] = {
+                'name': a_user['name'],
+                'nick_name': a_user['nickname'],
+                'time_zone': a_user['timezone'],
+                'line_manager_id': a_user['line_manager_id'],
+                'department_id': a_user['department_id'],
+                'active': a_user['active']
+            }
+
+    def add_projects(self, projects):
+        """ Index the projects by id along with their budget and time slot figures """
+        for project in projects:
+            calc_start_date = project['start_date']
+            calc_end_date = project['finish_date']
+            project_days = date_percent_difference(format_row_date(calc_start_date), format_row_date(calc_end_date))
+
+            self.projects[project['id']] = {
+                'name': project['name'],
+                'budget': float(project['budget']),
+                'budget_time': float(project['budget_time']) if project['budget_time'] is not None else 0.00,
+                'owner_id': project['user_id'],
+                'currency': project['currency'],
+                'start_date': calc_start_date,
+                'finish_date': calc_end_date,
+                'project_stage_id': project['project_stage_id'],
+                'updated': project['updated'],
+                'percent_complete_days': project_days['percent_days'],
+                'days_consumed': project_days['days_consumed'],
+                'days_remaining': project_days['days_remaining'],
+                'days_diff': project_days['days_diff'],
+                'fees_worked': 0.0,
+                'hours_worked': 0.0,
+                'tasks': {},
+                'users': {}
+            }
+
+    def _get_project(self, project_id, project_name):
+        """ Return the entry for project_id, creating an unbudgeted one for projects missing from add_projects() """
+        project = self.projects.get(project_id)
+        if project is None:
+            project = self.projects[project_id] = {
+                'name': project_name,
+                'fees_worked': 0.0,
+                'hours_worked': 0.0,
+                'users': {}
+            }
+        return project
+
+    def get_rate(self, user_id, project_id):
+        """ Return the daily rate of user_id on project_id, 0.00 if unknown """
+        try:
+            rate = self.rates_dict[self.username][user_id, project_id]['rate']
+        except KeyError:
+            return 0.00
+        return float(rate) if rate else 0.00
+
+    def _add_hours(self, project_id, project_name, task_id, task_name, user_id, task_hours, fees_worked):
+        """ Add hours and fees worked by user_id on a task """
+        project = self._get_project(project_id, project_name)
+        project['fees_worked'] += fees_worked
+        project['hours_worked'] += task_hours
+
+        # hours and fees per user per task, plus the user's totals on the project
+        user = project['users'].setdefault(user_id, {})
+        user_task = user.setdefault(task_id, {'total_hours': 0.0, 'total_fees': 0.0})
+        user_task['total_hours'] += task_hours
+        user_task['total_fees'] += fees_worked
+        user['total_hrs_used'] = user.get('total_hrs_used', 0.0) + task_hours
+        user['total_hours'] = user.get('total_hours', 0.0) + task_hours
+
+        # hours per task
+        project_task = project.setdefault('tasks', {}).setdefault(task_id, {'name': task_name, 'total_hours': 0.0})
+        project_task['total_hours'] += task_hours
+
+    def add_task(self, task):
+        """ Add the hours and fees of a single timesheet row """
+        project_id = task['project_id']
+        user_id = task['user_id']
+        task_hours = float(task['hour']) if task['hour'] is not None else 0.00
+
+        # rates are daily, a day is 8 hours
+        fees_worked = task_hours / 8.00 * self.get_rate(user_id, project_id)
+
+        self._add_hours(project_id, task['project_name'], task['project_task_id'], task['project_task_name'], user_id,
+                        task_hours, fees_worked)
+
+    def add_task_rollup(self, rollup):
+        """ Add a row of Task.get_my_task_rollups(), its hours and fees are already summed and priced """
+        self._add_hours(rollup['project_id'], rollup['project_name'], rollup['project_task_id'],
+                        rollup['project_task_name'], rollup['user_id'], float(rollup['hours'] or 0.0),
+                        float(rollup['fees'] or 0.0))
+
+    def add_tasks(self, tasks):
+        for task in tasks:
+            self.add_task(task)
+
+    def add_task_rollups(self, rollups):
+        for rollup in rollups:
+            self.add_task_rollup(rollup)
+
+    def add_ticket(self, ticket):
+        """
+        Add the expense of a single ticket row, or a row of Ticket.get_my_ticket_rollups(), to the fees worked. Every
+        expense counts, also the one creating the entry of a project only known from its tickets.
+        """
+        total = float(ticket['total']) if ticket['total'] is not None else 0.00
+
+        project = self._get_project(ticket['project_id'], ticket['project_name'])
+        user = project['users'].setdefault(ticket['user_id'], {})
+        user['expenses'] = user.get('expenses', 0.0) + total
+        project['fees_worked'] += total
+
+    def add_tickets(self, tickets):
+        for ticket in tickets:
+            self.add_ticket(ticket)
+
+    def add_booking(self, booking):
+        """
+        Add a single approved booking row, or a row of Booking.get_my_booking_rollups(), bookings are structured as
+            {project_id: {'tot_booked_hrs': XY,
+                          'users_proj_hours': {user_id: total_hours_booked, ...},
+                          task_id: {'total_task_hrs': XY,
+                                    user_id: {'hours': 40, 'percentage': 45}}}}
+        """
+        project_id = booking['project_id']
+        task_id = booking['project_task_id']
+        user_id = booking['user_id']
+        hours_booked = float(booking['hours']) if booking['hours'] is not None else 0.0
+
+        project = self.bookings.setdefault(project_id, {'tot_booked_hrs': 0.0, 'users_proj_hours': {}})
+        project['tot_booked_hrs'] += hours_booked
+        project['users_proj_hours'][user_id] = project['users_proj_hours'].get(user_id, 0.0) + hours_booked
+
+        project_task = project.setdefault(task_id, {'total_task_hrs': 0.0})
+        project_task['total_task_hrs'] += hours_booked
+
+        # several bookings of a user on a task add up, as SUM(hours) and MAX(percentage) do in the rollup query
+        user_task = project_task.setdefault(user_id, {'hours': 0.0, 'percentage': None})
+        user_task['hours'] += hours_booked
+        if booking['percentage'] is not None:
+            user_task['percentage'] = max(user_task['percentage'], booking['percentage'])
+
+    def add_bookings(self, bookings):
+        for booking in bookings:
+            self.add_booking(booking)
+
+    def results(self):
+        """ Return the tuple (users_dict, projects_dict, bookings_dict, rates_dict) """
+        return self.users_dict, self.projects_dict, self.bookings_dict, self.rates_dict
+
+
+def build_aggregates(username, projects, users, tasks, tickets, bookings, rates):
+    """
+    Build the dashboard dictionaries from plain row iterables.
+
+    :param username: the associate's login email
+    :param projects: rows shaped like Project.to_dict()
+    :param users: rows shaped like User.to_dict()
+    :param tasks: rows shaped like Task.to_dict()
+    :param tickets: rows shaped like Ticket.to_dict()
+    :param bookings: rows shaped like Booking.to_dict()
+    :param rates: rows shaped like Rate.to_dict()
+    :return: tuple (users_dict, projects_dict, bookings_dict, rates_dict)
+    """
+    aggregator = DashboardAggregator(username)
+    aggregator.add_rates(rates)
+    aggregator.add_users(users)
+    aggregator.add_projects(projects)
+    aggregator.add_tasks(tasks)
+    aggregator.add_tickets(tickets)
+    aggregator.add_bookings(bookings)
+    return aggregator.results()
+
+
+def _ignore_progress(phase, done=None, total=None):
+    pass
+
+
+def _report_task_rollups(task_rollups, progress, total):
+    """ Yield task_rollups, reporting the 'tasks' phase each time the rows of another project start """
+    projects_seen = 0
+    project_id = None
+    for rollup in task_rollups:
+        if rollup['project_id'] != project_id:
+            if project_id is not None:
+                progress('tasks', projects_seen, max(total, projects_seen))
+            project_id = rollup['project_id']
+            projects_seen += 1
+        yield rollup
+    # rollups of projects missing from the project rows are aggregated too
+    progress('tasks', projects_seen, max(total, projects_seen))
+
+
+def build_rollup_aggregates(username, projects, users, task_rollups, ticket_rollups, booking_rollups, rates,
+                            progress=None):
+    """
+    Build the dashboard dictionaries from rows already summed in SQL, see Task.get_my_task_rollups(),
+    Ticket.get_my_ticket_rollups() and Booking.get_my_booking_rollups().
+
+    :param progress: optional callable progress(phase, done=None, total=None) called as each phase finishes, the
+                     rows are usually lazy queries so a phase includes fetching its rows. The 'tasks' phase is also
+                     reported as the rollups of each project are aggregated, done/total counting projects.
+    :return: tuple (users_dict, projects_dict, bookings_dict, rates_dict)
+    """
+    progress = progress or _ignore_progress
+
+    aggregator = DashboardAggregator(username)
+    aggregator.add_rates(rates)
+    progress('rates', len(aggregator.rates_dict.get(username, {})))
+    aggregator.add_users(users)
+    progress('users', len(aggregator.users))
+    aggregator.add_projects(projects)
+    progress('projects', len(aggregator.projects))
+    # the rollups are grouped by project first
+    aggregator.add_task_rollups(_report_task_rollups(task_rollups, progress, len(aggregator.projects)))
+    aggregator.add_tickets(ticket_rollups)
+    progress('tickets')
+    aggregator.add_bookings(booking_rollups)
+    progress('bookings', len(aggregator.bookings))
+    return aggregator.results()
+
+
+#########################################################################################################################################
+# view models, the flat rows the templates print as is
+# computed once per build and cached with the aggregates so rendering a page is a single pass over its rows
+
+# projects left out of the index table
+INTERNAL_PROJECTS = ('UnAllocated Time', 'PTO', 'Internal', 'Meetings - Internal')
+
+# sparkline value of a full pie
+FULL_PIE = '1.561/1.561'
+EMPTY_PIE = '0.00/1.561'
+
+# a row of the index table, the *_pie fields are sparkline values and the *_label/*_note fields printed as is
+ProjectRow = namedtuple('ProjectRow', ['id', 'name', 'burn_pie', 'burn_label', 'stretch_pie', 'stretch_label',
+                                       'pace', 'pace_note', 'finish_date', 'budget_label', 'updated'])
+
+# the figures of richproject.html
+ProjectView = namedtuple('ProjectView', ['id', 'name', 'budget_label', 'fees_label', 'burn_label', 'percent_days',
+                                         'percent_days_label', 'start_date', 'finish_date', 'budget_days',
+                                         'has_bookings', 'consultants', 'tasks'])
+
+# a booked consultant of richproject.html
+ConsultantRow = namedtuple('ConsultantRow', ['user_id', 'name', 'worked', 'days_used', 'days_left', 'fees_used',
+                                             'fees_used_note', 'fees_left', 'fees_left_note'])
+
+# a task of richtasks.html and the consultants booked on its project, days_used is None for consultants without time
+# on the task and days_left None for consultants not booked on it
+TaskView = namedtuple('TaskView', ['id', 'name', 'project_id', 'project_name', 'hours_worked', 'hours_booked',
+                                   'consultants'])
+TaskConsultantRow = namedtuple('TaskConsultantRow', ['user_id', 'name', 'days_used', 'days_left', 'fees_used'])
+
+
+def format_money(value):
+    """ :return: value formatted as '1,234.56' """
+    return '{0:,.2f}'.format(float(value))
+
+
+def format_percent(value):
+    """ :return: value formatted as '12.34%' """
+    return '%.2f%%' % float(value)
+
+
+def _burn(project):
+    """ :return: tuple (burn_pie, burn_label) of the index table, (None, None) for projects without a budget """
+    if 'budget' not in project:
+        return None, None
+
+    fees_worked = project['fees_worked']
+    budget = project['budget']
+    if budget <= 0.00:
+        # no budget
+        return EMPTY_PIE, '%s / %s' % (fees_worked, budget)
+    if fees_worked == 0.00:
+        # not started
+        return EMPTY_PIE, '%s/%s' % (fees_worked, budget)
+
+    burn_pie = FULL_PIE if fees_worked / budget > 1 else '%s,%s' % (fees_worked, budget)
+    return burn_pie, format_percent(100 * fees_worked / budget)
+
+
+def _pace(project, booking):
+    """ :return: tuple (pace, pace_note) with the hours worked on a project as a percentage of the hours booked """
+    if not booking:
+        return None, 'no bookings'
+
+    hours_worked = project['hours_worked']
+    booked_hours = booking['tot_booked_hrs']
+    if hours_worked and booked_hours:
+        return format_percent(100 * hours_worked / booked_hours), None
+    if hours_worked:
+        return None, 'worked w/o booking'
+    if booked_hours:
+        return None, 'booked w/o work'
+    return None, None
+
+
+def project_row(project_id, project, booking):
+    """ Return the ProjectRow of a project of projects_dict and its entry of bookings_dict (None if not booked) """
+    burn_pie, burn_label = _burn(project)
+    pace, pace_note = _pace(project, booking)
+
+    percent_days = project.get('percent_complete_days')
+    if percent_days == 100:
+        stretch_pie = FULL_PIE
+    else:
+        stretch_pie = '%s/%s' % (project.get('days_consumed'), project.get('days_diff'))
+
+    budget_label = None
+    if 'budget' in project:
+        budget_label = '%s %s' % (project['currency'], format_money(project['budget']))
+
+    return ProjectRow(project_id, project['name'], burn_pie, burn_label, stretch_pie,
+                      format_percent(percent_days) if percent_days else 'N/A', pace, pace_note,
+                      project.get('finish_date'), budget_label, project.get('updated'))
+
+
+def consultant_row(project_id, project, user_id, hours_booked, users, rates):
+    """ Return the ConsultantRow of a user booked on a project for hours_booked hours """
+    user = users.get(user_id)
+    rate = rates.get((user_id, project_id)) if user is not None else None
+    user_rate = float(rate['rate'] or 0.00) if rate else 0.00
+    currency = rate['currency'] if rate else ''
+
+    worked = project['users'].get(user_id)
+    hours_used = worked.get('total_hrs_used', 0.0) if worked is not None else 0.0
+    expenses = worked.get('expenses', 0.0) if worked is not None else 0.0
+
+    # fees spent are the user's expenses plus the days worked at the user's daily rate
+    fees_spent = expenses + hours_used / 8.00 * user_rate
+    fees_used = fees_used_note = None
+    if worked is None:
+        fees_used_note = "[Consultant hasn't worked]"
+    elif expenses == 0 and user_rate == 0:
+        fees_used_note = '[expenses=0 and user rate=0]'
+    else:
+        fees_used = '%s %s' % (currency, format_money(fees_spent))
+        if user_rate == 0:
+            fees_used_note = '[expenses only, since user rate=0]'
+
+    fees_left = fees_left_note = None
+    if user_rate != 0 and hours_booked != 0:
+        fees_left = '%s %s' % (currency, format_money(user_rate * hours_booked / 8.00 - fees_spent))
+    elif user_rate == 0:
+        fees_left_note = '[user rate = 0]'
+    else:
+        fees_left_note = '[booked hours = 0]'
+
+    return ConsultantRow(user_id, user['name'] if user is not None else None, worked is not None, hours_used / 8.00,
+                         (hours_booked - hours_used) / 8.00, fees_used, fees_used_note, fees_left, fees_left_note)
+
+
+def project_view(project_id, project, booking, users, rates):
+    """ Return the ProjectView of a project of projects_dict and its entry of bookings_dict (None if not booked) """
+    has_budget = 'budget' in project
+    currency = project.get('currency')
+
+    budget_label = fees_label = burn_label = None
+    if has_budget:
+        budget_label = '%s %s' % (currency or '$', format_money(project['budget']))
+        fees_label = '%s %s' % (currency, format_money(project['fees_worked']))
+        if project['fees_worked'] != 0 and project['budget'] != 0:
+            burn_label = format_percent(100 * project['fees_worked'] / project['budget'])
+        else:
+            burn_label = format_percent(0)
+
+    percent_days = project.get('percent_complete_days')
+    budget_days = format_money(project['budget_time'] / 8.00) if project.get('budget_time') else None
+
+    consultants = []
+    if booking:
+        for user_id, hours_booked in booking['users_proj_hours'].iteritems():
+            consultants.append(consultant_row(project_id, project, user_id, hours_booked, users, rates))
+
+    tasks = [(task_id, task['name']) for task_id, task in project.get('tasks', {}).iteritems()]
+
+    return ProjectView(project_id, project['name'], budget_label, fees_label, burn_label, percent_days,
+                       format_percent(percent_days) if percent_days is not None else None,
+                       project.get('start_date'), project.get('finish_date'), budget_days, bool(booking),
+                       consultants, tasks)
+
+
+def task_view(project_id, task_id, project, booking, users, rates):
+    """
+    Return the TaskView of a task of a project of projects_dict, None if the task is neither worked nor booked.
+    A task only booked so far has no hours worked, and no name since booking rows do not carry it.
+    """
+    task = project.get('tasks', {}).get(task_id)
+    task_booking = booking.get(task_id) if booking else None
+    if task is None:
+        if task_booking is None:
+            return None
+        task = {'name': None, 'total_hours': 0.0}
+    task_booking = task_booking or {}
+
+    consultants = []
+    if booking:
+        for user_id in booking['users_proj_hours']:
+            user = users.get(user_id)
+            rate = rates.get((user_id, project_id)) if user is not None else None
+            user_rate = float(rate['rate'] or 0.00) if rate else 0.00
+            currency = rate['currency'] if rate else ''
+
+            worked = project['users'].get(user_id, {}).get(task_id)
+            hours_used = worked['total_hours'] if worked is not None else 0.0
+            booked = task_booking.get(user_id)
+
+            consultants.append(TaskConsultantRow(
+                user_id, user['name'] if user is not None else None,
+                hours_used / 8.00 if worked is not None else None,
+                (booked['hours'] - hours_used) / 8.00 if booked is not None else None,
+                '%s %s' % (currency, format_money(hours_used / 8.00 * user_rate)) if user_rate else None))
+
+    return TaskView(task_id, task['name'], project_id, project['name'], task['total_hours'],
+                    task_booking.get('total_task_hrs', 0.0), consultants)
+
+
+def build_views(username, users_dict, projects_dict, bookings_dict, rates_dict):
+    """
+    Build the view models of index.html and richproject.html from the aggregate dictionaries.
+
+    :return: dictionary {'project_rows': [ProjectRow, ...] in projects_dict order without INTERNAL_PROJECTS,
+                         'projects': {project_id: ProjectView}}
+    """
+    users_name = username.strip()
+    users = users_dict.get(users_name, {})
+    projects = projects_dict.get(users_name, {})
+    bookings = bookings_dict.get(users_name, {})
+    rates = rates_dict.get(username, {})
+
+    project_rows = []
+    project_views = {}
+    for project_id, project in projects.iteritems():
+        booking = bookings.get(project_id)
+        if project['name'] not in INTERNAL_PROJECTS:
+            project_rows.append(project_row(project_id, project, booking))
+        project_views[project_id] = project_view(project_id, project, booking, users, rates)
+
+    return {'project_rows': project_rows, 'projects': project_views}
+
+
+def build_task_view(username, project_id, task_id, users_dict, projects_dict, bookings_dict, rates_dict):
+    """ :return: the TaskView of a task of richtasks.html, None if the project or the task is unknown """
+    users_name = username.strip()
+    project = projects_dict.get(users_name, {}).get(project_id)
+    if project is None:
+        return None
+
+    return task_view(project_id, task_id, project, bookings_dict.get(users_name, {}).get(project_id),
+                     users_dict.get(users_name, {}), rates_dict.get(username, {}))
@@ -5,4 +5,20 @@ SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(basedir, 'app.db')
 SQLALCHEMY_MIGRATE_REPO = os.path.join(basedir, 'db_repository')
 BCRYPT_LEVEL = 12 # allows us to encrypt passwords
 
+# NetSuite OpenAir XML API endpoint and its keep-alive connection pool
+OPENAIR_API_URL = os.environ.get('OPENAIR_API_URL', 'https://www.openair.com/api.pl')
+OPENAIR_RECORD_PATH = os.environ.get('OPENAIR_RECORD_PATH') # cassette recording every OpenAir call, see oaxmlapi.standin
+OPENAIR_POOL_SIZE = 4 # idle connections kept per host
+OPENAIR_POOL_IDLE_TIMEOUT = 60 # seconds before an idle connection is closed
+OPENAIR_CONNECT_TIMEOUT = 5 # seconds to connect before giving up
+OPENAIR_RETRIES = 2 # retries of failed Read, Whoami and Time requests, timeouts are not retried
+OPENAIR_RETRY_BUDGET = 20 # seconds after the first attempt past which a request is not retried
+OPENAIR_BREAKER_ERROR_RATE = 0.5 # failure ratio of the recent calls that opens the circuit breaker
+OPENAIR_BREAKER_RESET_TIMEOUT = 30 # seconds the circuit breaker fails fast before a trial call
+OPENAIR_MAX_IN_FLIGHT = 4 # concurrent requests per client.Client
+OPENAIR_RATE_LIMIT = None # requests per second per company, None for no limit
+
+# Jinja2 bytecode cache, filled by template_benchmark.py precompile before deploying, None to disable
+JINJA_BYTECODE_CACHE_DIR = os.path.join(basedir, 'template_cache')
+
 from app.instance.config import *
@@ -0,0 +1,115 @@
+#########################################################################################################################################
+# JSON slices of the cached dashboard view models for the pages to fetch what they show
+# every response carries an ETag of the associate's cache entry so revisits get a 304 until the entry is rebuilt
+import logging
+
+from functools import wraps
+
+from flask import Blueprint
+from flask import Response
+from flask import json
+from flask import jsonify
+from flask import request
+from flask import session
+
+from app import aggregate_cache
+from app.aggregation import build_task_view
+from app.controllers.tempus_fugit import build_dicts
+
+mod_api = Blueprint('mod_api', __name__, url_prefix='/api')
+
+
+def api_login_required(func):
+    """ Answer 401 instead of redirecting to the login page """
+    @wraps(func)
+    def decorated_view(*args, **kwargs):
+        if not session.get('logged_in') or not session.get('username'):
+            response = jsonify(error='login required')
+            response.status_code = 401
+            return response
+        return func(*args, **kwargs)
+    return decorated_view
+
+
+def _error(status, message):
+    response = jsonify(error=message)
+    response.status_code = status
+    return response
+
+
+def _get_entry():
+    """ Return the associate's cached entry, stale or not, building it on a miss """
+    entry, status = aggregate_cache.get_or_build(session['username'], build_dicts)
+    logging.debug('api: aggregates %s for %s', status, session['username'])
+    return entry
+
+
+def _conditional(render):
+    """
+    Answer 404 if render(entry) finds nothing, 304 if the client already holds the current entry, otherwise the JSON
+    of render(entry) with its ETag. The ETag covers the whole entry, so the resource is looked up before answering 304.
+
+    :param render: callable returning a JSON serializable object, or None for a 404, from the cached entry
+    """
+    entry = _get_entry()
+    data = render(entry)
+    if data is None:
+        return _error(404, 'not found')
+
+    tag = aggregate_cache.etag(session['username'], entry)
+    if request.if_none_match.contains(tag):
+        response = Response(status=304)
+    else:
+        response = Response(json.dumps(data, separators=(',', ':')), mimetype='application/json')
+
+    response.set_etag(tag)
+    # the data is the associate's own, browsers revalidate it on every use
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def _views(entry):
+    return aggregate_cache.unpack_views(entry) or {'project_rows': [], 'projects': {}}
+
+
+# [START projects]
+@mod_api.route('/projects', methods=['GET'])
+@api_login_required
+def projects():
+    def render(entry):
+        return {'projects': [row._asdict() for row in _views(entry)['project_rows']]}
+    return _conditional(render)
+# [END projects]
+
+
+# [START project]
+@mod_api.route('/projects/<int:project_id>', methods=['GET'])
+@api_login_required
+def project(project_id):
+    def render(entry):
+        view = _views(entry)['projects'].get(project_id)
+        if view is None:
+            return None
+
+        data = view._asdict()
+        data['consultants'] = [consultant._asdict() for consultant in view.consultants]
+        data['tasks'] = [{'id': task_id, 'name': name} for task_id, name in view.tasks]
+        return data
+    return _conditional(render)
+# [END project]
+
+
+# [START task]
+@mod_api.route('/projects/<int:project_id>/tasks/<int:task_id>', methods=['GET'])
+@api_login_required
+def task(project_id, task_id):
+    def render(entry):
+        view = build_task_view(session['username'], project_id, task_id, *aggregate_cache.unpack(entry))
+        if view is None:
+            return None
+
+        data = view._asdict()
+        data['consultants'] = [consultant._asdict() for consultant in view.consultants]
+        return data
+    return _conditional(render)
+# [END task]
@@ -1,13 +1,16 @@
+import httplib
 import logging
+import zlib
 
 from datetime import timedelta
 
 from flask import Blueprint
+from flask import abort
 from flask import current_app
 from flask import flash
 from flask import g
+from flask import jsonify
 from flask import render_template
-from werkzeug.contrib.cache import SimpleCache
 
 from app.models.Daily import Daily
 from app.models.Rate import Rate
@@ -16,37 +19,39 @@ from app.models.Project import Project
 from app.models.Task import Task
 from app.models.Ticket import Ticket
 from app.models.User import User
+from app import aggregate_cache
+from app.aggregation import build_rollup_aggregates, build_views
 from login_form import LoginForm
 
-from functools import wraps
+from functools import partial, wraps
 from flask import request, session, redirect, url_for
-from app.oaxmlapi.utils import date_percent_difference
 from app.oaxmlapi.wrapper import get_whoami
 
 mod_tempus_fugit = Blueprint('mod_tempus_fugit', __name__)
 
-# Set up cache
-cache = SimpleCache()
+# longest prepare_data waits for a build before answering 202, well within the 60 seconds request deadline
+PREPARE_DATA_MAX_WAIT = 25
 
 
-def get_unexpired_dicts():
-    users_dict = cache.get('users_dict')
-    projects_dict = cache.get('projects_dict')
-    bookings_dict = cache.get('bookings_dict')
-    rates_dict = cache.get('rates_dict')
+def get_unexpired_entry():
+    # the aggregates are cached per associate, keyed by the login email
+    entry = aggregate_cache.get_entry(session.get('username'))
 
-    if users_dict is None or projects_dict is None or bookings_dict is None or rates_dict is None:
-        return None, None, None, None
+    # past the soft timeout the stale dictionaries are still served, navbar.html then asks prepare_data to rebuild them
+    g.aggregates_stale = entry is not None and aggregate_cache.is_stale(entry)
 
-    return users_dict, projects_dict, bookings_dict, rates_dict
+    return entry
 
 
 @mod_tempus_fugit.before_request
 def before_request():
     session.modified = True
 
-    if request.endpoint not in ['mod_tempus_fugit.index', 'mod_tempus_fugit.login', 'mod_tempus_fugit.logout', 'mod_tempus_fugit.prepare_data']:
-        g.users_dict, g.projects_dict, g.bookings_dict, g.rates_dict = get_unexpired_dicts()
+    if request.endpoint not in ['mod_tempus_fugit.index', 'mod_tempus_fugit.login', 'mod_tempus_fugit.logout', 'mod_tempus_fugit.prepare_data',
+                                'mod_tempus_fugit.prepare_progress']:
+        entry = get_unexpired_entry()
+        g.users_dict, g.projects_dict, g.bookings_dict, g.rates_dict = aggregate_cache.unpack(entry)
+        g.views = aggregate_cache.unpack_views(entry)
         if g.users_dict is None or g.projects_dict is None or g.bookings_dict is None or g.rates_dict is None:
             return redirect(url_for('mod_tempus_fugit.index'))
 
@@ -89,9 +94,11 @@ def login_required(func):
 @mod_tempus_fugit.route('/index.html',methods=['GET','POST'])
 @login_required
 def index():
-    g.users_dict, g.projects_dict, g.bookings_dict, g.rates_dict = get_unexpired_dicts()
-    return render_template(url_for('mod_tempus_fugit.index'), users_dict=g.users_dict, projects_dict=g.projects_dict,
-                               bookings_dict=g.bookings_dict, rates_dict=g.rates_dict)
+    entry = get_unexpired_entry()
+    g.users_dict, g.projects_dict, g.bookings_dict, g.rates_dict = aggregate_cache.unpack(entry)
+    views = aggregate_cache.unpack_views(entry)
+    return render_template(url_for('mod_tempus_fugit.index'),
+                           project_rows=views['project_rows'] if views else None)
 # [END index]
 
 @mod_tempus_fugit.route('/logout',methods=['GET'])
@@ -146,7 +153,12 @@ def login():
         # make a call to the wrapper
         my_company = current_app.config['COMPANY']
         netsuite_key = current_app.config['NETSUITE_API_KEY']  # Retrieve key from instance/config file
-        json_obj = get_whoami(key=netsuite_key, un=username, pw=password, company=my_company)
+        try:
+            json_obj = get_whoami(key=netsuite_key, un=username, pw=password, company=my_company)
+        except (IOError, httplib.HTTPException, zlib.error), err:
+            # network errors, HTTP errors, broken or undecodable responses and the open circuit breaker fail fast here
+            flash('There seems to be a problem with the OpenAir or Netsuite Server:' + str(err))
+            return render_template('login.html', form=form)
         # flash("json_obj : {}".format(json_obj['response']['Read']['Project']))
 
         auth = False
@@ -180,468 +192,88 @@ def login():
 
 # [END login submitted]
 
+
+def build_dicts():
+    """ Query the database and build users_dict, projects_dict, bookings_dict and rates_dict for the logged in user """
+    # ids of the active projects visible to this user, computed once and shared by the queries below
+    project_ids = Project.get_my_project_ids(session['username'])
+
+    # rows are read through lightweight tuples rather than ORM objects and the aggregation consumes them one at a time,
+    # the larger results are streamed from server side cursors so the full result list is never held in memory.
+    # The queries only run as their rows are asked for, and a streamed one has to be read to the end before the next
+    # starts: build_rollup_aggregates() consumes each of the iterables below in turn, never two at once, see
+    # Base.fetch_rows()
+    # get active projects
+    projects_rows = Project.get_my_project_rows(session['username'], project_ids) # TODO: evaluate for sql injection via session
+
+    # users name and rate
+    users_rows = User.get_user_rows()
+
+    # timesheet hours and fees summed per project, task and user by the database
+    task_rollups = Task.get_my_task_rollups(session['username'], project_ids, stream=True)
+
+    # ticket expenses summed per project and user
+    ticket_rollups = Ticket.get_my_ticket_rollups(session['username'], project_ids, stream=True)
+
+    # approved booking hours summed per project, task and user
+    booking_rollups = Booking.get_my_booking_rollups(session['username'], project_ids, stream=True)
+
+    # Rates list is needed
+    rates_rows = Rate.get_all_rate_rows()
+
+    # each phase is recorded for the page polling prepare_progress()
+    progress = partial(aggregate_cache.report, session['username'])
+
+    aggregates = build_rollup_aggregates(session['username'], projects_rows, users_rows, task_rollups, ticket_rollups,
+                                         booking_rollups, rates_rows, progress=progress)
+
+    # the flat rows printed by index.html and richproject.html are computed once here rather than on every render
+    views = build_views(session['username'], *aggregates)
+    progress('views', len(views['project_rows']))
+    return aggregates + (views,)
+
+
 # create a route to be called by jQuery to process data
 # [START prepare_data]
 @mod_tempus_fugit.route('/prepare_data')
 @login_required
 def prepare_data():
-
-    users_dict, projects_dict, bookings_dict, rates_dict = get_unexpired_dicts()
-
-    if users_dict is None or projects_dict is None or bookings_dict is None or rates_dict is None:
-            # Re-initialize
-            users_dict = {}
-            projects_dict = {}
-            bookings_dict = {}
-            rates_dict = {}
-
-            # project_dates will store dates related to projects, earliest used to estimate start date for projects with Null start date
-            projects_dates = {}
-
-            # get active projects
-            projects_list = Project.get_my_projects(session['username']) # TODO: evaluate for sql injection via session
-            projects_list = [project.to_dict() for project in projects_list]
-
-            # make API call to retrieve users name and rate
-            users_list = User.query.all()
-            users_list = [user.to_dict() for user in users_list]
-
-            # make API call to retrieve timesheet entries
-            tasks_list = Task.get_my_tasks(session['username'])
-            tasks_list = [task.to_dict() for task in tasks_list]
-
-            # API call to retrieve Tickets info form Netsuite Openair
-            tickets_list = Ticket.get_my_tickets(session['username'])
-            tickets_list = [ticket.to_dict() for ticket in tickets_list]
-
-            # Booking information is needed, pull only approved bookings
-            bookings_list = Booking.get_my_bookings(session['username'])
-            bookings_list = [booking.to_dict() for booking in bookings_list]
-
-            # Rates list is needed
-            rates_list = Rate.get_all_rates()
-            rates_list = [rate.to_dict() for rate in rates_list]
-
-            users_name = session['username'].strip()
-            # ensure that the user_dict is tagged with this user's name
-
-            if users_name not in users_dict.iterkeys():
-                users_dict[users_name] = {}
-
-            # ensure that the projects_dict is tagged with this user's name
-            if users_name not in projects_dict.iterkeys():
-                projects_dict[users_name] = {}
-
-            # ensure that the bookings_dict is tagged with this user's name
-            if users_name not in bookings_dict.iterkeys():
-                bookings_dict[users_name] = {}
-
-            # loop through the rates json
-            for rate in rates_list:
-                if session['username'] not in rates_dict.keys():
-                    rates_dict[session['username']] = {}
-
-                rates_dict[session['username']][rate['user_id'], rate['project_id']] = {
-                    'rate': rate['rate'],
-                    'currency': rate['currency']
-                }
-
-            # loop through the users_json
-            for a_user in users_list:
-
-                # extract the user_id
-                user_id = a_user['id']
-
-                try:
-                    # populate with a user_id
-                    users_dict[users_name][user_id]['name'] = a_user['name']
-                    users_dict[users_name][user_id]['nickname'] = a_user['nickname']
-                    users_dict[users_name][user_id]['timezone'] = a_user['timezone']
-                    users_dict[users_name][user_id]['line_manager_id'] = a_user['line_manager_id']
-                    users_dict[users_name][user_id]['department_id'] = a_user['department_id']
-                    users_dict[users_name][user_id]['active'] = a_user['active']
-                    # print 'user_dict try'
-
-                except KeyError, err:
-                    users_dict[users_name][user_id] = {
-                        'name': a_user['name'],
-                        'nick_name': a_user['nickname'],
-                        'time_zone': a_user['timezone'],
-                        'line_manager_id': a_user['line_manager_id'],
-                        'department_id': a_user['department_id'],
-                        'active': a_user['active']
-                    }
-                    # flash("users_dict[users_name] keyerror: %s %s" % (err, user_id))
-                    # non-existent user
-                    # print 'user_dict exception part'
-                except Exception, err:
-                    flash('Detected error {} with users_json_obj'.format(err))
-
-            # flash('users_dict[users_name]: %s' % users_dict[users_name])
-            # loop through the projects_json
-            for project in projects_list:
-                pid = project['id']
-                if (pid==425L):
-                    pass
-                calc_start_date = project['start_date']
-                calc_end_date = project['finish_date']
-
-                if calc_start_date is not None:
-                    my_start_date = calc_start_date
-                    if len(calc_start_date) > 10:
-                        my_start_date = calc_start_date.split(' ')[0]
-                    my_day, my_mnth, my_yr = my_start_date.split('/')
-                    start_date_str = '{2}/{1:0>2}/{0:0>2}'.format(my_yr, my_mnth, my_day)
-                else:
-                    my_start_date = 'None'
-                    start_date_str = 'None'
-
-                if calc_end_date is not None:
-                    my_end_date = calc_end_date
-                    if len(calc_end_date) > 10:
-                        my_end_date = calc_end_date.split(' ')[0]
-                    my_day, my_mnth, my_yr = my_end_date.split('/')
-                    end_date_str = '{2}/{1:0>2}/{0:0>2}'.format(my_yr, my_mnth, my_day)  # changed from '{2}/{1}/{0}
-                else:
-                    my_end_date = 'None'
-                    end_date_str = 'None'
-                project_days = date_percent_difference(start_date_str, end_date_str)
-
-                try:
-                    projects_dict[users_name][pid]['name'] = project['name']
-                    projects_dict[users_name][pid]['budget'] = float(
-                        project['budget'])  # 'budget' : '{:,.2f}'.format(float(project['budget']))
-                    projects_dict[users_name][pid]['budget_time'] = float(project['budget_time']) if project[
-                                                                                                         'budget_time'] is not None else 0.00
-                    projects_dict[users_name][pid]['owner_id'] = project['owner_id']
-                    projects_dict[users_name][pid]['currency'] = project['currency']
-                    projects_dict[users_name][pid]['start_date'] = calc_start_date
-                    projects_dict[users_name][pid]['finish_date'] = calc_end_date
-                    projects_dict[users_name][pid]['project_stage_id'] = project['project_stage_id']
-                    projects_dict[users_name][pid]['updated'] = project['updated']
-                    projects_dict[users_name][pid]['percent_complete_days'] = project_days['percent_days']
-                    projects_dict[users_name][pid]['days_consumed'] = project_days['days_consumed']
-                    projects_dict[users_name][pid]['days_remaining'] = project_days['days_remaining']
-                    projects_dict[users_name][pid]['days_diff'] = project_days['days_diff']
-                    projects_dict[users_name][pid]['tasks'] = {}
-                    projects_dict[users_name][pid]['users'] = {}
-                    projects_dict[users_name][pid]['fees_worked'] = 0.0
-
-                except KeyError:
-                    projects_dict[users_name][pid] = {
-                        'name': project['name'],
-                        'budget': float(project['budget']),
-                        'budget_time': float(project['budget_time']) if project['budget_time'] is not None else 0.00,
-                        'owner_id': project['user_id'],
-                        'currency': project['currency'],
-                        'start_date': calc_start_date,
-                        'finish_date': calc_end_date,
-                        'project_stage_id': project['project_stage_id'],
-                        'updated': project['updated'],
-                        'percent_complete_days': project_days['percent_days'],
-                        'days_consumed': project_days['days_consumed'],
-                        'days_remaining': project_days['days_remaining'],
-                        'days_diff': project_days['days_diff'],
-                        'fees_worked': 0.0,
-                        'tasks': {},
-                        'users': {}
-                    }
-                    # print 'projects_dict except part'
-
-                # maintain sets of start and end dates
-                try:
-                    projects_dates[pid]['start_dates'].add(calc_start_date)
-                    projects_dates[pid]['end_dates'].add(calc_end_date)
-                except KeyError:
-                    projects_dates[pid] = {'start_dates': set([calc_start_date, ]), 'end_dates': set([calc_end_date, ])}
-
-            for tasks in tasks_list:
-                project_id = tasks['project_id']
-                project_name = tasks['project_name']
-                task_id = tasks['project_task_id']
-                task_name = tasks['project_task_name']
-                user_id = tasks['user_id']
-                task_hours = float(tasks['hour']) if tasks['hour'] is not None else 0.00
-
-                # extract the rate for the user
-                try:
-                    user_rate = float(rates_dict[session['username']][user_id, project_id]['rate']) if rates_dict[session['username']][user_id, project_id]['rate'] else 0.00
-                except KeyError:
-                    user_rate = 0.00
-
-                # compute total hours worked per project
-                fees_worked = task_hours / 8.00 * user_rate
-                if project_id not in projects_dict[users_name].keys():
-                    # track fees_worked, users and hours_worked in projects_dict
-                    projects_dict[users_name][project_id] = {
-                        'name': project_name,
-                        'fees_worked': fees_worked,
-                        'hours_worked': task_hours,
-                        'users': {
-                            user_id: {
-                                task_id: {
-                                    'name': task_name,
-                                    'total_hours': task_hours,
-                                    'total_fees': fees_worked
-                                }
-                            }
-                        }
-                    }
-                else:
-                    # update fees_worked and 'hours_worked
-                    try:
-                        projects_dict[users_name][project_id]['fees_worked'] += fees_worked
-                    except KeyError:
-                        projects_dict[users_name][project_id]['fees_worked'] = fees_worked
-                try:
-                    projects_dict[users_name][project_id]['users'][user_id][task_id]['total_hours'] += task_hours
-                    projects_dict[users_name][project_id]['users'][user_id][task_id]['total_fees'] += fees_worked
-                except KeyError:
-                    try:
-                        projects_dict[users_name][project_id]['users'][user_id][task_id]['total_hours'] = task_hours
-                        projects_dict[users_name][project_id]['users'][user_id][task_id]['total_fees'] = fees_worked
-                    except KeyError:
-                        try:
-                            projects_dict[users_name][project_id]['users'][user_id][task_id] = {
-                                'total_hours': task_hours,
-                                'total_fees': fees_worked
-                            }
-                        except KeyError:
-                            try:
-                                projects_dict[users_name][project_id]['users'][user_id] = {
-                                    task_id: {
-                                        'total_hours': task_hours,
-                                        'total_fees': fees_worked
-                                    }
-                                }
-                            except KeyError:
-                                try:
-                                    projects_dict[users_name][project_id]['users'] = {
-                                        user_id: {task_id: {
-                                            'total_hours': task_hours,
-                                            'total_fees': fees_worked
-                                        }
-                                        }
-                                    }
-                                except KeyError:
-                                    flash(
-                                        "Strange error for projects_dict[users_name][project_id]['users'] = {user_id: {task_id: "
-                                        "{'total_hours': task_hours, 'total_fees': task_hours * user_rate}}}")
-                except Exception, err:
-                    flash("projects_dict[pid] errors: {}".format(err))
-
-                # compute total hours used per project by each user and save in projects_dict[users_name][project_id]['users'][user_id]['total_hrs_used']
-                try:
-                    projects_dict[users_name][project_id]['users'][user_id]['total_hrs_used'] += task_hours
-                    # flash("projects_dict[users_name][project_id]['users'][user_id]['total_hrs_used']+ ok ")
-                except KeyError:
-                    try:
-                        projects_dict[users_name][project_id]['users'][user_id]['total_hrs_used'] = task_hours
-                        # flash("projects_dict[users_name][project_id]['users'][user_id]['total_hrs_used']= ok ")
-                    except KeyError:
-                        try:
-                            projects_dict[users_name][project_id]['users'][user_id] = {
-                                'total_hrs_used': task_hours
-                            }
-                            # flash("projects_dict[users_name][project_id]['users'][user_id] = {'total_hrs_used' : task_hours } ok ")
-                        except KeyError:
-                            projects_dict[users_name][project_id]['users'] = {
-                                user_id: {
-                                    'total_hrs_used': task_hours
-                                }
-                            }
-                            flash("Strange error with projects_dict")
-
-                # ensure dictionary values exist before trying to access them
-                if 'tasks' not in projects_dict[users_name][project_id].keys():
-                    projects_dict[users_name][project_id]['tasks'] = {}
-
-                if task_id not in projects_dict[users_name][project_id]['tasks'].keys():
-                    projects_dict[users_name][project_id]['tasks'][task_id] = {'name': task_name}
-
-                try:
-                    # evaluate need for computation of tasks in projects_dict if succinct_projects_task already has this info
-                    projects_dict[users_name][project_id]['tasks'][task_id]['total_hours'] += task_hours
-                except KeyError, err:
-                    projects_dict[users_name][project_id]['tasks'][task_id]['total_hours'] = task_hours
-
-                # track total hours worked per user per project
-                try:
-                    projects_dict[users_name][project_id]['users'][user_id]['total_hours'] += task_hours
-                except KeyError:
-                    try:
-                        projects_dict[users_name][project_id]['users'][user_id]['total_hours'] = task_hours
-                    except KeyError:
-                        try:
-                            projects_dict[users_name][project_id]['users'][user_id] = {'total_hours': task_hours}
-                        except KeyError, err:
-                            try:
-                                projects_dict[users_name][project_id]['users'] = {user_id: {'total_hours': task_hours}}
-                            except KeyError:
-                                flash(
-                                    "projects_dict[users_name][project_id]['users']= {user_id : {'total_hours': task_hours}} failed")
-
-            # loop through the tickets and compute the additional expense
-            for ticket in tickets_list:
-                total = float(ticket['total']) if ticket['total'] is not None else 0.00
-                project_id = ticket['project_id']
-                project_name = ticket['project_name']
-                user_id = ticket['user_id']
-
-                if project_id not in projects_dict[users_name].keys():
-                    # track fees_worked, users and hours_worked in projects_dict
-                    projects_dict[users_name][project_id] = {
-                        'name': project_name,
-                        'fees_worked': 0.00,
-                        'hours_worked': 0.00,
-                        'users': {
-                            user_id: {
-                                'expenses': total
-                            }
-                        }
-                    }
-                else:
-                    # track expenses per project/ per user
-                    try:
-                        projects_dict[users_name][project_id]['users'][user_id]['expenses'] += total
-                    except KeyError:
-                        try:
-                            projects_dict[users_name][project_id]['users'][user_id]['expenses'] = total
-                        except KeyError:
-                            try:
-                                projects_dict[users_name][project_id]['users'][user_id] = {'expenses': total}
-                            except KeyError:
-                                try:
-                                    projects_dict[users_name][project_id]['users'].append({user_id:{'expenses': total}})
-                                except KeyError:
-                                    try:
-                                        projects_dict[users_name][project_id] = {'name': project_name, 'users': [{user_id: {'expenses' : total}}]}
-                                    except KeyError:
-                                        flash(
-                                            "Unexpected projects_dict[users_name][project_id]['users'][user_id] = {'expenses' : total} fail")
-
-                    try:
-                        projects_dict[users_name][project_id]['fees_worked'] += total
-                    except KeyError:
-                        projects_dict[users_name][project_id]['fees_worked'] = total
-
-            for booking in bookings_list:
-                """ restructure bookings into
-                    {project_id:{'tot_booked_hrs' : XY + 'hours',
-                            task_id : {
-                                user_id1 : {
-                                    'hours' : 40,
-                                    'percentage' : 45%,
-                                    'start_date' : date1,
-                                    'end_date'   : date2
-                                },
-                                user_id2 : {
-                                    'hours' : 30,
-                                    'percentage' : 35%,
-                                    'start_date' : date1,
-                                    'end_date'   : date2
-                                }
-                            },
-                            'users_proj_hours' : {
-                                        19: XY# total_hours_booked,
-                                        23: YZ
-                                      }
-                        }
-                    }
-                """
-                project_id = booking['project_id']
-                task_id = booking['project_task_id']
-                user_id = booking['user_id']
-                hours_booked = float(booking['hours']) if booking['hours'] is not None else 0.0
-                hours_percent = float(booking['percentage']) if booking['percentage'] is not None else 0.0
-
-                # try the bookings_dict
-                # try the bookings_dict
-                """
-                if users_name not in bookings_dict.iterkeys():
-                    # initialize the bookings_dict
-                    bookings_dict[users_name] = {project_id:
-                            {
-
-                            'tot_booked_hrs': 0.0,
-                            'users_proj_hours': {user_id: 0.0},
-                            task_id: {
-                                    'total_task_hrs': hours_booked,
-                                    user_id: {
-                                        'hours': hours_booked,
-                                        'percentage': hours_percent
-                                    }
-                                }
-                            }
-                    }
-                    """
-                if project_id not in bookings_dict[users_name].iterkeys():
-                    # initialize the bookings_dict
-                    bookings_dict[users_name][project_id] = {
-                        'tot_booked_hrs': 0.0,
-                        'users_proj_hours': {user_id: 0.0},
-                        task_id: {
-                            'total_task_hrs': hours_booked,
-                            user_id: {
-                                'hours': hours_booked,
-                                'percentage': hours_percent
-                            }
-                        }
-                    }
-
-                try:
-                    bookings_dict[users_name][project_id]['tot_booked_hrs'] += hours_booked
-                except KeyError:
-                    try:
-                        bookings_dict[users_name][project_id]['tot_booked_hrs'] = hours_booked
-                    except KeyError:
-                        bookings_dict[users_name][project_id] = {'tot_booked_hrs': hours_booked}
-                # compute total project hours for a user (from all tasks booked)
-                try:
-                    bookings_dict[users_name][project_id]['users_proj_hours'][user_id] += hours_booked
-                except KeyError:
-                    try:
-                        bookings_dict[users_name][project_id]['users_proj_hours'][user_id] = hours_booked
-                    except KeyError:
-                        try:
-                            bookings_dict[users_name][project_id]['users_proj_hours'] = {user_id: hours_booked}
-                        except Exception, err:
-                            flash("Error :{} from bookings_dict".format(err))
-
-                try:
-                    bookings_dict[users_name][project_id][task_id]['total_task_hrs'] += hours_booked
-                except KeyError:
-                    try:
-                        bookings_dict[users_name][project_id][task_id]['total_task_hrs'] = hours_booked
-                    except KeyError:
-                        bookings_dict[users_name][project_id][task_id] = {'total_task_hrs': hours_booked}
-
-                try:
-                    bookings_dict[users_name][project_id][task_id][user_id] = {
-                        'hours': hours_booked,
-                        'percentage': booking['percentage']
-                    }
-                except KeyError:
-                    try:
-                        bookings_dict[users_name][project_id][task_id] = {user_id: {
-                            'hours': hours_booked,
-                            'percentage': booking['percentage']
-                        }
-                        }
-                    except KeyError, err:
-                        flash("Issues with bookings dict: {}".format(err))
-
-            timeout = 60 * 60 * 4 # 4 hours
-            cache.set('users_dict', users_dict, timeout=timeout)
-            cache.set('projects_dict', projects_dict, timeout=timeout)
-            cache.set('bookings_dict', bookings_dict, timeout=timeout)
-            cache.set('rates_dict', rates_dict, timeout=timeout)
-
-    return render_template(url_for('mod_tempus_fugit.index'),
-                           users_dict=users_dict,
-                           projects_dict=projects_dict,
-                           bookings_dict=bookings_dict,
-                           rates_dict=rates_dict)
+    """
+    Build the associate's aggregates and answer 200 with the rendered project rows. The build runs in this request,
+    and is bound by its deadline; a request finding the build of another one running waits up to ?wait= seconds for
+    it and answers 202 if it is still running, the page then calls again. ?refresh=1 rebuilds stale aggregates.
+    """
+    wait = min(max(request.args.get('wait', 0, type=float), 0), PREPARE_DATA_MAX_WAIT)
+
+    # concurrent requests for the same associate share one build instead of each running the full pipeline
+    entry, status = aggregate_cache.start_build(session['username'], build_dicts, wait=wait,
+                                                refresh=request.args.get('refresh', 0, type=int) == 1)
+    logging.info('prepare_data: aggregates %s for %s', status, session['username'])
+
+    if entry is None:
+        response = jsonify(status=status)
+        response.status_code = 202
+        return response
+
+    views = aggregate_cache.unpack_views(entry)
+    return jsonify(status=status, built_at=entry['built_at'],
+                   rows=render_template('project_rows.html', project_rows=views['project_rows']))
+
+
+# [START prepare_progress]
+@mod_tempus_fugit.route('/prepare_data/progress')
+@login_required
+def prepare_progress():
+    """
+    Answer the progress of the associate's last build, read from the cache as prepare_data's build records it: its
+    status, 'building', 'done' or 'failed', and the phases finished so far, or status 'idle' if there is none. The
+    page polls it while prepare_data is building.
+    """
+    progress = aggregate_cache.get_progress(session['username'])
+    if progress is None:
+        return jsonify(status='idle', phases=[])
+    return jsonify(status=progress['status'], phases=progress['phases'])
+# [END prepare_progress]
 
 
 # [START project_detail]
@@ -663,8 +295,11 @@ def project_detail(project_id):
         project_id = project_id.strip()  # remove any trailing spaces
         pid = long(project_id)
 
-        return render_template('richproject.html', project_id=pid, users_dict=g.users_dict, projects_dict=g.projects_dict,
-                               bookings_dict=g.bookings_dict, rates_dict=g.rates_dict)
+        project = g.views['projects'].get(pid) if g.views else None
+        if project is None:
+            abort(404)
+
+        return render_template('richproject.html', project=project)
 
     return redirect(url_for('mod_tempus_fugit.index'))
 # [END project_detail]
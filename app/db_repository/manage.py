@@ -0,0 +1,9 @@
+#!/usr/bin/env python
+# sqlalchemy-migrate entry point, needs `pip install sqlalchemy-migrate==0.10.0` (not in requirements.txt, which is
+# vendored into lib/ and deployed), e.g.
+#   python app/db_repository/manage.py version_control mysql://user:pw@host/db app/db_repository
+#   python app/db_repository/manage.py upgrade mysql://user:pw@host/db app/db_repository
+from migrate.versioning.shell import main
+
+if __name__ == '__main__':
+    main(debug='False')
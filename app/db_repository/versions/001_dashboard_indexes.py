@@ -0,0 +1,51 @@
+# indexes used by the dashboard queries, kept in step with the index=True columns and Index objects in app/models
+# tables missing from the database being upgraded are skipped, so run the upgrade against both the main database and
+# the 'dailies' bind. Indexes already in the database, e.g. created by db.create_all() from the models, are left as
+# they are, as are missing ones on downgrade
+from sqlalchemy import Index, MetaData, Table, inspect
+
+# (index name, table name, column names)
+INDEXES = (
+    ('ix_user_email', 'user', ('email',)),
+    ('ix_project_user_id', 'project', ('user_id',)),
+    ('ix_project_task_project_id', 'project_task', ('project_id',)),
+    ('ix_project_task_assign_project_task_id', 'project_task_assign', ('project_task_id',)),
+    ('ix_project_task_assign_user_id', 'project_task_assign', ('user_id',)),
+    ('ix_booking_project_id', 'booking', ('project_id',)),
+    ('ix_booking_user_id', 'booking', ('user_id',)),
+    ('ix_task_project_task_id', 'task', ('project_task_id',)),
+    ('ix_task_user_id', 'task', ('user_id',)),
+    ('ix_envelope_project_id', 'envelope', ('project_id',)),
+    ('ix_ticket_envelope_id', 'ticket', ('envelope_id',)),
+    ('ix_ticket_user_id', 'ticket', ('user_id',)),
+    ('ix_up_rate_user_id_project_id_rate', 'up_rate', ('user_id', 'project_id', 'rate')),
+    ('ix_timesheets_vs_bookings_daily_project_task_associate', 'timesheets_vs_bookings_daily',
+     ('project_name', 'task_name', 'associate')),
+)
+
+
+def _indexes(migrate_engine, exist):
+    """
+    Yield an Index object for every entry of INDEXES whose table exists in the database and which is, if exist, or is
+    not, if not exist, already in the database
+    """
+    meta = MetaData(bind=migrate_engine)
+    inspector = inspect(migrate_engine)
+    for name, table_name, column_names in INDEXES:
+        if not migrate_engine.has_table(table_name):
+            continue
+        existing = set(index['name'] for index in inspector.get_indexes(table_name))
+        if (name in existing) != exist:
+            continue
+        table = Table(table_name, meta, autoload=True)
+        yield Index(name, *[table.c[column_name] for column_name in column_names])
+
+
+def upgrade(migrate_engine):
+    for index in _indexes(migrate_engine, exist=False):
+        index.create(migrate_engine)
+
+
+def downgrade(migrate_engine):
+    for index in _indexes(migrate_engine, exist=True):
+        index.drop(migrate_engine)
@@ -15,12 +15,16 @@
 # [START app]
 
 # [START imports]
+import logging
 from os import urandom
 
-from flask import Flask, render_template, session, Response
+from flask import Flask, jsonify, render_template, session, Response
 from flask_login import LoginManager
 
+from app.controllers.api import mod_api
 from app.controllers.tempus_fugit import mod_tempus_fugit
+from app.oaxmlapi import client, resilience, transport
+from app.templating import BytecodeCache, precompile_templates
 from datetime import timedelta
 # [END imports]
 from app.models import db
@@ -45,6 +49,29 @@ MAXAMOUNT = 1048576
 # maximal line length when calling readline().
 _MAXLINE = 65536
 
+# route all OpenAir API calls through one keep-alive connection pool
+transport.configure(url=app.config['OPENAIR_API_URL'],
+                    max_size=app.config['OPENAIR_POOL_SIZE'],
+                    idle_timeout=app.config['OPENAIR_POOL_IDLE_TIMEOUT'],
+                    connect_timeout=app.config['OPENAIR_CONNECT_TIMEOUT'])
+
+# capture the OpenAir traffic for offline replay by oaxmlapi.standin
+if app.config['OPENAIR_RECORD_PATH']:
+    transport.record(app.config['OPENAIR_RECORD_PATH'])
+
+# retry read only calls and fail fast while openair.com is erroring
+resilience.configure(retry_count=app.config['OPENAIR_RETRIES'],
+                     retry_budget=app.config['OPENAIR_RETRY_BUDGET'],
+                     error_rate=app.config['OPENAIR_BREAKER_ERROR_RATE'],
+                     reset_timeout=app.config['OPENAIR_BREAKER_RESET_TIMEOUT'])
+
+# concurrent clients issue up to OPENAIR_MAX_IN_FLIGHT requests at once, rate limited per company
+client.configure(in_flight=app.config['OPENAIR_MAX_IN_FLIGHT'], rate=app.config['OPENAIR_RATE_LIMIT'])
+
+# load compiled templates from the bytecode cache instead of compiling them on the first request of each instance
+if app.config['JINJA_BYTECODE_CACHE_DIR']:
+    app.jinja_env.bytecode_cache = BytecodeCache(app.config['JINJA_BYTECODE_CACHE_DIR'])
+
 # setting up flask-login
 login_manager = LoginManager()
 login_manager.session_protection = 'strong'
@@ -60,4 +87,19 @@ if not secret_key:
 db.init_app(app)
 
 # Register Blueprints
-app.register_blueprint(mod_tempus_fugit)
\ No newline at end of file
+app.register_blueprint(mod_tempus_fugit)
+app.register_blueprint(mod_api)
+
+
+# internal status of the OpenAir circuit breaker and connection pool, restricted to admins in app.yaml
+@app.route('/_status/openair')
+def openair_status():
+    return jsonify(resilience.status())
+
+
+# App Engine warmup request, compiles the templates before the instance serves users (inbound_services in app.yaml)
+@app.route('/_ah/warmup')
+def warmup():
+    templates, seconds = precompile_templates(app.jinja_env)
+    logging.info('warmup: %d templates compiled in %.3fs', len(templates), seconds)
+    return ''
@@ -1,6 +1,7 @@
 from sqlalchemy import text
 
-from app.models import db, Base
+from app.models import db, Base, bind_id_list
+from app.models.Project import Project
 
 
 class Booking(Base):
@@ -9,8 +10,8 @@ class Booking(Base):
 
     id = db.Column(db.Integer(), primary_key=True)
     owner_id = db.Column(db.Integer())
-    user_id = db.Column(db.Integer())
-    project_id = db.Column(db.Integer())
+    user_id = db.Column(db.Integer(), index=True)
+    project_id = db.Column(db.Integer(), index=True)
     project_name = db.Column(db.String(200))
     startdate = db.Column(db.Date())
     enddate = db.Column(db.Date())
@@ -22,8 +23,18 @@ class Booking(Base):
     approval_status = db.Column(db.String(1))
 
     @staticmethod
-    def get_my_bookings(user_email):
-        query = '''SELECT DISTINCT
+    def _my_bookings_union(user_email, project_ids):
+        """
+        Approved booking rows of user_email or on one of project_ids, as a UNION of two indexed lookups
+        (user.email -> booking.user_id and booking.project_id)
+        :return: tuple (sql, params), sql has no trailing semicolon so it can be used as a derived table
+        """
+        if project_ids is None:
+            project_ids = Project.get_my_project_ids(user_email)
+        in_project_ids, params = bind_id_list('pid', project_ids)
+        params['email'] = user_email
+
+        select = '''SELECT
                       b.id,
                       b.owner_id,
                       b.user_id,
@@ -39,18 +50,47 @@ class Booking(Base):
                       b.approval_status
                     FROM booking b
                     INNER JOIN project_task pt ON b.project_task_id = pt.id
-                    INNER JOIN project p ON b.project_id = p.id
-                    LEFT JOIN user u ON b.user_id = u.id
-                    WHERE
-                    b.approval_status = "A" AND
-                    (u.email = :email OR
-                    p.id IN (SELECT DISTINCT p2.id FROM project p2
-                         LEFT JOIN project_task pt2 ON pt2.project_id = p2.id
-                         LEFT JOIN project_task_assign pta ON pta.project_task_id = pt2.id
-                         LEFT JOIN booking b ON b.project_id = p2.id
-                         LEFT JOIN user u ON (p2.user_id = u.id OR pta.user_id = u.id OR b.user_id = u.id)
-                         WHERE u.email = :email AND p2.active="1"));'''
-        return Booking.query.from_statement(text(query)).params(email=user_email).all()
+                    INNER JOIN project p ON b.project_id = p.id'''
+        query = '''{select}
+                    INNER JOIN user u ON b.user_id = u.id
+                    WHERE b.approval_status = "A" AND u.email = :email
+                   UNION
+                   {select}
+                    WHERE b.approval_status = "A" AND b.project_id IN {project_ids}'''.format(select=select,
+                                                                                            project_ids=in_project_ids)
+        return query, params
+
+    @staticmethod
+    def get_my_bookings(user_email, project_ids=None):
+        query, params = Booking._my_bookings_union(user_email, project_ids)
+        return Booking.query.from_statement(text(query)).params(**params).all()
+
+    @staticmethod
+    def get_my_booking_rows(user_email, project_ids=None, stream=False):
+        """
+        Same as get_my_bookings() but yields lightweight rows, see Base.fetch_rows(). With stream=True the rows come from a
+        server side cursor as they are consumed.
+        """
+        query, params = Booking._my_bookings_union(user_email, project_ids)
+        return Booking.fetch_rows(query, params, stream=stream)
+
+    @staticmethod
+    def get_my_booking_rollups(user_email, project_ids=None, stream=False):
+        """
+        Approved booking hours summed per project, task and user.
+        Rows have the keys project_id, project_task_id, user_id, hours and percentage.
+        """
+        bookings_query, params = Booking._my_bookings_union(user_email, project_ids)
+
+        query = '''SELECT
+                      b.project_id,
+                      b.project_task_id,
+                      b.user_id,
+                      SUM(IFNULL(b.hours, 0)) AS hours,
+                      MAX(b.percentage) AS percentage
+                    FROM ({bookings_query}) b
+                    GROUP BY b.project_id, b.project_task_id, b.user_id;'''.format(bookings_query=bookings_query)
+        return Booking.fetch_rows(query, params, stream=stream)
 
     def __repr__(self):
         return '<Booking %r>' % self.id
@@ -8,6 +8,9 @@ class Daily(Base):
     # Multiple binds: http://flask-sqlalchemy.pocoo.org/2.1/binds/
     __bind_key__ = 'dailies'
     __tablename__ = 'timesheets_vs_bookings_daily'
+    __table_args__ = (
+        db.Index('ix_timesheets_vs_bookings_daily_project_task_associate', 'project_name', 'task_name', 'associate'),
+    )
 
     id = db.Column(db.Integer(), primary_key=True)
     timesheets_id = db.Column(db.Integer())
@@ -0,0 +1,12 @@
+from app.models import db, Base
+
+
+class Envelope(Base):
+
+    __tablename__ = 'envelope'
+
+    id = db.Column(db.Integer(), primary_key=True)
+    project_id = db.Column(db.Integer(), index=True)
+
+    def __repr__(self):
+        return '<Envelope %r>' % self.id
@@ -1,4 +1,4 @@
-from app.models import db, Base
+from app.models import db, Base, bind_id_list
 from sqlalchemy import text
 
 
@@ -11,7 +11,7 @@ class Project(Base):
     active = db.Column(db.String(1))
     budget = db.Column(db.Float(scale=16, precision=2))
     budget_time = db.Column(db.Float(scale=12, precision=2))
-    user_id = db.Column(db.Integer())
+    user_id = db.Column(db.Integer(), index=True)
     currency = db.Column(db.String(3))
     start_date = db.Column(db.Date())
     finish_date = db.Column(db.Date())
@@ -19,16 +19,55 @@ class Project(Base):
     updated = db.Column(db.DateTime())
 
     @staticmethod
-    def get_my_projects(user_email):
+    def get_my_project_ids(user_email):
+        """
+        Ids of the active projects visible to user_email: projects the user owns, has a task assignment on or is
+        booked on. Computed once per dashboard build and passed to the other get_my_* queries.
+
+        Each branch of the UNION is a lookup on an indexed column declared by the models:
+            user.email                          (User.email)
+            project.user_id                     (Project.user_id)
+            project_task_assign.user_id         (ProjectTaskAssign.user_id)
+            project_task.id                     (primary key)
+            booking.user_id                     (Booking.user_id)
+            project.id                          (primary key)
+        """
+        query = '''SELECT p.id FROM project p
+                    INNER JOIN user u ON p.user_id = u.id
+                    WHERE u.email = :email AND p.active="1"
+                   UNION
+                   SELECT pt.project_id FROM project_task_assign pta
+                    INNER JOIN user u ON pta.user_id = u.id
+                    INNER JOIN project_task pt ON pta.project_task_id = pt.id
+                    INNER JOIN project p ON pt.project_id = p.id
+                    WHERE u.email = :email AND p.active="1"
+                   UNION
+                   SELECT b.project_id FROM booking b
+                    INNER JOIN user u ON b.user_id = u.id
+                    INNER JOIN project p ON b.project_id = p.id
+                    WHERE u.email = :email AND p.active="1";'''
+        return [row[0] for row in db.session.execute(text(query), {'email': user_email})]
+
+    @staticmethod
+    def _my_projects_query(user_email, project_ids):
+        """
+        :return: tuple (sql, params) selecting the projects in project_ids, or visible to user_email if None, with
+        start and finish dates taken from their bookings
+        """
+        if project_ids is None:
+            project_ids = Project.get_my_project_ids(user_email)
+        in_project_ids, params = bind_id_list('pid', project_ids)
+
         query = '''SELECT t1.id, name, active, budget, budget_time, user_id, currency, start_date, finish_date, project_stage_id, updated FROM
                     (SELECT
                         p.id,
                         MIN(b.startdate) AS start_date,
                         MAX(b.enddate) AS finish_date
                     FROM project p LEFT JOIN booking b ON p.id=b.project_id
+                    WHERE p.id IN {project_ids}
                     GROUP BY p.id) t1
                     INNER JOIN
-                    (SELECT DISTINCT
+                    (SELECT
                                               p.id,
                                               p.name,
                                               p.active,
@@ -39,13 +78,20 @@ class Project(Base):
                                               p.project_stage_id,
                                               p.updated
                                             FROM project p
-                                            LEFT JOIN project_task pt ON pt.project_id = p.id
-                                            LEFT JOIN project_task_assign pta ON pta.project_task_id = pt.id
-                                            LEFT JOIN booking b ON b.project_id = p.id
-                                            LEFT JOIN user u ON (p.user_id = u.id OR pta.user_id = u.id OR b.user_id = u.id)
-                                            WHERE u.email = :email AND p.active="1") t2
-                    ON t1.id = t2.id;'''
-        return Project.query.from_statement(text(query)).params(email=user_email).all()
+                                            WHERE p.id IN {project_ids}) t2
+                    ON t1.id = t2.id;'''.format(project_ids=in_project_ids)
+        return query, params
+
+    @staticmethod
+    def get_my_projects(user_email, project_ids=None):
+        query, params = Project._my_projects_query(user_email, project_ids)
+        return Project.query.from_statement(text(query)).params(**params).all()
+
+    @staticmethod
+    def get_my_project_rows(user_email, project_ids=None):
+        """ Same as get_my_projects() but yields lightweight rows, see Base.fetch_rows() """
+        query, params = Project._my_projects_query(user_email, project_ids)
+        return Project.fetch_rows(query, params)
 
     def __repr__(self):
         return '<Project %r>' % self.id
@@ -0,0 +1,13 @@
+from app.models import db, Base
+
+
+class ProjectTask(Base):
+
+    __tablename__ = 'project_task'
+
+    id = db.Column(db.Integer(), primary_key=True)
+    project_id = db.Column(db.Integer(), index=True)
+    name = db.Column(db.String(200))
+
+    def __repr__(self):
+        return '<ProjectTask %r>' % self.id
@@ -0,0 +1,13 @@
+from app.models import db, Base
+
+
+class ProjectTaskAssign(Base):
+
+    __tablename__ = 'project_task_assign'
+
+    id = db.Column(db.Integer(), primary_key=True)
+    project_task_id = db.Column(db.Integer(), index=True)
+    user_id = db.Column(db.Integer(), index=True)
+
+    def __repr__(self):
+        return '<ProjectTaskAssign %r>' % self.id
@@ -6,6 +6,10 @@ from app.models import db, Base
 class Rate(Base):
 
     __tablename__ = 'up_rate'
+    # covers the per user, per project rate lookup of Task.get_my_task_rollups
+    __table_args__ = (
+        db.Index('ix_up_rate_user_id_project_id_rate', 'user_id', 'project_id', 'rate'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     project_id = db.Column(db.Integer)
@@ -16,7 +20,7 @@ class Rate(Base):
     currency = db.Column(db.String(3))
 
     @staticmethod
-    def get_all_rates():
+    def _all_rates_query():
         query = '''SELECT
                       ur.id,
                       ur.project_id,
@@ -29,7 +33,16 @@ class Rate(Base):
                     LEFT JOIN user u ON ur.user_id = u.id
                     LEFT JOIN project p ON ur.project_id = p.id
                     WHERE ur.user_id IS NOT NULL;'''
-        return Rate.query.from_statement(text(query)).all()
+        return query
+
+    @staticmethod
+    def get_all_rates():
+        return Rate.query.from_statement(text(Rate._all_rates_query())).all()
+
+    @staticmethod
+    def get_all_rate_rows():
+        """ Same as get_all_rates() but yields lightweight rows, see Base.fetch_rows() """
+        return Rate.fetch_rows(Rate._all_rates_query())
 
     def __repr__(self):
         return '<Rate %r>' % self.id
@@ -1,6 +1,7 @@
 from sqlalchemy import text
 
-from app.models import db, Base
+from app.models import db, Base, bind_id_list
+from app.models.Project import Project
 
 
 class Task(Base):
@@ -10,9 +11,9 @@ class Task(Base):
     id = db.Column(db.Integer(), primary_key=True)
     project_id = db.Column(db.Integer())
     project_name = db.Column(db.String(200))
-    project_task_id = db.Column(db.Integer())
+    project_task_id = db.Column(db.Integer(), index=True)
     project_task_name = db.Column(db.String(200))
-    user_id = db.Column(db.Integer())
+    user_id = db.Column(db.Integer(), index=True)
     date = db.Column(db.Date())
     updated = db.Column(db.DateTime(timezone=True))
     hour = db.Column(db.Float(scale=12, precision=2))
@@ -22,8 +23,18 @@ class Task(Base):
     decimal_hours = hour + minute/60.00
 
     @staticmethod
-    def get_my_tasks(user_email):
-        query = '''SELECT DISTINCT
+    def _my_tasks_union(user_email, project_ids):
+        """
+        Timesheet rows logged by user_email or on one of project_ids, as a UNION of two indexed lookups
+        (user.email -> task.user_id and project.id -> project_task.project_id -> task.project_task_id)
+        :return: tuple (sql, params), sql has no trailing semicolon so it can be used as a derived table
+        """
+        if project_ids is None:
+            project_ids = Project.get_my_project_ids(user_email)
+        in_project_ids, params = bind_id_list('pid', project_ids)
+        params['email'] = user_email
+
+        select = '''SELECT
                       t.id,
                       t.project_id,
                       p.name AS project_name,
@@ -38,17 +49,52 @@ class Task(Base):
                       t.cost_center_id
                     FROM task t
                     INNER JOIN project_task pt ON t.project_task_id = pt.id
-                    INNER JOIN project p ON pt.project_id = p.id
-                    LEFT JOIN user u ON t.user_id = u.id
-                    WHERE
-                    u.email = :email OR
-                    p.id IN (SELECT DISTINCT p2.id FROM project p2
-                         LEFT JOIN project_task pt2 ON pt2.project_id = p2.id
-                         LEFT JOIN project_task_assign pta ON pta.project_task_id = pt2.id
-                         LEFT JOIN booking b ON b.project_id = p2.id
-                         LEFT JOIN user u ON (p2.user_id = u.id OR pta.user_id = u.id OR b.user_id = u.id)
-                         WHERE u.email = :email AND p2.active="1");'''
-        return Task.query.from_statement(text(query)).params(email=user_email).all()
+                    INNER JOIN project p ON pt.project_id = p.id'''
+        query = '''{select}
+                    INNER JOIN user u ON t.user_id = u.id
+                    WHERE u.email = :email
+                   UNION
+                   {select}
+                    WHERE p.id IN {project_ids}'''.format(select=select, project_ids=in_project_ids)
+        return query, params
+
+    @staticmethod
+    def get_my_tasks(user_email, project_ids=None):
+        query, params = Task._my_tasks_union(user_email, project_ids)
+        return Task.query.from_statement(text(query)).params(**params).all()
+
+    @staticmethod
+    def get_my_task_rows(user_email, project_ids=None, stream=False):
+        """
+        Same as get_my_tasks() but yields lightweight rows, see Base.fetch_rows(). With stream=True the rows come from a
+        server side cursor as they are consumed.
+        """
+        query, params = Task._my_tasks_union(user_email, project_ids)
+        return Task.fetch_rows(query, params, stream=stream)
+
+    @staticmethod
+    def get_my_task_rollups(user_email, project_ids=None, stream=False):
+        """
+        Timesheet hours and fees summed per project, task and user, priced in SQL with the user's daily rate.
+        Rows have the keys project_id, project_name, project_task_id, project_task_name, user_id, hours and fees.
+        """
+        tasks_query, params = Task._my_tasks_union(user_email, project_ids)
+
+        query = '''SELECT
+                      t.project_id,
+                      t.project_name,
+                      t.project_task_id,
+                      t.project_task_name,
+                      t.user_id,
+                      SUM(IFNULL(t.hour, 0)) AS hours,
+                      SUM(IFNULL(t.hour, 0)) / 8.00 * IFNULL(MAX(ur.rate), 0) AS fees
+                    FROM ({tasks_query}) t
+                    LEFT JOIN (SELECT user_id, project_id, MAX(rate) AS rate FROM up_rate
+                               WHERE user_id IS NOT NULL
+                               GROUP BY user_id, project_id) ur ON ur.user_id = t.user_id AND ur.project_id = t.project_id
+                    GROUP BY t.project_id, t.project_name, t.project_task_id, t.project_task_name, t.user_id;'''.format(
+            tasks_query=tasks_query)
+        return Task.fetch_rows(query, params, stream=stream)
 
     def __repr__(self):
         return '<Task %r>' % self.id
@@ -1,6 +1,7 @@
 from sqlalchemy import text
 
-from app.models import db, Base
+from app.models import db, Base, bind_id_list
+from app.models.Project import Project
 
 
 class Ticket(Base):
@@ -15,9 +16,10 @@ class Ticket(Base):
     total = db.Column(db.Float(scale=17, precision=3))
     total_tax_paid = db.Column(db.Float(scale=16, precision=2))
     total_no_tax = total - total_tax_paid
+    envelope_id = db.Column(db.Integer(), index=True)
     project_task_id = db.Column(db.Integer())
     project_task_name = db.Column(db.String(200))
-    user_id = db.Column(db.Integer())
+    user_id = db.Column(db.Integer(), index=True)
     project_id = db.Column(db.Integer())
     project_name = db.Column(db.String(200))
     currency = db.Column(db.String(3))
@@ -26,8 +28,18 @@ class Ticket(Base):
     acct_date = db.Column(db.Date())
 
     @staticmethod
-    def get_my_tickets(user_email):
-        query = '''SELECT DISTINCT
+    def _my_tickets_union(user_email, project_ids):
+        """
+        Ticket rows of user_email or on one of project_ids, as a UNION of two indexed lookups
+        (user.email -> ticket.user_id and project.id -> envelope.project_id -> ticket.envelope_id)
+        :return: tuple (sql, params), sql has no trailing semicolon so it can be used as a derived table
+        """
+        if project_ids is None:
+            project_ids = Project.get_my_project_ids(user_email)
+        in_project_ids, params = bind_id_list('pid', project_ids)
+        params['email'] = user_email
+
+        select = '''SELECT
                       t.id,
                       t.date,
                       t.updated,
@@ -35,6 +47,7 @@ class Ticket(Base):
                       t.cost,
                       t.total,
                       t.total_tax_paid,
+                      t.envelope_id,
                       t.project_task_id,
                       pt.name AS project_task_name,
                       t.user_id,
@@ -47,17 +60,45 @@ class Ticket(Base):
                     FROM ticket t
                     INNER JOIN envelope e ON t.envelope_id = e.id
                     INNER JOIN project p ON e.project_id = p.id
-                    LEFT JOIN project_task pt ON t.project_task_id = t.id
-                    LEFT JOIN user u ON t.user_id=u.id
-                    WHERE
-                    u.email = :email OR
-                    p.id IN (SELECT DISTINCT p2.id FROM project p2
-                         LEFT JOIN project_task pt2 ON pt2.project_id = p2.id
-                         LEFT JOIN project_task_assign pta ON pta.project_task_id = pt2.id
-                         LEFT JOIN booking b ON b.project_id = p2.id
-                         LEFT JOIN user u ON (p2.user_id = u.id OR pta.user_id = u.id OR b.user_id = u.id)
-                         WHERE u.email = :email AND p2.active="1");'''
-        return Ticket.query.from_statement(text(query)).params(email=user_email).all()
+                    LEFT JOIN project_task pt ON t.project_task_id = pt.id'''
+        query = '''{select}
+                    INNER JOIN user u ON t.user_id = u.id
+                    WHERE u.email = :email
+                   UNION
+                   {select}
+                    WHERE p.id IN {project_ids}'''.format(select=select, project_ids=in_project_ids)
+        return query, params
+
+    @staticmethod
+    def get_my_tickets(user_email, project_ids=None):
+        query, params = Ticket._my_tickets_union(user_email, project_ids)
+        return Ticket.query.from_statement(text(query)).params(**params).all()
+
+    @staticmethod
+    def get_my_ticket_rows(user_email, project_ids=None, stream=False):
+        """
+        Same as get_my_tickets() but yields lightweight rows, see Base.fetch_rows(). With stream=True the rows come from a
+        server side cursor as they are consumed.
+        """
+        query, params = Ticket._my_tickets_union(user_email, project_ids)
+        return Ticket.fetch_rows(query, params, stream=stream)
+
+    @staticmethod
+    def get_my_ticket_rollups(user_email, project_ids=None, stream=False):
+        """
+        Ticket totals summed per project and user.
+        Rows have the keys project_id, project_name, user_id and total.
+        """
+        tickets_query, params = Ticket._my_tickets_union(user_email, project_ids)
+
+        query = '''SELECT
+                      t.project_id,
+                      t.project_name,
+                      t.user_id,
+                      SUM(IFNULL(t.total, 0)) AS total
+                    FROM ({tickets_query}) t
+                    GROUP BY t.project_id, t.project_name, t.user_id;'''.format(tickets_query=tickets_query)
+        return Ticket.fetch_rows(query, params, stream=stream)
 
     def __repr__(self):
         return '<Ticket %r>' % self.id
@@ -8,10 +8,17 @@ class User(Base):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(200))
     nickname = db.Column(db.String(50))
+    email = db.Column(db.String(100), index=True)
     active = db.Column(db.String(1))
     timezone = db.Column(db.String(6))
     line_manager_id = db.Column(db.Integer())
     department_id = db.Column(db.Integer())
 
+    @staticmethod
+    def get_user_rows():
+        """ All users as lightweight rows, see Base.fetch_rows() """
+        query = 'SELECT %s FROM user;' % ', '.join(column.name for column in User.__table__.columns)
+        return User.fetch_rows(query)
+
     def __repr__(self):
         return '<User %r>' % self.id
@@ -1,27 +1,192 @@
-import datetime
-import MySQLdb
+from collections import namedtuple
+
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import text
 
 db = SQLAlchemy()
 
+# formats used for dates in to_dict() and in rows
+DATETIME_FORMAT = "%d/%m/%Y %H:%M:%S"
+DATE_FORMAT = "%d/%m/%Y"
+
+# row classes by column names, see row_class()
+_row_classes = {}
+
+# (column name, converter) pairs by model class, see Base.dict_converters()
+_dict_converters = {}
+
+# key of Connection.info holding the query whose rows are being streamed on that connection, see Base.fetch_rows()
+_OPEN_STREAM = 'fetch_rows_open_stream'
+
+
+def bind_id_list(name, ids):
+    """
+    Expand ids into named bind parameters for an IN clause of a text() query
+    :param name: prefix of the bind parameter names
+    :param ids: iterable of ids
+    :return: tuple (sql, params), e.g. ('(:pid_0, :pid_1)', {'pid_0': 1, 'pid_1': 2}); '(NULL)' if ids is empty
+    """
+    params = {}
+    for i, an_id in enumerate(ids):
+        params['%s_%d' % (name, i)] = an_id
+
+    if not params:
+        # IN (NULL) matches nothing
+        return '(NULL)', params
+
+    return '(%s)' % ', '.join(':%s_%d' % (name, i) for i in range(len(params))), params
+
+
+def row_class(columns):
+    """
+    Return a namedtuple class for columns, created once per distinct set of columns. Besides attribute access the
+    rows support row['column'] so they can be used wherever a to_dict() dictionary is expected.
+    """
+    columns = tuple(columns)
+    cls = _row_classes.get(columns)
+    if cls is None:
+        base = namedtuple('Row', columns)
+
+        class Row(base):
+            __slots__ = ()
+
+            def __getitem__(self, key):
+                if isinstance(key, basestring):
+                    return getattr(self, key)
+                return base.__getitem__(self, key)
+
+        cls = _row_classes[columns] = Row
+    return cls
+
+
+def _format_datetime(val):
+    return val.strftime(DATETIME_FORMAT)
+
+
+def _format_date(val):
+    return val.strftime(DATE_FORMAT)
+
+
+def column_converter(column):
+    """ Return the function converting a raw value of column to its to_dict() form, None if it is kept as is """
+    if isinstance(column.type, db.DateTime):
+        return _format_datetime
+    if isinstance(column.type, db.Date):
+        return _format_date
+    if isinstance(column.type, (db.Float, db.Numeric)):
+        # MySQLdb returns DECIMAL columns and sums as Decimal
+        return float
+    return None
+
+
+def cached_converter(convert):
+    """
+    Wrap a date or datetime converter so each distinct value is formatted only once, timesheets repeat the same
+    dates hundreds of times. Use for the span of one query or one bulk conversion.
+    """
+    if convert is not _format_date and convert is not _format_datetime:
+        return convert
+
+    formatted = {}
+
+    def cached(val):
+        try:
+            return formatted[val]
+        except KeyError:
+            result = formatted[val] = convert(val)
+            return result
+    return cached
+
+
 class Base(db.Model):
 
     __abstract__ = True
 
+    @classmethod
+    def fetch_rows(cls, query, params=None, stream=False):
+        """
+        Run a text query on a Core connection and yield lightweight rows instead of ORM objects. Result columns that
+        match a column of the model are converted as in to_dict(), the converters are resolved once per query.
+
+        :param query: SQL string
+        :param params: bind parameters
+        :param stream: fetch rows from a server side cursor (MySQLdb SSCursor) as they are consumed instead of
+                       buffering the whole result. A connection has a single server side cursor: the rows must be
+                       consumed, or the generator closed, before the next query is issued on the session
+        :return: generator of row_class() rows, the query runs when the first row is asked for
+        :raise RuntimeError: if the rows of a streamed query are still being read on the session's connection
+        """
+        connection = db.session.connection(mapper=cls.__mapper__)
+        open_stream = connection.info.get(_OPEN_STREAM)
+        if open_stream is not None:
+            raise RuntimeError('the rows of a streamed query are still being read, consume them before running: '
+                               '%s' % ' '.join(query.split())[:200])
+
+        if stream:
+            connection = connection.execution_options(stream_results=True)
+        result = connection.execute(text(query), params or {})
+        if stream:
+            connection.info[_OPEN_STREAM] = query
+
+        try:
+            keys = result.keys()
+            Row = row_class(keys)
+
+            converters = []
+            for i, key in enumerate(keys):
+                column = cls.__table__.columns.get(key)
+                convert = column_converter(column) if column is not None else None
+                if convert is not None:
+                    converters.append((i, cached_converter(convert)))
+
+            for values in result:
+                if converters:
+                    values = list(values)
+                    for i, convert in converters:
+                        if values[i] is not None:
+                            values[i] = convert(values[i])
+                yield Row(*values)
+        finally:
+            result.close()
+            if stream:
+                connection.info.pop(_OPEN_STREAM, None)
+
+    @classmethod
+    def dict_converters(cls):
+        """ Return the (column name, converter) pairs of the model, compiled once per model class """
+        converters = _dict_converters.get(cls)
+        if converters is None:
+            converters = _dict_converters[cls] = [(c.name, column_converter(c)) for c in cls.__table__.columns]
+        return converters
+
     def to_dict(self):
         obj_dict = {}
-        for c in self.__table__.columns:
-            key = c.name
+        for key, convert in self.dict_converters():
             val = getattr(self, key)
-
-            if isinstance(val, datetime.datetime):
-                val = val.strftime("%d/%m/%Y %H:%M:%S")
-            elif isinstance(val, datetime.date):
-                val = val.strftime("%d/%m/%Y")
-            elif isinstance(val, MySQLdb.converters.conversions[MySQLdb.constants.FIELD_TYPE.DECIMAL]):
-                val = float(val)
-            else:
-                pass
-
+            if convert is not None and val is not None:
+                val = convert(val)
             obj_dict[key] = val
         return obj_dict
+
+    @classmethod
+    def to_dicts(cls, objs):
+        """
+        Convert a list of model objects, e.g. the result of a query's .all(), in one pass. Dates and datetimes are
+        formatted once per distinct value.
+
+        :param objs: iterable of instances of this model
+        :return: list of dictionaries as returned by to_dict()
+        """
+        converters = [(key, cached_converter(convert) if convert is not None else None)
+                      for key, convert in cls.dict_converters()]
+
+        obj_dicts = []
+        for obj in objs:
+            obj_dict = {}
+            for key, convert in converters:
+                val = getattr(obj, key)
+                if convert is not None and val is not None:
+                    val = convert(val)
+                obj_dict[key] = val
+            obj_dicts.append(obj_dict)
+        return obj_dicts
@@ -1,2 +1,2 @@
 # Set modules to be exported with "from oaxmlapi import *"
-__all__ = ['commands', 'connections', 'datatypes', 'utilities']
+__all__ = ['client', 'commands', 'connections', 'datatypes', 'resilience', 'standin', 'transport', 'utilities']
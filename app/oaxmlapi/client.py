@@ -0,0 +1,234 @@
+# -*- coding: utf-8
+
+from __future__ import absolute_import
+
+import Queue
+import threading
+import time
+
+from app.oaxmlapi import wrapper
+
+# default number of requests a Client keeps in flight, see configure()
+default_max_in_flight = 4
+# default requests per second allowed per company, None for no limit
+default_rate = None
+
+# rate limiters shared by every Client of the same company and rate, guarded by _limiters_lock
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+class RateLimiter(object):
+    """
+    A thread-safe token bucket allowing rate calls per second on average
+    and bursts of up to burst calls.
+
+    Arguments:
+        rate (float): calls per second
+        burst (int): the bucket size (optional, defaults to one second of calls)
+
+    """
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = burst or max(1, int(rate))
+        self._tokens = float(self.burst)
+        self._updated = time.time()
+        self._lock = threading.Lock()
+
+    def __str__(self):
+        return "RateLimiter (%s calls/s, burst: %s)" % (self.rate, self.burst)
+
+    def acquire(self):
+        """
+        Block until a call is allowed.
+
+        """
+        while True:
+            with self._lock:
+                now = time.time()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def rate_limiter(company, rate):
+    """
+    Return the RateLimiter shared by every client of company asking for
+    rate, None if rate is None. Clients asking for another rate get a
+    limiter of their own, so they never reset the throttling of the
+    clients already in flight.
+
+    """
+    if rate is None:
+        return None
+
+    key = (company, float(rate))
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            limiter = _limiters[key] = RateLimiter(rate)
+        return limiter
+
+
+def configure(in_flight=None, rate=None):
+    """
+    Set the defaults used by new clients. Arguments left as None keep their value.
+
+    """
+    global default_max_in_flight, default_rate
+    if in_flight is not None:
+        default_max_in_flight = in_flight
+    if rate is not None:
+        default_rate = rate
+
+
+class _Call(object):
+    """
+    The results of one Client.map() call, filled in by the workers.
+
+    """
+    def __init__(self, func, count):
+        self.func = func
+        self.results = [None] * count
+        self.errors = []
+        self.remaining = count
+        self.lock = threading.Lock()
+        self.done = threading.Event()
+        if not count:
+            self.done.set()
+
+    def run(self, index, item):
+        try:
+            self.results[index] = self.func(item)
+        except Exception, err:
+            with self.lock:
+                self.errors.append((index, err))
+        with self.lock:
+            self.remaining -= 1
+            if not self.remaining:
+                self.done.set()
+
+
+class Client(object):
+    """
+    Issues independent OpenAir requests concurrently over the shared
+    connection pool, keeping at most max_in_flight of them in flight
+    and at most rate of them per second for the company.
+
+    The worker threads are started by the first map() and reused by the
+    next ones until close(). A request thread cannot outlive its request
+    on App Engine, so close the client, or use it as a context manager,
+    before the request ends.
+
+    Arguments:
+        key (str): the NetSuite OpenAir API key
+        un (str): a username string
+        pw (str): a password string
+        company (str): a company string
+        max_in_flight (int): the number of concurrent requests (optional)
+        rate (float): requests per second allowed for company (optional)
+
+    """
+    def __init__(self, key, un, pw, company, max_in_flight=None, rate=None):
+        self.key = key
+        self.un = un
+        self.pw = pw
+        self.company = company
+        self.max_in_flight = max_in_flight or default_max_in_flight
+        self.limiter = rate_limiter(company, rate if rate is not None else default_rate)
+        # (call, index, item) jobs for the workers, None stops a worker
+        self._jobs = Queue.Queue()
+        self._workers = []
+        self._workers_lock = threading.Lock()
+
+    def __str__(self):
+        return "Client for %s (max_in_flight: %s)" % (self.company, self.max_in_flight)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _work(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            call, index, item = job
+            call.run(index, item)
+
+    def _start_workers(self):
+        with self._workers_lock:
+            while len(self._workers) < self.max_in_flight:
+                worker = threading.Thread(target=self._work, name='oaxmlapi client worker')
+                worker.daemon = True
+                worker.start()
+                self._workers.append(worker)
+
+    def close(self):
+        """
+        Stop the worker threads once the calls in progress are done. A
+        later map() starts new ones.
+
+        """
+        with self._workers_lock:
+            workers, self._workers = self._workers, []
+            for _ in workers:
+                self._jobs.put(None)
+        for worker in workers:
+            worker.join()
+
+    def call(self, xml_data):
+        """
+        Send a list of command elements in a single request, waiting for
+        the company's rate limit first.
+
+        """
+        if self.limiter is not None:
+            self.limiter.acquire()
+        return wrapper._call_wrapper(self.key, self.un, self.pw, self.company, xml_data)
+
+    def map(self, func, items):
+        """
+        Call func(item) for every item on the client's max_in_flight
+        worker threads.
+
+        Returns:
+            (list): the results in the order of items. The first exception
+                    raised by func is re-raised once every call has finished.
+
+        """
+        items = list(items)
+        call = _Call(func, len(items))
+        if items:
+            self._start_workers()
+            for index, item in enumerate(items):
+                self._jobs.put((call, index, item))
+        call.done.wait()
+
+        if call.errors:
+            raise min(call.errors)[1]
+        return call.results
+
+    def read(self, commands):
+        """
+        Send each command element in its own request.
+
+        Returns:
+            (list): the json objects of the responses, in the order of commands
+
+        """
+        return self.map(lambda command: self.call([command]), commands)
+
+    def get_tasks(self, projectids):
+        """
+        Returns:
+            (list): the json objects of get_tasks() for each of projectids, in order
+
+        """
+        return self.read([wrapper.tasks_command(projectid) for projectid in projectids])
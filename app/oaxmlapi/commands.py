@@ -38,6 +38,10 @@ class Time(object):
         return ET.tostring(self.time(), 'utf-8')
 
 
+# the largest number of records a single read returns
+MAX_READ_LIMIT = 1000
+
+
 class Read(object):
     """
     Use the read command to retrieve data from OpenAir.
@@ -115,6 +119,16 @@ class Read(object):
         """
         return ET.tostring(self.read(), 'utf-8')
 
+    def page(self, offset, count):
+        """
+        Returns a copy of this read limited to count records starting
+        at offset, using the limit="offset,count" attribute.
+
+        """
+        attribs = dict(self.attribs)
+        attribs['limit'] = '%d,%d' % (offset, count)
+        return Read(self.type, self.method, attribs, self.filters, self.fields)
+
     def prettify(self):
         """
         Return a formatted, prettified string containing XML tags.
@@ -248,3 +248,45 @@ class Request(object):
         """
         reparsed = minidom.parseString(self.tostring())
         return reparsed.toprettyxml(indent='  ', encoding='utf-8')
+
+
+class RequestTemplate(object):
+    """
+    A Request whose envelope (application attributes and Auth or
+    RemoteAuth tags) is serialized once, so that every call only
+    serializes its own commands.
+
+    Arguments:
+        application (obj): an Application object
+        auth (obj): an Auth or RemoteAuth object
+
+    """
+    # marks where the commands go in the serialized envelope
+    BODY = 'RequestTemplateBody'
+
+    def __init__(self, application, auth):
+        self.application = application
+        self.auth = auth
+
+        envelope = Request(application, auth, [ET.Element(self.BODY)]).tostring()
+        self.prefix, self.suffix = envelope.split('<%s />' % self.BODY)
+
+    def __str__(self):
+        return '"%s" request template as %s\%s' % (
+            self.application.client,
+            self.auth.company,
+            self.auth.username
+        )
+
+    def tostring(self, xml_data):
+        """
+        Return a string containing the XML tags of a complete request,
+        the same as Request(application, auth, xml_data).tostring().
+
+        Arguments:
+            xml_data (list): a list of ElementTree objects, or of strings
+                             already serialized by ET.tostring(elem, 'utf-8')
+
+        """
+        body = [elem if isinstance(elem, str) else ET.tostring(elem, 'utf-8') for elem in xml_data or ()]
+        return self.prefix + ''.join(body) + self.suffix
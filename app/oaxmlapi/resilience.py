@@ -0,0 +1,266 @@
+# -*- coding: utf-8
+
+from __future__ import absolute_import
+
+import collections
+import httplib
+import random
+import socket
+import threading
+import time
+
+from app.oaxmlapi import transport
+
+# commands that only read data, a request made of these alone is safe to send again
+IDEMPOTENT_COMMANDS = frozenset(['Read', 'Whoami', 'Time'])
+
+# breaker states
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(IOError):
+    """
+    Raised instead of calling the API while the circuit breaker is open.
+
+    Arguments:
+        retry_in (float): seconds until the breaker lets a trial call through
+
+    """
+    def __init__(self, retry_in):
+        IOError.__init__(self, 'OpenAir API circuit open, retrying in %.0fs' % retry_in)
+        self.retry_in = retry_in
+
+
+class CircuitBreaker(object):
+    """
+    Tracks the outcome of the last window calls and opens once at least
+    min_calls of them were made and error_rate of them failed. While open
+    every call fails fast; after reset_timeout seconds a single trial call
+    is let through, closing the breaker if it succeeds.
+
+    Arguments:
+        window (int): the number of recent calls considered
+        min_calls (int): calls needed in the window before the breaker can open
+        error_rate (float): the failure ratio that opens the breaker
+        reset_timeout (float): seconds the breaker stays open
+
+    """
+    def __init__(self, window=20, min_calls=5, error_rate=0.5, reset_timeout=30):
+        self.window = window
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.opened_at = None
+        self.stats = {'calls': 0, 'failures': 0, 'rejected': 0, 'opened': 0}
+        self._outcomes = collections.deque(maxlen=window)
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def __str__(self):
+        return "CircuitBreaker (%s)" % self.state
+
+    def allow(self):
+        """
+        Return True if a call may go ahead, moving an open breaker to
+        half open once reset_timeout has elapsed.
+
+        """
+        with self._lock:
+            if self.state == OPEN and time.time() - self.opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+                self._trial = False
+
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and not self._trial:
+                # only one trial call at a time
+                self._trial = True
+                return True
+
+            self.stats['rejected'] += 1
+            return False
+
+    def retry_in(self):
+        """
+        Return the seconds left until an open breaker lets a trial call through.
+
+        """
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, self.reset_timeout - (time.time() - self.opened_at))
+
+    def record(self, success):
+        """
+        Record the outcome of a call let through by allow().
+
+        """
+        with self._lock:
+            self.stats['calls'] += 1
+            if not success:
+                self.stats['failures'] += 1
+
+            if self.state == HALF_OPEN:
+                self._trial = False
+                if success:
+                    self.state = CLOSED
+                    self._outcomes.clear()
+                else:
+                    self._open()
+                return
+
+            self._outcomes.append(success)
+            failures = self._outcomes.count(False)
+            if len(self._outcomes) >= self.min_calls and failures >= self.error_rate * len(self._outcomes):
+                self._open()
+
+    def _open(self):
+        self.state = OPEN
+        self.opened_at = time.time()
+        self.stats['opened'] += 1
+        self._outcomes.clear()
+
+    def status(self):
+        """
+        Returns a dictionary describing the breaker, see status().
+
+        """
+        with self._lock:
+            outcomes = list(self._outcomes)
+            return {
+                'state': self.state,
+                'retry_in': round(self.retry_in(), 1),
+                'window_calls': len(outcomes),
+                'window_failures': outcomes.count(False),
+                'stats': dict(self.stats)
+            }
+
+
+# the breaker and retry settings shared by every call, see configure()
+breaker = CircuitBreaker()
+retries = 2
+backoff = 0.5
+max_backoff = 5.0
+# seconds after the first attempt past which a call is not retried, well within the 60 seconds request deadline
+budget = 20.0
+
+
+def configure(retry_count=None, backoff_base=None, backoff_max=None, window=None, min_calls=None, error_rate=None,
+              reset_timeout=None, retry_budget=None):
+    """
+    Tune the retries and the shared circuit breaker. Arguments left as None keep their value.
+
+    """
+    global retries, backoff, max_backoff, budget
+    if retry_count is not None:
+        retries = retry_count
+    if backoff_base is not None:
+        backoff = backoff_base
+    if backoff_max is not None:
+        max_backoff = backoff_max
+    if retry_budget is not None:
+        budget = retry_budget
+    if window is not None:
+        breaker.window = window
+        breaker._outcomes = collections.deque(breaker._outcomes, maxlen=window)
+    if min_calls is not None:
+        breaker.min_calls = min_calls
+    if error_rate is not None:
+        breaker.error_rate = error_rate
+    if reset_timeout is not None:
+        breaker.reset_timeout = reset_timeout
+
+
+def is_idempotent(xml_data):
+    """
+    True if every command of xml_data, ElementTree objects or serialized
+    strings, is in IDEMPOTENT_COMMANDS.
+
+    """
+    for elem in xml_data:
+        tag = elem.tag if hasattr(elem, 'tag') else command_tag(elem)
+        if tag not in IDEMPOTENT_COMMANDS:
+            return False
+    return True
+
+
+def command_tag(xml_str):
+    """
+    Return the tag of a serialized command such as '<Whoami />'.
+
+    """
+    return xml_str.lstrip('<').split(None, 1)[0].rstrip('/>')
+
+
+def is_failure(err):
+    """
+    True if err means the API itself is failing: a network error, a
+    timeout or a 5xx answer. Other errors are the caller's and do not
+    count against the breaker.
+
+    """
+    if isinstance(err, transport.TransportError):
+        return err.status >= 500
+    return isinstance(err, (socket.error, httplib.HTTPException))
+
+
+def is_retryable(err):
+    """
+    True if a failed idempotent call may be attempted again. A timeout has
+    already used up the whole read timeout and is not retried.
+
+    """
+    return is_failure(err) and not isinstance(err, socket.timeout)
+
+
+def call(func, idempotent=False):
+    """
+    Call func() through the circuit breaker, retrying failures with
+    jittered exponential backoff when idempotent, as long as the retry
+    starts within budget seconds of the first attempt.
+
+    Arguments:
+        func (callable): performs a single API request
+        idempotent (bool): whether the request is safe to send again
+
+    Raises:
+        CircuitOpenError: if the breaker is open
+
+    """
+    started = time.time()
+    attempts = retries + 1 if idempotent else 1
+    for attempt in range(attempts):
+        if not breaker.allow():
+            raise CircuitOpenError(breaker.retry_in())
+
+        try:
+            result = func()
+        except Exception, err:
+            breaker.record(not is_failure(err))
+            # full jitter keeps retrying clients from hitting the API in lockstep
+            delay = random.uniform(0, min(max_backoff, backoff * 2 ** attempt))
+            if not is_retryable(err) or attempt == attempts - 1 or time.time() - started + delay >= budget:
+                raise
+        except BaseException:
+            # e.g. the request deadline, the outcome still has to free a half open breaker's trial slot
+            breaker.record(False)
+            raise
+        else:
+            breaker.record(True)
+            return result
+
+        time.sleep(delay)
+
+
+def status():
+    """
+    Returns a dictionary with the breaker state and the connection pool stats.
+
+    """
+    return {
+        'breaker': breaker.status(),
+        'retries': retries,
+        'pool': dict(transport.pool.stats)
+    }
@@ -0,0 +1,224 @@
+# -*- coding: utf-8
+
+from __future__ import absolute_import
+
+import BaseHTTPServer
+import json
+import random
+import threading
+import time
+from SocketServer import ThreadingMixIn
+
+try:
+    import xml.etree.cElementTree as ET
+except ImportError:
+    import xml.etree.ElementTree as ET
+
+# request children carrying credentials, never written to a cassette
+AUTH_TAGS = ('Auth', 'RemoteAuth')
+
+
+def request_key(xml_req):
+    """
+    Return the commands of a serialized request without its envelope and
+    credentials, used to match a replayed request to a recorded one.
+
+    Arguments:
+        xml_req (str): a complete XML request
+
+    """
+    request = ET.fromstring(xml_req)
+    return ''.join(ET.tostring(elem, 'utf-8') for elem in request if elem.tag not in AUTH_TAGS)
+
+
+class Recorder(object):
+    """
+    Appends the request/response pairs going through transport.post() to
+    a cassette, a file holding one JSON object per line with the request
+    commands (see request_key()) and the XML response.
+
+    Arguments:
+        path (str): the cassette file
+
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def __str__(self):
+        return "Recorder (%s)" % self.path
+
+    def record(self, xml_req, xml_res):
+        line = json.dumps({'request': request_key(xml_req), 'response': xml_res})
+        with self._lock:
+            with open(self.path, 'a') as f:
+                f.write(line + '\n')
+
+
+def load_cassette(path):
+    """
+    Returns:
+        (dict): the recorded responses of a cassette keyed by request_key(),
+                a request recorded several times keeps every response
+    """
+    responses = {}
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                pair = json.loads(line)
+                responses.setdefault(pair['request'], []).append(pair['response'].encode('utf-8'))
+    return responses
+
+
+def scale_response(xml_res, scale):
+    """
+    Return xml_res with every record of its Read commands repeated scale
+    times. Copies get ids no record of the response has: numeric ids are
+    shifted past the largest one, id + copy * (max_id + 1), other ids are
+    suffixed with '-' and the copy number.
+
+    """
+    if scale <= 1:
+        return xml_res
+
+    response = ET.fromstring(xml_res)
+    for read in response.findall('Read'):
+        records = list(read)
+        ids = [record.findtext('id', '').strip() for record in records]
+        max_id = max([int(record_id) for record_id in ids if record_id.isdigit()] or [0])
+        for copy in range(1, scale):
+            for record in records:
+                # a deep copy of the record
+                record = ET.fromstring(ET.tostring(record, 'utf-8'))
+                record_id = record.find('id')
+                if record_id is not None and record_id.text and record_id.text.strip():
+                    text = record_id.text.strip()
+                    if text.isdigit():
+                        record_id.text = str(int(text) + copy * (max_id + 1))
+                    else:
+                        record_id.text = '%s-%d' % (text, copy)
+                read.append(record)
+    return '<?xml version="1.0" standalone="yes"?>' + ET.tostring(response, 'utf-8')
+
+
+def empty_response(xml_req):
+    """
+    Return a successful response holding no data for every command of xml_req,
+    what the stand-in answers to requests missing from the cassette.
+
+    """
+    request = ET.fromstring(xml_req)
+    response = ET.Element('response')
+    for elem in request:
+        ET.SubElement(response, elem.tag, {'status': '0'})
+    return '<?xml version="1.0" standalone="yes"?>' + ET.tostring(response, 'utf-8')
+
+
+class StandIn(object):
+    """
+    A WSGI application answering OpenAir API requests from a cassette.
+
+    Arguments:
+        cassette (str): a cassette written by Recorder
+        latency (float): seconds added to every response (optional)
+        jitter (float): up to this many random seconds added on top of latency (optional)
+        scale (int): how many times the records of Read responses are repeated (optional)
+
+    """
+    def __init__(self, cassette, latency=0.0, jitter=0.0, scale=1):
+        self.latency = latency
+        self.jitter = jitter
+        self.scale = scale
+        self.responses = dict((key, [scale_response(xml_res, scale) for xml_res in responses])
+                              for key, responses in load_cassette(cassette).items())
+        self.stats = {'requests': 0, 'misses': 0}
+        self._replayed = {}
+        self._lock = threading.Lock()
+
+    def __str__(self):
+        return "StandIn (%d requests, latency: %ss, scale: %s)" % (len(self.responses), self.latency, self.scale)
+
+    def respond(self, xml_req):
+        """
+        Return the recorded response to xml_req, cycling through the responses
+        of a request recorded several times.
+
+        """
+        key = request_key(xml_req)
+        with self._lock:
+            self.stats['requests'] += 1
+            responses = self.responses.get(key)
+            if not responses:
+                self.stats['misses'] += 1
+                return empty_response(xml_req)
+            index = self._replayed.get(key, 0)
+            self._replayed[key] = index + 1
+        return responses[index % len(responses)]
+
+    def __call__(self, environ, start_response):
+        length = int(environ.get('CONTENT_LENGTH') or 0)
+        xml_req = environ['wsgi.input'].read(length)
+
+        delay = self.latency + random.uniform(0, self.jitter)
+        if delay:
+            time.sleep(delay)
+
+        xml_res = self.respond(xml_req)
+        start_response('200 OK', [('Content-Type', 'text/xml'), ('Content-Length', str(len(xml_res)))])
+        return [xml_res]
+
+
+class _Server(ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+class _KeepAliveHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    Runs the WSGI application of the server over keep-alive connections so
+    that the transport's connection pool behaves as it does against openair.com.
+    wsgiref closes the connection after every request.
+
+    """
+    protocol_version = 'HTTP/1.1'
+    # buffer the status line, headers and body into a single write, flushed after each request
+    wbufsize = -1
+
+    def do_POST(self):
+        environ = {
+            'REQUEST_METHOD': 'POST',
+            'PATH_INFO': self.path,
+            'CONTENT_LENGTH': self.headers.get('Content-Length', '0'),
+            'CONTENT_TYPE': self.headers.get('Content-Type', ''),
+            'wsgi.input': self.rfile
+        }
+        status_headers = []
+
+        def start_response(status, headers):
+            status_headers[:] = [status, headers]
+
+        body = ''.join(self.server.app(environ, start_response))
+        status, headers = status_headers
+        self.send_response(int(status.split()[0]))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(app, host='127.0.0.1', port=0):
+    """
+    Serve the WSGI application app, e.g. a StandIn, on a background thread.
+
+    Returns:
+        (tuple): the server and the api.pl URL to pass to transport.configure()
+
+    """
+    server = _Server((host, port), _KeepAliveHandler)
+    server.app = app
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server, 'http://%s:%d/api.pl' % (host, server.server_port)
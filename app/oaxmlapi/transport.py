@@ -0,0 +1,356 @@
+# -*- coding: utf-8
+
+from __future__ import absolute_import
+
+import errno
+import httplib
+import logging
+import os
+import socket
+import threading
+import time
+import urlparse
+import zlib
+
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from StringIO import StringIO
+
+DEFAULT_API_URL = 'https://www.openair.com/api.pl'
+
+# the XML API is POSTed like a form, as urllib2 did, the repetitive XML responses compress very well
+HEADERS = {'Content-Type': 'application/x-www-form-urlencoded', 'Accept-Encoding': 'gzip, deflate'}
+
+# errors of writing to or reading from a connection the server has already closed
+STALE_CONNECTION_ERRNOS = frozenset([errno.ECONNRESET, errno.EPIPE, errno.ECONNABORTED])
+
+# bytes read from the socket at a time
+CHUNK_SIZE = 16384
+
+
+class TransportError(IOError):
+    """
+    Raised when the API answers with a non 2xx HTTP status.
+
+    Arguments:
+        status (int): the HTTP status code
+        body (str): the response body
+
+    """
+    def __init__(self, status, body):
+        IOError.__init__(self, 'HTTP %d from the OpenAir API' % status)
+        self.status = status
+        self.body = body
+
+
+def is_stale_connection(err):
+    """
+    True if err means a reused keep-alive connection had been closed by the
+    server before the request reached it, the only failure safe to retry
+    whatever the request. A timeout may mean the server is still processing
+    the request and is never one.
+
+    """
+    if isinstance(err, socket.timeout):
+        return False
+    if isinstance(err, httplib.BadStatusLine):
+        # the connection was closed without a status line
+        return True
+    return isinstance(err, socket.error) and err.errno in STALE_CONNECTION_ERRNOS
+
+
+class DecodingReader(object):
+    """
+    A file-like object reading the body of an HTTP response and
+    decompressing it as it goes, according to its Content-Encoding.
+
+    Arguments:
+        res (obj): an httplib.HTTPResponse
+
+    """
+    def __init__(self, res):
+        self.res = res
+        self.encoding = (res.getheader('content-encoding') or 'identity').strip().lower()
+        if self.encoding == 'gzip':
+            self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif self.encoding == 'deflate':
+            self._decompressor = zlib.decompressobj()
+        else:
+            self._decompressor = None
+        self._buffer = []
+        self._buffered = 0
+        self._eof = False
+        self.bytes_received = 0
+        self.bytes_decoded = 0
+
+    def __str__(self):
+        return "DecodingReader (%s)" % self.encoding
+
+    def _decompress(self, chunk):
+        try:
+            return self._decompressor.decompress(chunk)
+        except zlib.error:
+            if self.encoding != 'deflate' or self.bytes_received != len(chunk):
+                raise
+            # some servers send raw deflate data without the zlib header
+            self._decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+            return self._decompressor.decompress(chunk)
+
+    def _fill(self):
+        chunk = self.res.read(CHUNK_SIZE)
+        if not chunk:
+            self._eof = True
+            data = self._decompressor.flush() if self._decompressor else ''
+        else:
+            self.bytes_received += len(chunk)
+            data = self._decompress(chunk) if self._decompressor else chunk
+
+        if data:
+            self.bytes_decoded += len(data)
+            self._buffer.append(data)
+            self._buffered += len(data)
+
+    def read(self, size=-1):
+        """
+        Return up to size decoded bytes, all the remaining ones if size is negative.
+
+        """
+        while not self._eof and (size < 0 or self._buffered < size):
+            self._fill()
+
+        data = ''.join(self._buffer)
+        if size < 0 or len(data) <= size:
+            self._buffer, self._buffered = [], 0
+            return data
+
+        self._buffer, self._buffered = [data[size:]], len(data) - size
+        return data[:size]
+
+
+class ConnectionPool(object):
+    """
+    A thread-safe pool of persistent HTTP(S) connections, reused per host so
+    that consecutive calls skip the TCP and TLS handshakes.
+
+    Arguments:
+        max_size (int): the number of idle connections kept per host
+        idle_timeout (float): seconds after which an idle connection is closed
+        timeout (float): the socket timeout in seconds
+        connect_timeout (float): the timeout of the TCP and TLS handshakes,
+                                 kept short so an unreachable API fails fast
+
+    """
+    def __init__(self, max_size=4, idle_timeout=60, timeout=60, connect_timeout=5):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.stats = {'connections': 0, 'reused': 0, 'requests': 0, 'bytes_received': 0, 'bytes_decoded': 0}
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def __str__(self):
+        return "ConnectionPool (max_size: %s, idle_timeout: %ss)" % (self.max_size, self.idle_timeout)
+
+    def _connect(self, key):
+        scheme, host, port = key
+        if scheme == 'https':
+            conn = httplib.HTTPSConnection(host, port, timeout=self.connect_timeout)
+        else:
+            conn = httplib.HTTPConnection(host, port, timeout=self.connect_timeout)
+        conn.connect()
+        # connected, the response may take up to timeout
+        conn.sock.settimeout(self.timeout)
+        with self._lock:
+            self.stats['connections'] += 1
+        return conn
+
+    def _acquire(self, key):
+        """
+        Return a tuple (connection, reused), the most recently used idle
+        connection to the host if there is one that has not expired.
+
+        """
+        expired = []
+        conn = None
+        now = time.time()
+        with self._lock:
+            idle = self._idle.get(key, [])
+            while idle:
+                candidate, last_used = idle.pop()
+                if now - last_used > self.idle_timeout:
+                    expired.append(candidate)
+                else:
+                    conn = candidate
+                    self.stats['reused'] += 1
+                    break
+
+        for candidate in expired:
+            candidate.close()
+
+        if conn is None:
+            return self._connect(key), False
+        return conn, True
+
+    def _release(self, key, conn):
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_size:
+                idle.append((conn, time.time()))
+                return
+        conn.close()
+
+    def post(self, url, body, headers=None, parse=None):
+        """
+        POST body to url over a pooled connection.
+
+        Arguments:
+            url (str): an http or https URL
+            body (str): the request body
+            headers (dict): extra request headers (optional)
+            parse (callable): called with a file-like object streaming the
+                              decompressed response body, its result is
+                              returned instead of the body (optional)
+
+        Returns:
+            (str): the response body, or what parse returned
+
+        """
+        parts = urlparse.urlsplit(url)
+        key = (parts.scheme, parts.hostname, parts.port or (443 if parts.scheme == 'https' else 80))
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+
+        request_headers = dict(HEADERS)
+        if headers:
+            request_headers.update(headers)
+
+        conn, reused = self._acquire(key)
+        with self._lock:
+            self.stats['requests'] += 1
+        try:
+            res = self._send(conn, path, body, request_headers)
+        except BaseException, err:
+            conn.close()
+            if not reused or not is_stale_connection(err):
+                raise
+            # the server closed an idle keep-alive connection before answering, retry once on a fresh one
+            conn = self._connect(key)
+            try:
+                res = self._send(conn, path, body, request_headers)
+            except BaseException:
+                conn.close()
+                raise
+
+        reader = DecodingReader(res)
+        try:
+            if not 200 <= res.status < 300:
+                raise TransportError(res.status, reader.read())
+
+            if parse is None:
+                result = reader.read()
+            else:
+                result = parse(reader)
+                # the rest of the body has to be read before the connection can be reused
+                reader.read()
+        except Exception:
+            conn.close()
+            raise
+        finally:
+            self._count(reader)
+
+        if res.will_close:
+            conn.close()
+        else:
+            self._release(key, conn)
+        return result
+
+    @staticmethod
+    def _send(conn, path, body, headers):
+        conn.request('POST', path, body, headers)
+        return conn.getresponse()
+
+    def _count(self, reader):
+        with self._lock:
+            self.stats['bytes_received'] += reader.bytes_received
+            self.stats['bytes_decoded'] += reader.bytes_decoded
+        logging.debug('transport: received %d bytes (%s), %d decoded', reader.bytes_received, reader.encoding,
+                      reader.bytes_decoded)
+
+    def clear(self):
+        """
+        Close every idle connection.
+
+        """
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for conn, last_used in connections:
+                conn.close()
+
+
+# endpoint and pool shared by every call, see configure()
+api_url = os.environ.get('OPENAIR_API_URL', DEFAULT_API_URL)
+pool = ConnectionPool()
+# standin.Recorder capturing every call, see record()
+recorder = None
+
+
+def configure(url=None, max_size=None, idle_timeout=None, timeout=None, connect_timeout=None):
+    """
+    Point the API calls at url (e.g. a local stand-in server) and tune the
+    shared connection pool. Arguments left as None keep their value.
+
+    """
+    global api_url
+    if url is not None:
+        api_url = url
+        pool.clear()
+    if max_size is not None:
+        pool.max_size = max_size
+    if idle_timeout is not None:
+        pool.idle_timeout = idle_timeout
+    if timeout is not None:
+        pool.timeout = timeout
+    if connect_timeout is not None:
+        pool.connect_timeout = connect_timeout
+
+
+def post(xml_req, parse=None):
+    """
+    POST an XML request to the configured API endpoint.
+
+    Arguments:
+        xml_req (str): a complete XML request
+        parse (callable): called with a file-like object streaming the XML
+                          response, see ConnectionPool.post() (optional)
+
+    Returns:
+        (str): the XML response, or what parse returned
+
+    """
+    if recorder is None:
+        return pool.post(api_url, xml_req, parse=parse)
+
+    # the recorder needs the whole response, parse it from memory
+    xml_res = pool.post(api_url, xml_req)
+    recorder.record(xml_req, xml_res)
+    if parse is None:
+        return xml_res
+    return parse(StringIO(xml_res))
+
+
+def record(path):
+    """
+    Append every request/response pair to the cassette at path, or stop
+    recording if path is None. See standin.Recorder.
+
+    """
+    global recorder
+    if path is None:
+        recorder = None
+    else:
+        from app.oaxmlapi.standin import Recorder
+        recorder = Recorder(path)
@@ -5,6 +5,11 @@ try:
 except ImportError:
     import xml.etree.ElementTree as ET
 
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from StringIO import StringIO
+
 try:
     import simplejson as json
 except ImportError:
@@ -60,36 +65,32 @@ READ_ATTRIBUTES = (
     'filter', 'field',
 )
 
+# elem2dict() schema making the records of every Read response a list,
+# however many of them the response holds
+READ_LIST_SCHEMA = {'Read': frozenset(XML_DATATYPES)}
 
-def elem2dict(elem, strip=True):
+
+class ResponseError(Exception):
     """
-    Convert an ElementTree() object into a Python dictionary.
+    Raised by iterrecords() when a command in the response has a non zero status.
 
     Arguments:
-        elem (obj): a valid ElementTree() object
-        strip (bool): a boolean value for striping whitespace (optional)
+        tag (str): the tag of the command element, e.g. Auth or Read
+        status (str): the status attribute of the command element
 
-    Credit: Hay Kranen (https://github.com/hay/xml2json)
+    """
+    def __init__(self, tag, status):
+        Exception.__init__(self, '%s failed with status %s' % (tag, status))
+        self.tag = tag
+        self.status = status
+
+
+def _finish(elem, d, strip):
+    """
+    Return the value of elem once its attributes and children are
+    collected in d, merging in its text and tail as elem2dict() does.
 
     """
-    d = {}
-    for key, value in elem.attrib.items():
-        d['@'+key] = value
-
-    # loop over subelements to merge them
-    for subelem in elem:
-        v = elem2dict(subelem, strip=strip)
-        tag = subelem.tag
-        value = v[tag]
-        try:
-            # add to existing list for this tag
-            d[tag].append(value)
-        except AttributeError:
-            # turn existing entry into a list
-            d[tag] = [d[tag], value]
-        except KeyError:
-            # add a new non-list entry
-            d[tag] = value
     text = elem.text
     tail = elem.tail
     if strip:
@@ -105,12 +106,68 @@ def elem2dict(elem, strip=True):
     if d:
         # use #text element if other attributes exist
         if text:
-            d["#text"] = text
-    else:
-        # text is the value if no attributes
-        d = text or None
+            d['#text'] = text
+        return d
+
+    # text is the value if no attributes
+    return text or None
 
-    return {elem.tag: d}
+
+def elem2dict(elem, strip=True, schema=None):
+    """
+    Convert an ElementTree() object into a Python dictionary.
+
+    A tag repeated under the same parent becomes a list, a tag that
+    appears once is a plain value, unless schema lists it as always a list.
+
+    Arguments:
+        elem (obj): a valid ElementTree() object
+        strip (bool): a boolean value for striping whitespace (optional)
+        schema (dict): maps a parent tag to the set of child tags that are
+                       always lists, e.g. READ_LIST_SCHEMA (optional)
+
+    Credit: Hay Kranen (https://github.com/hay/xml2json)
+
+    """
+    get_list_tags = (schema or {}).get
+
+    # walk the tree depth first without recursion, each stack entry is
+    # (element, iterator over its children, its dictionary, its list tags)
+    d = {}
+    for key, value in elem.attrib.items():
+        d['@' + key] = value
+    stack = [(elem, iter(elem), d, get_list_tags(elem.tag))]
+    push = stack.append
+    pop = stack.pop
+    while True:
+        node, children, d, list_tags = stack[-1]
+        for child in children:
+            d = {}
+            if child.attrib:
+                for key, value in child.attrib.items():
+                    d['@' + key] = value
+            push((child, iter(child), d, get_list_tags(child.tag)))
+            break
+        else:
+            pop()
+            value = _finish(node, d, strip)
+            if not stack:
+                return {elem.tag: value}
+
+            # merge the value into the parent's dictionary
+            tag = node.tag
+            parent_d, parent_list_tags = stack[-1][2:]
+            if parent_list_tags and tag in parent_list_tags:
+                if tag in parent_d:
+                    parent_d[tag].append(value)
+                else:
+                    parent_d[tag] = [value]
+            elif tag not in parent_d:
+                parent_d[tag] = value
+            elif type(parent_d[tag]) is list:
+                parent_d[tag].append(value)
+            else:
+                parent_d[tag] = [parent_d[tag], value]
 
 
 def xml2json(xmlstring, strip=True):
@@ -126,3 +183,110 @@ def xml2json(xmlstring, strip=True):
     """
     elem = ET.fromstring(xmlstring)
     return json.dumps(elem2dict(elem, strip=strip))
+
+
+def xml2dict(xmlstring, strip=True, schema=None):
+    """
+    Convert an XML string into a Python dictionary shaped like
+    json.loads(xml2json(xmlstring)), without the JSON round-trip.
+
+    Arguments:
+        xmlstring (str): a valid XML string
+        strip (bool): a boolean value for striping whitespace (optional)
+        schema (dict): list tags passed on to elem2dict() (optional)
+
+    """
+    elem = ET.fromstring(xmlstring)
+    return elem2dict(elem, strip=strip, schema=schema)
+
+
+def _merge(parent_d, parent_list_tags, tag, value):
+    """
+    Merge the value of a child element into its parent's dictionary, as
+    elem2dict() does.
+
+    """
+    if parent_list_tags and tag in parent_list_tags:
+        if tag in parent_d:
+            parent_d[tag].append(value)
+        else:
+            parent_d[tag] = [value]
+    elif tag not in parent_d:
+        parent_d[tag] = value
+    elif type(parent_d[tag]) is list:
+        parent_d[tag].append(value)
+    else:
+        parent_d[tag] = [parent_d[tag], value]
+
+
+def stream2dict(source, strip=True, schema=None):
+    """
+    Incrementally parse an XML document into a Python dictionary shaped
+    like xml2dict(). The children of each element are converted and
+    dropped from the tree as soon as the element ends, so the whole tree
+    is never held next to the dictionary.
+
+    Arguments:
+        source (str or file): an XML string or a file-like object reading one
+        strip (bool): a boolean value for striping whitespace (optional)
+        schema (dict): list tags passed on to elem2dict() (optional)
+
+    """
+    if isinstance(source, basestring):
+        source = StringIO(source)
+    get_list_tags = (schema or {}).get
+
+    # each open element as [its dictionary, its list tags, its ended children with their dictionaries]. A child
+    # is only finished when its parent ends, once the child's tail has been parsed
+    stack = []
+    for event, elem in ET.iterparse(source, events=('start', 'end')):
+        if event == 'start':
+            d = {}
+            for key, value in elem.attrib.items():
+                d['@' + key] = value
+            stack.append([d, get_list_tags(elem.tag), []])
+            continue
+
+        d, list_tags, children = stack.pop()
+        for child, child_d in children:
+            _merge(d, list_tags, child.tag, _finish(child, child_d, strip))
+        del elem[:]
+        if not stack:
+            return {elem.tag: _finish(elem, d, strip)}
+        stack[-1][2].append((elem, d))
+
+
+def iterrecords(source, type, strip=True, schema=None):
+    """
+    Incrementally parse an XML response and yield one dictionary, shaped
+    like elem2dict(elem)[type], per record element. Each record is removed
+    from the tree once yielded so memory stays flat however many records
+    the response holds.
+
+    Arguments:
+        source (str or file): an XML response or a file-like object reading one
+        type (str): the datatype of the records, e.g. Project or Projecttask
+        strip (bool): a boolean value for striping whitespace (optional)
+        schema (dict): list tags passed on to elem2dict() (optional)
+
+    Raises:
+        ResponseError: if a command element such as Auth or Read has a non zero status
+
+    """
+    if isinstance(source, basestring):
+        source = StringIO(source)
+
+    # elements from the root <response> down to the one being parsed
+    stack = []
+    for event, elem in ET.iterparse(source, events=('start', 'end')):
+        if event == 'start':
+            if len(stack) == 1 and elem.get('status', '0') != '0':
+                raise ResponseError(elem.tag, elem.get('status'))
+            stack.append(elem)
+            continue
+
+        stack.pop()
+        # records are the children of the command elements
+        if len(stack) == 2 and elem.tag == type:
+            yield elem2dict(elem, strip=strip, schema=schema)[type]
+            stack[-1].remove(elem)
@@ -1,10 +1,57 @@
 # utilities to interface with the OAXMLAPI Netsuite API wrapper
 # import modules from Python wrapper around the NetSuite OpenAir XML API
-import urllib2
+import hashlib
+import threading
+import time
 
-import simplejson as json
+from app.oaxmlapi import connections, datatypes, commands, resilience, transport, utilities
 
-from app.oaxmlapi import connections, datatypes, commands, utilities
+
+# request templates keyed by a digest of their credentials, see _request_template(), guarded by _templates_lock
+# an envelope holds the password in clear, it is only kept for about one dashboard build
+_templates = {}
+_templates_lock = threading.Lock()
+MAX_TEMPLATES = 32
+TEMPLATE_TIMEOUT = 300
+
+# commands that never change, serialized once
+WHOAMI_XML = connections.Whoami(None).tostring()
+TIME_XML = commands.Time().tostring()
+
+
+# Private method returning the digest keying the request template of a set of credentials
+def _template_key(key, un, pw, company):
+
+    credentials = [value.encode('utf-8') if isinstance(value, unicode) else str(value)
+                   for value in (key, company, un, pw)]
+    return hashlib.sha1('\0'.join(credentials)).hexdigest()
+
+
+# Private method returning the request template of a set of credentials, their envelope is serialized once
+def _request_template(key, un, pw, company):
+
+    template_key = _template_key(key, un, pw, company)
+    now = time.time()
+    with _templates_lock:
+        expires, template = _templates.get(template_key, (0, None))
+        if expires <= now:
+            if len(_templates) >= MAX_TEMPLATES:
+                for stale_key, (stale_expires, _) in _templates.items():
+                    if stale_expires <= now:
+                        del _templates[stale_key]
+                if len(_templates) >= MAX_TEMPLATES:
+                    _templates.clear()
+            app = connections.Application('Tempus Fugit', '1.0', 'default', key)
+            auth = connections.Auth(company, un, pw)
+            template = connections.RequestTemplate(app, auth)
+            _templates[template_key] = (now + TEMPLATE_TIMEOUT, template)
+    return template
+
+
+# Private method serializing the request envelope around xml_data
+def _request_xml(key, un, pw, company, xml_data):
+
+    return _request_template(key, un, pw, company).tostring(xml_data)
 
 
 # Private method to make the final call including all the general parameters
@@ -12,36 +59,79 @@ from app.oaxmlapi import connections, datatypes, commands, utilities
 def _call_wrapper(key, un, pw, company, xml_data):
 
     # Prepare the request
-    app = connections.Application('Tempus Fugit', '1.0', 'default', key)
-    auth = connections.Auth(company, un, pw)
-    xml_req = connections.Request(app, auth, xml_data).tostring()
-    req = urllib2.Request(url='https://www.openair.com/api.pl', data=xml_req)
-    # print 'Request url=%s' % req.get_full_url()
+    xml_req = _request_xml(key, un, pw, company, xml_data)
     # print 'Request req=%s' % xml_req
     # print 'Request data=%s' % xml_data
 
-    # Perform the request
-    res = urllib2.urlopen(req, timeout=60)
-    xml_res = res.read()
-    # print 'Response %s' % xml_res
-
-    # might be easier working with json data
-    json_string = utilities.xml2json(xml_res, strip=True)
-
-    # create a json object
-    json_obj = json.loads(json_string)
+    # Perform the request over a pooled keep-alive connection, read only requests are retried on failure. The
+    # response is parsed as it is decompressed, straight into the dictionaries json.loads(xml2json()) used to produce
+    json_obj = resilience.call(lambda: transport.post(xml_req, parse=utilities.stream2dict),
+                               idempotent=resilience.is_idempotent(xml_data))
     # print "json_obj: {}".format(json_obj['response']['Auth']['@status'])
     return json_obj
 
 
-# Get auth info from server
-def get_whoami(key, un, pw, company):
+# Build the Whoami command element
+def whoami_command(key, un, pw, company):
 
     auth = connections.Auth(company, un, pw)
-    whoami_req = connections.Whoami(auth).whoami()
+    return connections.Whoami(auth).whoami()
+
+
+# Build the Time command element
+def time_command():
+
+    return commands.Time().time()
+
+
+# Build the Read command for active projects
+def projects_read(limit='1000'):
+
+    project = datatypes.Datatype('Project', {'active': '1'})
+    filter1 = commands.Read.Filter(None, None, project).getFilter()
+
+    return commands.Read('Project', 'equal to', {'limit': limit}, [filter1], None)
+
+
+# Build the Read command element for active projects
+def projects_command():
+
+    return projects_read().read()
+
+
+# Build the Read command for tasks, optionally of a single project
+def tasks_read(projectid='', limit='500'):
+
+    # if filter(s) provided create an array of filters
+    filters = []
+    if projectid:
+        # Filter just tasks for the project that aren't closed
+        task = datatypes.Datatype('Projecttask', {'projectid': projectid, 'closed': '0'})
+        filter1 = commands.Read.Filter(None, None, task).getFilter()
+        filters.append(filter1)
+
+    return commands.Read('Projecttask',
+                         'equal to',
+                         {'limit': limit},
+                         filters,
+                         ['id', 'parent_id', 'ancestry', 'cost_center_id', 'projecttask_type_id', 'name',
+                          'projectid', 'planned_hours', 'estimated_hours', 'completed_days', 'priority',
+                          'percent_complete', 'task_budget_cost', 'customer_name', 'calculated_finishes',
+                          'calculated_starts', 'start_date', 'currency']
+                         )
+
+
+# Build the Read command element for tasks, optionally of a single project
+def tasks_command(projectid=''):
+
+    return tasks_read(projectid).read()
+
+
+# Get auth info from server
+def get_whoami(key, un, pw, company):
 
     # Prepare the request
-    xml_data = [whoami_req]
+    xml_data = [WHOAMI_XML]
 
     return _call_wrapper(key, un, pw, company, xml_data)
 
@@ -49,10 +139,8 @@ def get_whoami(key, un, pw, company):
 # Get the time from the server
 def get_time(key, un, pw, company):
 
-    time_req = commands.Time().time()
-
     # Prepare the request
-    xml_data = [time_req]
+    xml_data = [TIME_XML]
 
     return _call_wrapper(key, un, pw, company, xml_data)
 
@@ -60,11 +148,8 @@ def get_time(key, un, pw, company):
 # Get a list of projects from the server
 def get_projects(key, un, pw, company='', userid = ''):
 
-    project = datatypes.Datatype('Project', {'active': '1'})
-    filter1 = commands.Read.Filter(None, None, project).getFilter()
-
     # Prepare the request
-    xml_data = [commands.Read('Project', 'equal to', {'limit': '1000'}, [filter1], None).read()]
+    xml_data = [projects_command()]
 
     return _call_wrapper(key, un, pw, company, xml_data)
 
@@ -72,23 +157,195 @@ def get_projects(key, un, pw, company='', userid = ''):
 # Get a list of tasks by project id from the server
 def get_tasks(key, un, pw, company='', projectid = ''):
 
-    # if filter(s) provided create an array of filters
-    filters = []
-    if projectid:
-        # Filter just tasks for the project that aren't closed
-        task = datatypes.Datatype('Projecttask', {'projectid': projectid, 'closed': '0'})
-        filter1 = commands.Read.Filter(None, None, task).getFilter()
-        filters.append(filter1)
-
     # Prepare the request
-    xml_data = [commands.Read('Projecttask',
-                              'equal to',
-                              {'limit': '500'},
-                              filters,
-                              ['id', 'parent_id', 'ancestry', 'cost_center_id', 'projecttask_type_id', 'name',
-                               'projectid', 'planned_hours', 'estimated_hours', 'completed_days', 'priority',
-                               'percent_complete', 'task_budget_cost', 'customer_name', 'calculated_finishes',
-                               'calculated_starts', 'start_date', 'currency']
-                              ).read()]
+    xml_data = [tasks_command(projectid)]
 
     return _call_wrapper(key, un, pw, company, xml_data)
+
+
+class ReadError(Exception):
+    """
+    Raised when the server answers a paged read with an error status.
+
+    Arguments:
+        status (str): the status attribute of the Read response
+        offset (int): the offset of the page that failed
+
+    """
+    def __init__(self, status, offset):
+        Exception.__init__(self, 'Read failed with status %s at offset %d' % (status, offset))
+        self.status = status
+        self.offset = offset
+
+
+def _read_page(key, un, pw, company, read, offset, count):
+    """
+    :return: list of the records of read from offset to offset + count, parsed incrementally by
+    utilities.iterrecords() straight from the decompressed response stream
+    """
+    xml_req = _request_xml(key, un, pw, company, [read.page(offset, count).read()])
+
+    def parse(stream):
+        return list(utilities.iterrecords(stream, read.type))
+
+    try:
+        return resilience.call(lambda: transport.post(xml_req, parse=parse), idempotent=True)
+    except utilities.ResponseError, err:
+        raise ReadError(err.status, offset)
+
+
+def read_pages(key, un, pw, company, read, page_size=commands.MAX_READ_LIMIT, parallel=1):
+    """
+    Generator yielding the records matched by read one page at a time, so that reads are no longer capped by the
+    limit attribute. Pages are requested with limit="offset,count" until a page comes back short.
+
+    :param read: a commands.Read, its own limit attribute is replaced on every page
+    :param page_size: number of records per page, at most commands.MAX_READ_LIMIT
+    :param parallel: number of page requests kept in flight, the pages are still yielded in order
+    :return: generator of lists of record dictionaries
+    """
+    page_size = min(page_size, commands.MAX_READ_LIMIT)
+
+    if parallel <= 1:
+        offset = 0
+        while True:
+            records = _read_page(key, un, pw, company, read, offset, page_size)
+            if records:
+                yield records
+            if len(records) < page_size:
+                return
+            offset += page_size
+
+    # imported here since client imports this module
+    from app.oaxmlapi import client
+
+    # request the pages parallel at a time, at most parallel - 1 of them past the last page are wasted. Client.map
+    # returns once every page of the group is answered, so no request is left running when the consumer stops early
+    # or a page fails. The groups reuse the client's threads, which are stopped once the pages are read or the
+    # generator is closed
+    def read_page(offset):
+        return _read_page(key, un, pw, company, read, offset, page_size)
+
+    with client.Client(key, un, pw, company, max_in_flight=parallel) as pages:
+        offset = 0
+        while True:
+            offsets = range(offset, offset + parallel * page_size, page_size)
+            for records in pages.map(read_page, offsets):
+                if records:
+                    yield records
+                if len(records) < page_size:
+                    return
+            offset += parallel * page_size
+
+
+# Iterate over every active project, paging past the 1000 records limit
+def iter_projects(key, un, pw, company='', page_size=commands.MAX_READ_LIMIT, parallel=1):
+
+    for records in read_pages(key, un, pw, company, projects_read(), page_size, parallel):
+        for record in records:
+            yield record
+
+
+# Iterate over every task, optionally of a single project, paging past the 500 records limit
+def iter_tasks(key, un, pw, company='', projectid='', page_size=commands.MAX_READ_LIMIT, parallel=1):
+
+    for records in read_pages(key, un, pw, company, tasks_read(projectid), page_size, parallel):
+        for record in records:
+            yield record
+
+
+def split_response(json_obj, xml_data):
+    """
+    Split the response to a batched request into one response per command.
+
+    :param json_obj: the response as returned by _call_wrapper
+    :param xml_data: the list of command elements that were sent
+    :return: list with, for each command in xml_data, a json object shaped like the response to that command sent on
+    its own, i.e. {'response': {'Auth': ..., '<command tag>': ...}}
+    """
+    response = json_obj.get('response', {}) if json_obj else {}
+
+    # repeated tags come back as a list in the order the commands were sent
+    seen = {}
+    results = []
+    for elem in xml_data:
+        tag = elem.tag
+        n = seen.get(tag, 0)
+        seen[tag] = n + 1
+
+        value = response.get(tag)
+        if isinstance(value, list):
+            value = value[n] if n < len(value) else None
+        elif n > 0:
+            value = None
+
+        results.append({'response': {'Auth': response.get('Auth'), tag: value}})
+    return results
+
+
+class Batch(object):
+    """
+    Accumulates Whoami, Time and Read commands and sends them to the server
+    in a single request envelope.
+
+    Arguments:
+        key (str): the NetSuite OpenAir API key
+        un (str): a username string
+        pw (str): a password string
+        company (str): a company string
+
+    """
+    def __init__(self, key, un, pw, company):
+        self.key = key
+        self.un = un
+        self.pw = pw
+        self.company = company
+        self.xml_data = []
+
+    def __str__(self):
+        return "Batch of %d commands" % len(self.xml_data)
+
+    def add(self, elem):
+        """
+        Add a command element and return its index in the results of send().
+
+        """
+        self.xml_data.append(elem)
+        return len(self.xml_data) - 1
+
+    def whoami(self):
+        return self.add(whoami_command(self.key, self.un, self.pw, self.company))
+
+    def time(self):
+        return self.add(time_command())
+
+    def projects(self):
+        return self.add(projects_command())
+
+    def tasks(self, projectid=''):
+        return self.add(tasks_command(projectid))
+
+    def send(self):
+        """
+        Send all commands in one round-trip and return the list of per-command
+        responses, see split_response().
+
+        """
+        if not self.xml_data:
+            return []
+
+        json_obj = _call_wrapper(self.key, self.un, self.pw, self.company, self.xml_data)
+        return split_response(json_obj, self.xml_data)
+
+
+# Get the active projects and the tasks of each of projectids in a single round-trip
+def get_projects_and_tasks(key, un, pw, company='', projectids=()):
+    """
+    :return: tuple (projects json object, {projectid: tasks json object})
+    """
+    batch = Batch(key, un, pw, company)
+    projects_index = batch.projects()
+    tasks_indexes = [(projectid, batch.tasks(projectid)) for projectid in projectids]
+
+    results = batch.send()
+    return results[projects_index], dict((projectid, results[index]) for projectid, index in tasks_indexes)
@@ -2,34 +2,23 @@
 # import modules from Python wrapper around the NetSuite OpenAir XML API
 from __future__ import absolute_import
 
-import urllib2
-
-import simplejson as json
-
-from app.oaxmlapi import utilities
+from app.oaxmlapi import resilience, transport, utilities
 
 try:
     import xml.etree.cElementTree as ET
 except ImportError:
     import xml.etree.ElementTree as ET
 
-def make_api_call(xml_req):
+def make_api_call(xml_req, idempotent=False):
 
-    req = urllib2.Request(url='https://www.openair.com/api.pl', data=xml_req)
-    # print 'Request url=%s' % req.get_full_url()
     # print 'Request req=%s' % xml_req
-    # print 'Request data=%s' % xml_data
 
-    # Perform the request
-    res = urllib2.urlopen(req, timeout=60)
-    xml_res = res.read()
+    # Perform the request over a pooled keep-alive connection, through the circuit breaker
+    xml_res = resilience.call(lambda: transport.post(xml_req), idempotent=idempotent)
     # print 'Response %s' % xml_res
 
-    # might be easier working with json data
-    json_string = utilities.xml2json(xml_res, strip=True)
-
-    # create a json object
-    json_obj = json.loads(json_string)
+    # parse straight into the dictionaries json.loads(xml2json()) used to produce
+    json_obj = utilities.xml2dict(xml_res, strip=True)
     # print "json_obj: {}".format(json_obj['response']['Auth']['@status'])
     return json_obj
 
@@ -110,5 +99,5 @@ def raw_call_wrapper(client ='Tempus Fugit', client_ver = '1.0', namespace = 'de
 
     xml_req = header + ET.tostring(request)
 
-    return make_api_call(xml_req)
+    return make_api_call(xml_req, idempotent=var_xml.tag in resilience.IDEMPOTENT_COMMANDS)
 
@@ -1,10 +1,61 @@
-<!-- hide script from old browsers
-        $(document).ready(function(){
-            $.ajax({url: "/prepare_data",
-                    context: document.body,
-                    success: function(){
-                        window.location.reload();
-                    }});
-        });
-
-// end hiding script form old browsers -->
\ No newline at end of file
+<!-- hide script from old browsers
+        // the table body showing the loader, replaced by the project rows once /prepare_data has built them
+        var projectRows = $('script[src$="data_loader.js"]').closest('tbody');
+
+        function loadProjectRows() {
+            // /prepare_data answers 202 while the aggregates are being built, ask again until they are ready
+            $.ajax({url: "/prepare_data",
+                    data: {wait: 25},
+                    dataType: "json",
+                    cache: false,
+                    success: function(data, textStatus, xhr){
+                        if (xhr.status == 202) {
+                            loadProjectRows();
+                            return;
+                        }
+                        rowsLoaded = true;
+                        projectRows.html(data.rows);
+                        projectRows.find("span.pie").peity("pie", {
+                            fill: ['#1ab394', '#d7d7d7', '#ffffff']
+                        });
+                    },
+                    error: function(){
+                        rowsLoaded = true;
+                        projectRows.html('<tr><td colspan="8"><em>Loading project data failed, please reload the page.</em></td></tr>');
+                    }});
+        }
+
+        // seconds between two looks at the progress of the build
+        var PROGRESS_POLL_SECONDS = 2;
+        var rowsLoaded = false;
+
+        function showProgress() {
+            // report the last phase the build finished, as /prepare_data/progress reads it from the cache
+            $.ajax({url: "/prepare_data/progress",
+                    dataType: "json",
+                    cache: false,
+                    success: function(progress){
+                        var phase = progress.phases[progress.phases.length - 1];
+                        if (phase) {
+                            var text = phase.phase;
+                            if (phase.total) {
+                                text += " " + phase.done + "/" + phase.total;
+                            } else if (phase.done !== null) {
+                                text += " (" + phase.done + ")";
+                            }
+                            text += " done after " + phase.elapsed + "s";
+                            $("#build_progress").text(text);
+                        }
+                        // a new build may not have started yet, look again until prepare_data answers the rows
+                        if (!rowsLoaded) {
+                            setTimeout(showProgress, PROGRESS_POLL_SECONDS * 1000);
+                        }
+                    }});
+        }
+
+        $(document).ready(function(){
+            loadProjectRows();
+            setTimeout(showProgress, PROGRESS_POLL_SECONDS * 1000);
+        });
+
+// end hiding script form old browsers -->
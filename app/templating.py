@@ -0,0 +1,56 @@
+#########################################################################################################################################
+# Jinja2 bytecode cache and template precompilation
+# a new instance otherwise parses and compiles each template on the first request that renders it
+import hashlib
+import logging
+import os
+import time
+
+from jinja2 import TemplateSyntaxError
+from jinja2.bccache import FileSystemBytecodeCache
+
+
+class BytecodeCache(FileSystemBytecodeCache):
+    """
+    FileSystemBytecodeCache usable on App Engine, whose file system is read only.
+
+    Entries are keyed by template name only, not by the absolute path of the template, so bytecode written by
+    template_benchmark.py precompile before deploying is found by the deployed app. The checksum of the template
+    source still invalidates an entry whenever its template changes. Failing to write an entry is not an error, the
+    template is simply compiled again by the next instance.
+    """
+    def get_cache_key(self, name, filename=None):
+        if isinstance(name, unicode):
+            name = name.encode('utf-8')
+        return hashlib.sha1(name).hexdigest()
+
+    def dump_bytecode(self, bucket):
+        filename = self._get_cache_filename(bucket)
+        # written aside and renamed so that a concurrent load never reads a partial entry
+        partial = '%s.%d' % (filename, os.getpid())
+        try:
+            with open(partial, 'wb') as f:
+                bucket.write_bytecode(f)
+            os.rename(partial, filename)
+        except (IOError, OSError), err:
+            logging.debug('templating: bytecode of %s not cached: %s', bucket.key, err)
+
+
+def precompile_templates(environment, extensions=('html',)):
+    """
+    Load every template of environment so it is compiled, and its bytecode cached, before a request renders it.
+
+    :param environment: a Jinja2 Environment, e.g. app.jinja_env
+    :param extensions: extensions of the templates to load
+    :return: tuple (names of the templates loaded, seconds taken)
+    """
+    start = time.time()
+    loaded = []
+    for name in environment.list_templates(extensions=extensions):
+        try:
+            environment.get_template(name)
+        except TemplateSyntaxError:
+            logging.exception('templating: %s does not compile', name)
+        else:
+            loaded.append(name)
+    return loaded, time.time() - start
@@ -0,0 +1,38 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+
+# timesheet, booking and rate rows of one associate, shaped like the models' to_dict()
+@pytest.fixture
+def rows():
+    return {
+        'projects': [{'id': 1, 'name': 'Apollo', 'budget': 1000.0, 'budget_time': 80.0, 'user_id': 7,
+                      'currency': 'USD', 'start_date': '01/01/2016', 'finish_date': '31/12/2016',
+                      'project_stage_id': 2, 'updated': '01/01/2016 10:00:00'}],
+        'users': [{'id': 7, 'name': 'Montoya, Inigo', 'nickname': 'inigo', 'timezone': '+00:00',
+                   'line_manager_id': None, 'department_id': 3, 'active': '1'}],
+        'tasks': [{'project_id': 1, 'project_name': 'Apollo', 'project_task_id': 10, 'project_task_name': 'Design',
+                   'user_id': 7, 'hour': 8.0},
+                  {'project_id': 1, 'project_name': 'Apollo', 'project_task_id': 10, 'project_task_name': 'Design',
+                   'user_id': 7, 'hour': 4.0},
+                  {'project_id': 2, 'project_name': 'Gemini', 'project_task_id': 20, 'project_task_name': 'Build',
+                   'user_id': 7, 'hour': 8.0}],
+        'tickets': [{'project_id': 1, 'project_name': 'Apollo', 'user_id': 7, 'total': 50.0}],
+        'bookings': [{'project_id': 1, 'project_task_id': 10, 'user_id': 7, 'hours': 30.0, 'percentage': 50},
+                     {'project_id': 1, 'project_task_id': 10, 'user_id': 7, 'hours': 10.0, 'percentage': 25},
+                     {'project_id': 1, 'project_task_id': 11, 'user_id': 7, 'hours': 16.0, 'percentage': None}],
+        'rates': [{'user_id': 7, 'project_id': 1, 'rate': 800.0, 'currency': 'USD'}]
+    }
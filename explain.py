@@ -0,0 +1,92 @@
+#########################################################################################################################################
+# EXPLAIN based check that the dashboard queries are served from indexes
+# every statement issued by the dashboard queries is captured and run again under EXPLAIN,
+# any access of type ALL on a real table is a full table scan. Only explain_test.py uses it, so it lives beside it
+# rather than in the app package
+from sqlalchemy import event
+
+from app.models import db
+from app.models.Booking import Booking
+from app.models.Daily import Daily
+from app.models.Project import Project
+from app.models.Task import Task
+from app.models.Ticket import Ticket
+
+# MySQL EXPLAIN access type for a full table scan
+FULL_TABLE_SCAN = 'ALL'
+
+
+def dashboard_queries(user_email):
+    """
+    Every per-user dashboard query, as (name, callable issuing it once). The *_rollups queries return lazy row
+    generators and are consumed so that their SQL actually runs.
+    User.query.all() and Rate.get_all_rates() read whole tables on purpose and are not included.
+    """
+    project_ids = Project.get_my_project_ids(user_email)
+    return [
+        ('Project.get_my_project_ids', lambda: Project.get_my_project_ids(user_email)),
+        ('Project.get_my_projects', lambda: Project.get_my_projects(user_email, project_ids)),
+        ('Task.get_my_tasks', lambda: Task.get_my_tasks(user_email, project_ids)),
+        ('Task.get_my_task_rollups', lambda: list(Task.get_my_task_rollups(user_email, project_ids))),
+        ('Ticket.get_my_tickets', lambda: Ticket.get_my_tickets(user_email, project_ids)),
+        ('Ticket.get_my_ticket_rollups', lambda: list(Ticket.get_my_ticket_rollups(user_email, project_ids))),
+        ('Booking.get_my_bookings', lambda: Booking.get_my_bookings(user_email, project_ids)),
+        ('Booking.get_my_booking_rollups', lambda: list(Booking.get_my_booking_rollups(user_email, project_ids))),
+        ('Daily.get_dailies', lambda: Daily.get_dailies('', '', user_email))
+    ]
+
+
+def dashboard_statements(user_email):
+    """
+    :return: list of (name, statements) with the statements captured while running each of dashboard_queries(),
+             a query whose list is empty never reached the database
+    """
+    return [(name, capture_statements(query)) for name, query in dashboard_queries(user_email)]
+
+
+def capture_statements(func, *args):
+    """
+    Call func(*args) and return the statements it sent to the database
+    :return: list of (engine, statement, parameters) as passed to the DBAPI cursor
+    """
+    engines = [db.get_engine(db.get_app()), db.get_engine(db.get_app(), bind='dailies')]
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((conn.engine, statement, parameters))
+
+    for engine in engines:
+        event.listen(engine, 'before_cursor_execute', capture)
+    try:
+        func(*args)
+    finally:
+        for engine in engines:
+            event.remove(engine, 'before_cursor_execute', capture)
+    return statements
+
+
+def explain(engine, statement, parameters):
+    """ Return the EXPLAIN rows of statement as dictionaries """
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute('EXPLAIN ' + statement, parameters)
+        columns = [column[0] for column in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+    finally:
+        connection.close()
+
+
+def full_table_scans(user_email):
+    """
+    :param user_email: an associate with a representative set of projects
+    :return: list of (table, statement) for every full table scan in the dashboard queries, empty if none
+    """
+    scans = []
+    for name, statements in dashboard_statements(user_email):
+        for engine, statement, parameters in statements:
+            for row in explain(engine, statement, parameters):
+                # <derivedN> and <unionM,N> are temporary tables built by the query itself
+                if row['type'] == FULL_TABLE_SCAN and row['table'] and not row['table'].startswith('<'):
+                    scans.append((row['table'], statement))
+    return scans
@@ -0,0 +1,39 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+
+import pytest
+
+# the check runs against the databases configured in instance/config.py, as this associate
+EXPLAIN_EMAIL = os.environ.get('TEMPUS_FUGIT_EXPLAIN_EMAIL')
+
+
+@pytest.mark.skipif(not EXPLAIN_EMAIL, reason='set TEMPUS_FUGIT_EXPLAIN_EMAIL to EXPLAIN the dashboard queries')
+def test_dashboard_queries_use_indexes():
+    from app import main
+    from explain import full_table_scans
+
+    with main.app.app_context():
+        assert full_table_scans(EXPLAIN_EMAIL) == []
+
+
+@pytest.mark.skipif(not EXPLAIN_EMAIL, reason='set TEMPUS_FUGIT_EXPLAIN_EMAIL to EXPLAIN the dashboard queries')
+def test_every_dashboard_query_is_captured():
+    from app import main
+    from explain import dashboard_statements
+
+    with main.app.app_context():
+        # a lazy query that is never consumed sends nothing and would silently escape the EXPLAIN check
+        assert [name for name, statements in dashboard_statements(EXPLAIN_EMAIL) if not statements] == []
@@ -12,6 +12,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import json
+
 import pytest
 
 
@@ -36,3 +38,116 @@ def test_submitted_form(app):
         'comments': ''})
     assert r.status_code == 200
     assert 'Inigo Montoya' in r.data.decode('utf-8')
+
+
+def test_api_projects_etag(app, rows):
+    from app import aggregate_cache
+    from app.aggregation import build_aggregates, build_views
+
+    email = 'pm@example.com'
+    aggregates = build_aggregates(email, **rows)
+    aggregate_cache.set_aggregates(email, *aggregates, views=build_views(email, *aggregates))
+    with app.session_transaction() as session:
+        session['username'] = email
+        session['logged_in'] = True
+
+    r = app.get('/api/projects')
+    assert r.status_code == 200
+    assert [project['name'] for project in json.loads(r.data)['projects']] == ['Apollo', 'Gemini']
+
+    etag = r.headers['ETag']
+    assert app.get('/api/projects', headers={'If-None-Match': etag}).status_code == 304
+    assert app.get('/api/projects/1/tasks/10', headers={'If-None-Match': etag}).status_code == 304
+    assert json.loads(app.get('/api/projects/1').data)['tasks'] == [{'id': 10, 'name': 'Design'}]
+    assert app.get('/api/projects/404').status_code == 404
+    # a matching ETag does not hide a missing resource
+    assert app.get('/api/projects/404', headers={'If-None-Match': etag}).status_code == 404
+    assert app.get('/api/projects/1/tasks/12', headers={'If-None-Match': etag}).status_code == 404
+
+    aggregate_cache.clear_aggregates(email)
+
+
+def test_prepare_data_returns_rows(app, rows):
+    from app import aggregate_cache
+    from app.aggregation import build_aggregates, build_views
+
+    email = 'pm@example.com'
+    aggregates = build_aggregates(email, **rows)
+    aggregate_cache.set_aggregates(email, *aggregates, views=build_views(email, *aggregates))
+    with app.session_transaction() as session:
+        session['username'] = email
+        session['logged_in'] = True
+
+    r = app.get('/prepare_data')
+    assert r.status_code == 200
+    data = json.loads(r.data)
+    assert data['status'] == aggregate_cache.STATUS_CACHED
+    assert 'Apollo' in data['rows'] and '<html' not in data['rows']
+
+    aggregate_cache.clear_aggregates(email)
+
+
+def test_index_refreshes_only_stale_aggregates(app, rows):
+    from app import aggregate_cache
+    from app.aggregation import build_aggregates, build_views
+
+    email = 'pm@example.com'
+    aggregates = build_aggregates(email, **rows)
+    entry = aggregate_cache.set_aggregates(email, *aggregates, views=build_views(email, *aggregates))
+    with app.session_transaction() as session:
+        session['username'] = email
+        session['logged_in'] = True
+
+    assert '/prepare_data?refresh=1' not in app.get('/index.html').data.decode('utf-8')
+
+    entry['built_at'] -= aggregate_cache.AGGREGATE_SOFT_TIMEOUT + 1
+    aggregate_cache.cache.set(aggregate_cache.cache_key(email), entry)
+    assert '/prepare_data?refresh=1' in app.get('/index.html').data.decode('utf-8')
+
+    aggregate_cache.clear_aggregates(email)
+
+
+def test_prepare_progress(app, rows):
+    from app import aggregate_cache
+    from app.aggregation import build_aggregates
+
+    email = 'pm@example.com'
+    aggregate_cache.cache.delete(aggregate_cache.progress_key(email))
+    with app.session_transaction() as session:
+        session['username'] = email
+        session['logged_in'] = True
+
+    assert json.loads(app.get('/prepare_data/progress').data) == {'status': 'idle', 'phases': []}
+
+    def build():
+        aggregate_cache.report(email, 'projects', 1)
+        return build_aggregates(email, **rows)
+
+    aggregate_cache.clear_aggregates(email)
+    aggregate_cache.start_build(email, build)
+    data = json.loads(app.get('/prepare_data/progress').data)
+    assert data['status'] == aggregate_cache.PROGRESS_DONE
+    assert [phase['phase'] for phase in data['phases']] == ['projects']
+
+    aggregate_cache.clear_aggregates(email)
+
+
+def test_index_loader_and_pies_share_one_jquery(app):
+    from app import aggregate_cache
+
+    email = 'pm@example.com'
+    aggregate_cache.clear_aggregates(email)
+    with app.session_transaction() as session:
+        session['username'] = email
+        session['logged_in'] = True
+
+    # without cached rows the page loads them asynchronously and data_loader.js draws their pies with peity, which
+    # only extends the jQuery copy loaded before it
+    html = app.get('/index.html').data.decode('utf-8')
+    assert html.count('js/jquery-2.1.1.js') == 1
+    assert html.index('js/jquery-2.1.1.js') < html.index('js/data_loader.js') < html.index('jquery.peity.min.js')
+
+
+def test_warmup(app):
+    r = app.get('/_ah/warmup')
+    assert r.status_code == 200
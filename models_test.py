@@ -0,0 +1,129 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import datetime
+
+import pytest
+from flask import Flask
+
+from app.models import bind_id_list, cached_converter, db, row_class
+from app.models.Booking import Booking
+
+BOOKING_ROWS = [
+    {'id': 1, 'user_id': 7, 'project_id': 1, 'startdate': datetime.date(2016, 1, 4), 'hours': 30.0,
+     'project_task_name': 'Design'},
+    {'id': 2, 'user_id': 7, 'project_id': 2, 'startdate': datetime.date(2016, 1, 4), 'hours': None,
+     'project_task_name': 'Build'},
+    {'id': 3, 'user_id': 8, 'project_id': 3, 'startdate': None, 'hours': 8.0, 'project_task_name': 'Test'},
+]
+
+
+@pytest.fixture
+def database():
+    app = Flask(__name__)
+    # detect_types returns DATE columns as dates, as MySQLdb does
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:?detect_types=1'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    with app.app_context():
+        Booking.__table__.create(db.engine)
+        db.session.execute(Booking.__table__.insert(), BOOKING_ROWS)
+        yield db
+        db.session.remove()
+        Booking.__table__.drop(db.engine)
+
+
+def test_bind_id_list():
+    assert bind_id_list('pid', [1, 2]) == ('(:pid_0, :pid_1)', {'pid_0': 1, 'pid_1': 2})
+    assert bind_id_list('pid', iter([5])) == ('(:pid_0)', {'pid_0': 5})
+    # IN (NULL) matches nothing
+    assert bind_id_list('pid', []) == ('(NULL)', {})
+
+
+def test_fetch_rows(database):
+    in_project_ids, params = bind_id_list('pid', [1, 2, 4])
+    query = ('SELECT id, startdate, hours, project_task_name, hours * 2 AS doubled FROM booking '
+             'WHERE project_id IN %s ORDER BY id' % in_project_ids)
+
+    for stream in (False, True):
+        rows = list(Booking.fetch_rows(query, params, stream=stream))
+
+        assert [row.id for row in rows] == [1, 2]
+        # model columns are converted as in to_dict(), others are left as they are
+        assert rows[0]['startdate'] == '04/01/2016'
+        assert rows[0].hours == 30.0 and rows[1].hours is None
+        assert rows[0]['project_task_name'] == 'Design'
+        assert rows[0].doubled == 60.0
+        assert rows[0] == (1, '04/01/2016', 30.0, 'Design', 60.0)
+
+
+def test_streamed_rows_are_read_one_query_at_a_time(database):
+    query = 'SELECT id FROM booking ORDER BY id'
+
+    streamed = Booking.fetch_rows(query, stream=True)
+    assert next(streamed).id == 1
+    # the connection's only server side cursor is still reading the first query
+    with pytest.raises(RuntimeError):
+        next(Booking.fetch_rows(query))
+
+    assert [row.id for row in streamed] == [2, 3]
+    assert [row.id for row in Booking.fetch_rows(query)] == [1, 2, 3]
+
+    # closing a generator early frees the connection as well
+    streamed = Booking.fetch_rows(query, stream=True)
+    next(streamed)
+    streamed.close()
+    assert len(list(Booking.fetch_rows(query, stream=True))) == 3
+
+
+def test_row_class():
+    Row = row_class(['id', 'name'])
+    row = Row(1, 'Apollo')
+
+    assert row_class(('id', 'name')) is Row
+    assert row_class(['name', 'id']) is not Row
+    assert (row.id, row['name'], row[0]) == (1, 'Apollo', 1)
+    assert dict(zip(row._fields, row)) == {'id': 1, 'name': 'Apollo'}
+    with pytest.raises(AttributeError):
+        row['missing']
+
+
+def test_cached_converter_formats_each_value_once(monkeypatch):
+    import app.models
+
+    calls = []
+
+    def format_date(val):
+        calls.append(val)
+        return val.strftime(app.models.DATE_FORMAT)
+    monkeypatch.setattr(app.models, '_format_date', format_date)
+
+    convert = cached_converter(format_date)
+    day = datetime.date(2016, 1, 4)
+    assert [convert(day), convert(day), convert(datetime.date(2016, 1, 5))] == [
+        '04/01/2016', '04/01/2016', '05/01/2016']
+    assert calls == [day, datetime.date(2016, 1, 5)]
+
+    # other converters are returned as they are
+    assert cached_converter(float) is float
+
+
+def test_to_dicts_matches_to_dict():
+    bookings = [Booking(**row) for row in BOOKING_ROWS]
+
+    assert Booking.to_dicts(bookings) == [booking.to_dict() for booking in bookings]
+    first = Booking.to_dicts(bookings)[0]
+    assert (first['startdate'], first['hours'], first['enddate']) == ('04/01/2016', 30.0, None)
+    # the converters of a model are compiled once
+    assert Booking.dict_converters() is Booking.dict_converters()
@@ -0,0 +1,191 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# benchmarks of app.oaxmlapi, all of them run offline
+#   python oaxmlapi_benchmark.py parse [--size MB]
+#       times utilities.elem2dict against the former recursive implementation on a synthetic Projecttask Read response
+#   OPENAIR_PASSWORD=... python oaxmlapi_benchmark.py record <cassette> --key K --company C --user U [--projectid P]
+#       records login, get_projects and get_tasks against openair.com into a cassette (the only online step)
+#   python oaxmlapi_benchmark.py api <cassette> [--scale 10] [--latency S] [--calls N] [--concurrency N]
+#       times login, get_projects and get_tasks against a local stand-in replaying the cassette
+import argparse
+import os
+import threading
+import time
+import timeit
+
+from app.oaxmlapi import standin, transport, utilities, wrapper
+from app.oaxmlapi.utilities import ET
+
+TASK = ('<Projecttask><id>{0}</id><parent_id>{1}</parent_id><name> Task {0} </name><projectid>{2}</projectid>'
+        '<planned_hours>40.00</planned_hours><estimated_hours>38.50</estimated_hours><priority>1</priority>'
+        '<percent_complete>25</percent_complete><task_budget_cost>1000.00</task_budget_cost>'
+        '<customer_name>Customer {2}</customer_name><start_date><Date><year>2016</year><month>09</month>'
+        '<day>01</day></Date></start_date><currency>GBP</currency><notes/></Projecttask>')
+
+
+def recursive_elem2dict(elem, strip=True):
+    """ utilities.elem2dict as it was before it became iterative, the baseline of the benchmark """
+    d = {}
+    for key, value in elem.attrib.items():
+        d['@'+key] = value
+
+    for subelem in elem:
+        v = recursive_elem2dict(subelem, strip=strip)
+        tag = subelem.tag
+        value = v[tag]
+        try:
+            d[tag].append(value)
+        except AttributeError:
+            d[tag] = [d[tag], value]
+        except KeyError:
+            d[tag] = value
+    text = elem.text
+    tail = elem.tail
+    if strip:
+        if text:
+            text = text.strip()
+        if tail:
+            tail = tail.strip()
+
+    if tail:
+        d['#tail'] = tail
+
+    if d:
+        if text:
+            d["#text"] = text
+    else:
+        d = text or None
+
+    return {elem.tag: d}
+
+
+def projecttask_response(size):
+    """ Return a Read response of Projecttask records about size bytes long """
+    tasks = []
+    length = 0
+    while length < size:
+        task = TASK.format(len(tasks), len(tasks) // 10, len(tasks) // 100)
+        tasks.append(task)
+        length += len(task)
+    return '<response><Auth status="0"/><Read status="0">%s</Read></response>' % ''.join(tasks), len(tasks)
+
+
+def parse_benchmark(size_mb=10.0, repeat=3):
+    xml_res, count = projecttask_response(int(size_mb * 1024 * 1024))
+    elem = ET.fromstring(xml_res)
+    assert utilities.elem2dict(elem) == recursive_elem2dict(elem)
+
+    print 'Projecttask response: %.1f MB, %d records, best of %d' % (len(xml_res) / 1048576.0, count, repeat)
+    for name, func in (('recursive elem2dict', lambda: recursive_elem2dict(elem)),
+                       ('iterative elem2dict', lambda: utilities.elem2dict(elem)),
+                       ('iterative elem2dict, READ_LIST_SCHEMA',
+                        lambda: utilities.elem2dict(elem, schema=utilities.READ_LIST_SCHEMA)),
+                       ('ET.fromstring + iterative elem2dict', lambda: utilities.xml2dict(xml_res)),
+                       ('iterrecords (parses as it goes)', lambda: list(utilities.iterrecords(xml_res, 'Projecttask')))):
+        print '%-40s %.3fs' % (name, min(timeit.repeat(func, number=1, repeat=repeat)))
+
+
+def api_calls(projectid):
+    """ Return the benchmarked calls as (name, func(key, un, pw, company)) """
+    return (('login', wrapper.get_whoami),
+            ('get_projects', wrapper.get_projects),
+            ('get_tasks', lambda key, un, pw, company: wrapper.get_tasks(key, un, pw, company, projectid)))
+
+
+def record(cassette, key, company, user, password, projectid=''):
+    transport.record(cassette)
+    for name, func in api_calls(projectid):
+        func(key, user, password, company)
+        print 'recorded %s' % name
+    transport.record(None)
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def api_benchmark(cassette, scale=10, latency=0.0, calls=50, concurrency=4, projectid=''):
+    app = standin.StandIn(cassette, latency=latency, scale=scale)
+    server, url = standin.serve(app)
+    transport.configure(url=url)
+
+    print '%s, %d calls each on %d threads' % (app, calls, concurrency)
+    print '%-14s %10s %10s %10s' % ('', 'calls/s', 'p50 ms', 'p95 ms')
+    for name, func in api_calls(projectid):
+        timings = []
+        pending = iter(range(calls))
+        lock = threading.Lock()
+
+        def work():
+            while True:
+                with lock:
+                    if next(pending, None) is None:
+                        return
+                start = time.time()
+                func('key', 'user', 'password', 'company')
+                timings.append(time.time() - start)
+
+        start = time.time()
+        workers = [threading.Thread(target=work) for _ in range(concurrency)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.time() - start
+
+        print '%-14s %10.1f %10.1f %10.1f' % (name, len(timings) / elapsed, percentile(timings, 0.5) * 1000,
+                                             percentile(timings, 0.95) * 1000)
+
+    if app.stats['misses']:
+        print 'warning: %d requests were not in the cassette and got empty responses' % app.stats['misses']
+    transport.pool.clear()
+    server.shutdown()
+    server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='app.oaxmlapi benchmarks')
+    commands = parser.add_subparsers(dest='command')
+
+    parse = commands.add_parser('parse', help='time the response parsing')
+    parse.add_argument('--size', type=float, default=10.0, help='size of the response in MB')
+
+    rec = commands.add_parser('record', help='record a cassette against openair.com')
+    rec.add_argument('cassette')
+    rec.add_argument('--key', required=True)
+    rec.add_argument('--company', required=True)
+    rec.add_argument('--user', required=True)
+    rec.add_argument('--projectid', default='')
+
+    api = commands.add_parser('api', help='time the API calls against a stand-in replaying a cassette')
+    api.add_argument('cassette')
+    api.add_argument('--scale', type=int, default=10, help='times the recorded records are repeated')
+    api.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+    api.add_argument('--calls', type=int, default=50)
+    api.add_argument('--concurrency', type=int, default=4)
+    api.add_argument('--projectid', default='')
+
+    args = parser.parse_args()
+    if args.command == 'parse':
+        parse_benchmark(args.size)
+    elif args.command == 'record':
+        record(args.cassette, args.key, args.company, args.user, os.environ['OPENAIR_PASSWORD'], args.projectid)
+    else:
+        api_benchmark(args.cassette, args.scale, args.latency, args.calls, args.concurrency, args.projectid)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,540 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import BaseHTTPServer
+import gzip
+import re
+import StringIO
+import SocketServer
+import threading
+
+import pytest
+
+from app.oaxmlapi import transport
+
+TIME_RESPONSE = '<?xml version="1.0" standalone="yes"?><response><Time status="0"><Date><year>2016</year></Date></Time></response>'
+
+
+class StandInHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """ Answers every POST with TIME_RESPONSE over a keep-alive connection """
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/xml')
+        self.send_header('Content-Length', str(len(TIME_RESPONSE)))
+        self.end_headers()
+        self.wfile.write(TIME_RESPONSE)
+
+    def log_message(self, *args):
+        pass
+
+
+TASK_COUNT = 7
+
+
+def gzip_bytes(data):
+    out = StringIO.StringIO()
+    with gzip.GzipFile(fileobj=out, mode='wb') as f:
+        f.write(data)
+    return out.getvalue()
+
+
+class PagingHandler(StandInHandler):
+    """ Answers reads of Projecttask with the page of TASK_COUNT tasks selected by limit="offset,count" """
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        offset, count = [int(n) for n in re.search(r'limit="(\d+),(\d+)"', body).groups()]
+        tasks = ''.join('<Projecttask><id>%d</id></Projecttask>' % i
+                        for i in range(offset, min(offset + count, TASK_COUNT)))
+        res = '<response><Auth status="0"/><Read status="0">%s</Read></response>' % tasks
+
+        self.send_response(200)
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            res = gzip_bytes(res)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(res)))
+        self.end_headers()
+        self.wfile.write(res)
+
+
+class ThreadingServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """ Serves each keep-alive connection on its own thread so parallel requests do not queue """
+    daemon_threads = True
+
+
+def serve(handler):
+    server = ThreadingServer(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+@pytest.fixture
+def api_url():
+    server = serve(StandInHandler)
+    yield 'http://127.0.0.1:%d/api.pl' % server.server_port
+    server.shutdown()
+    server.server_close()
+
+
+def test_pool_reuses_connections(api_url):
+    pool = transport.ConnectionPool()
+    for _ in range(3):
+        assert pool.post(api_url, '<request/>') == TIME_RESPONSE
+
+    assert pool.stats['connections'] == 1
+    assert pool.stats['reused'] == 2
+
+
+def test_pool_evicts_idle_connections(api_url):
+    pool = transport.ConnectionPool(idle_timeout=-1)
+    pool.post(api_url, '<request/>')
+    pool.post(api_url, '<request/>')
+
+    assert pool.stats['connections'] == 2
+    assert pool.stats['reused'] == 0
+
+
+def test_split_batched_response():
+    from app.oaxmlapi import utilities, wrapper
+
+    xml_data = [wrapper.time_command(), wrapper.tasks_command('1'), wrapper.tasks_command('2')]
+    xml_res = ('<response><Auth status="0"/><Time status="0"><Date><year>2016</year></Date></Time>'
+               '<Read status="0"><Projecttask><id>10</id></Projecttask></Read>'
+               '<Read status="0"><Projecttask><id>20</id></Projecttask></Read></response>')
+
+    time_res, tasks1_res, tasks2_res = wrapper.split_response(utilities.xml2dict(xml_res), xml_data)
+
+    assert time_res['response']['Time']['Date']['year'] == '2016'
+    assert tasks1_res['response']['Read']['Projecttask']['id'] == '10'
+    assert tasks2_res['response']['Read']['Projecttask']['id'] == '20'
+    assert tasks2_res['response']['Auth'] == {'@status': '0'}
+
+
+def test_iterrecords_matches_xml2json():
+    import json
+    from app.oaxmlapi import utilities
+
+    xml_res = ('<response><Auth status="0"/><Read status="0">'
+               '<Project><id>1</id><name> Alpha </name></Project>'
+               '<Project><id>2</id><name>Beta</name><notes/></Project></Read></response>')
+
+    records = list(utilities.iterrecords(xml_res, 'Project'))
+
+    assert records == json.loads(utilities.xml2json(xml_res))['response']['Read']['Project']
+    assert utilities.xml2dict(xml_res) == json.loads(utilities.xml2json(xml_res))
+
+    with pytest.raises(utilities.ResponseError):
+        list(utilities.iterrecords('<response><Auth status="401"/><Read status="0"/></response>', 'Project'))
+
+
+def test_stream2dict_matches_xml2dict():
+    from app.oaxmlapi import utilities
+
+    xml_res = ('<response><Auth status="0"/><Read status="0">'
+               '<Project><id>1</id><name> Alpha </name><notes>a <b>bold</b> tail </notes></Project>'
+               '<Project><id>2</id><name>Beta</name><notes/></Project></Read>'
+               '<Read status="0"><Projecttask><id>10</id></Projecttask></Read></response>')
+
+    for strip in (True, False):
+        assert utilities.stream2dict(xml_res, strip=strip) == utilities.xml2dict(xml_res, strip=strip)
+    schema = utilities.READ_LIST_SCHEMA
+    assert utilities.stream2dict(xml_res, schema=schema) == utilities.xml2dict(xml_res, schema=schema)
+
+
+def test_elem2dict_schema():
+    from app.oaxmlapi import utilities
+
+    one = '<response><Read status="0"><Project><id>1</id></Project></Read></response>'
+    two = '<response><Read status="0"><Project><id>1</id></Project><Project><id>2</id></Project></Read></response>'
+
+    # without a schema the shape depends on the number of records
+    assert utilities.xml2dict(one)['response']['Read']['Project'] == {'id': '1'}
+    assert utilities.xml2dict(two)['response']['Read']['Project'] == [{'id': '1'}, {'id': '2'}]
+
+    schema = utilities.READ_LIST_SCHEMA
+    assert utilities.xml2dict(one, schema=schema)['response']['Read']['Project'] == [{'id': '1'}]
+    assert utilities.xml2dict(two, schema=schema)['response']['Read']['Project'] == [{'id': '1'}, {'id': '2'}]
+
+
+@pytest.fixture
+def paging_api_url():
+    server = serve(PagingHandler)
+    url = 'http://127.0.0.1:%d/api.pl' % server.server_port
+    previous_url = transport.api_url
+    transport.configure(url=url)
+    yield url
+    transport.configure(url=previous_url)
+    server.shutdown()
+    server.server_close()
+
+
+def test_read_pages(paging_api_url):
+    from app.oaxmlapi import wrapper
+
+    for parallel in (1, 3):
+        pages = list(wrapper.read_pages('key', 'un', 'pw', 'company', wrapper.tasks_read(), page_size=3,
+                                        parallel=parallel))
+
+        assert [len(page) for page in pages] == [3, 3, 1]
+        assert [task['id'] for page in pages for task in page] == [str(i) for i in range(TASK_COUNT)]
+
+
+class FailingPagingHandler(StandInHandler):
+    """ Answers pages from offset 3 on with an error status, recording the offsets asked """
+    offsets = []
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        offset = int(re.search(r'limit="(\d+),\d+"', body).group(1))
+        FailingPagingHandler.offsets.append(offset)
+        status = '0' if offset < 3 else '602'
+        res = ('<response><Auth status="0"/><Read status="%s"><Projecttask><id>%d</id></Projecttask></Read>'
+               '</response>' % (status, offset))
+
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(res)))
+        self.end_headers()
+        self.wfile.write(res)
+
+
+def test_read_pages_leaves_no_request_running():
+    from app.oaxmlapi import wrapper
+
+    server = serve(FailingPagingHandler)
+    previous_url = transport.api_url
+    transport.configure(url='http://127.0.0.1:%d/api.pl' % server.server_port)
+    try:
+        # the consumer stops after the first page, the other pages of its group have been answered by then
+        del FailingPagingHandler.offsets[:]
+        pages = wrapper.read_pages('key', 'un', 'pw', 'company', wrapper.tasks_read(), page_size=1, parallel=3)
+        assert next(pages) == [{'id': '0'}]
+        pages.close()
+        assert sorted(FailingPagingHandler.offsets) == [0, 1, 2]
+
+        # a failing page is raised once every page of its group is answered
+        del FailingPagingHandler.offsets[:]
+        with pytest.raises(wrapper.ReadError) as err:
+            list(wrapper.read_pages('key', 'un', 'pw', 'company', wrapper.tasks_read(), page_size=1, parallel=3))
+        assert err.value.offset == 3
+        assert sorted(FailingPagingHandler.offsets) == [0, 1, 2, 3, 4, 5]
+    finally:
+        transport.configure(url=previous_url)
+        server.shutdown()
+        server.server_close()
+
+
+def test_client_keeps_submission_order(paging_api_url):
+    from app.oaxmlapi import client, wrapper
+
+    # one request per page, answered concurrently but returned in order
+    reads = [wrapper.tasks_read().page(offset, 1).read() for offset in range(TASK_COUNT)]
+    with client.Client('key', 'un', 'pw', 'company', max_in_flight=3) as tasks:
+        results = tasks.read(reads)
+
+    assert [res['response']['Read']['Projecttask']['id'] for res in results] == [str(i) for i in range(TASK_COUNT)]
+
+
+def test_client_reuses_its_workers():
+    import threading
+    from app.oaxmlapi import client
+
+    def worker_name(_):
+        return threading.current_thread().ident
+
+    pool = client.Client('key', 'un', 'pw', 'company', max_in_flight=2, rate=None)
+    first = set(pool.map(worker_name, range(6)))
+    second = set(pool.map(worker_name, range(6)))
+    assert first | second <= set(worker.ident for worker in pool._workers)
+    assert len(pool._workers) == 2
+    assert pool.map(worker_name, []) == []
+
+    with pytest.raises(ValueError):
+        pool.map(int, ['1', 'x', '3'])
+    # a failed call leaves the workers usable
+    assert pool.map(int, ['1', '2']) == [1, 2]
+
+    workers = pool._workers
+    pool.close()
+    assert not pool._workers and not any(worker.is_alive() for worker in workers)
+
+
+def test_rate_limiter_is_shared_per_rate():
+    from app.oaxmlapi import client
+
+    limiter = client.rate_limiter('shared company', 5)
+    assert client.rate_limiter('shared company', 5.0) is limiter
+    # another rate gets a limiter of its own and leaves the shared one as it is
+    assert client.rate_limiter('shared company', 2).rate == 2
+    assert client.rate_limiter('shared company', 5) is limiter
+    assert client.rate_limiter('shared company', None) is None
+
+
+def test_rate_limiter():
+    import time
+    from app.oaxmlapi import client
+
+    limiter = client.RateLimiter(20, burst=1)
+    start = time.time()
+    for _ in range(5):
+        limiter.acquire()
+
+    assert time.time() - start >= 0.19
+
+
+def test_request_template_matches_request():
+    from app.oaxmlapi import commands, connections, wrapper
+
+    app = connections.Application('Tempus Fugit', '1.0', 'default', 'k&y')
+    auth = connections.Auth('<company>', 'user@example.com', 'p"w&')
+    xml_data = [commands.Time().time(), wrapper.tasks_command('1')]
+
+    template = connections.RequestTemplate(app, auth)
+
+    assert template.tostring(xml_data) == connections.Request(app, auth, xml_data).tostring()
+    assert template.tostring([wrapper.WHOAMI_XML]) == connections.Request(app, auth, [
+        connections.Whoami(None).whoami()]).tostring()
+
+
+def test_request_templates_keyed_by_digest(monkeypatch):
+    from app.oaxmlapi import wrapper
+
+    monkeypatch.setattr(wrapper, '_templates', {})
+    template = wrapper._request_template('key', 'un', 's3cret', 'company')
+
+    assert wrapper._request_template('key', 'un', 's3cret', 'company') is template
+    assert wrapper._request_template('key', 'un', 'other', 'company') is not template
+    assert not [cache_key for cache_key in wrapper._templates if 's3cret' in cache_key]
+
+    # an expired envelope is built again
+    monkeypatch.setattr(wrapper, 'TEMPLATE_TIMEOUT', 0)
+    wrapper._templates.clear()
+    template = wrapper._request_template('key', 'un', 's3cret', 'company')
+    assert wrapper._request_template('key', 'un', 's3cret', 'company') is not template
+
+
+def test_circuit_breaker_opens_and_recovers():
+    from app.oaxmlapi import resilience
+
+    breaker = resilience.CircuitBreaker(window=4, min_calls=4, error_rate=0.5, reset_timeout=0)
+    for success in (True, False, True, False):
+        assert breaker.allow()
+        breaker.record(success)
+    assert breaker.state == resilience.OPEN
+
+    # after reset_timeout a single trial call goes through
+    assert breaker.allow()
+    assert breaker.state == resilience.HALF_OPEN
+    assert not breaker.allow()
+    breaker.record(True)
+    assert breaker.state == resilience.CLOSED
+
+
+def test_call_retries_idempotent_requests(monkeypatch):
+    import errno
+    import socket
+    from app.oaxmlapi import resilience
+
+    monkeypatch.setattr(resilience, 'breaker', resilience.CircuitBreaker(min_calls=100))
+    monkeypatch.setattr(resilience, 'backoff', 0)
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise socket.error(errno.ECONNREFUSED, 'refused')
+        return 'ok'
+
+    assert resilience.call(flaky, idempotent=True) == 'ok'
+    assert len(attempts) == 3
+
+    del attempts[:]
+    with pytest.raises(socket.error):
+        resilience.call(flaky, idempotent=False)
+    assert len(attempts) == 1
+
+
+def test_call_does_not_retry_timeouts_or_past_budget(monkeypatch):
+    import errno
+    import socket
+    from app.oaxmlapi import resilience
+
+    monkeypatch.setattr(resilience, 'breaker', resilience.CircuitBreaker(min_calls=100))
+    attempts = []
+
+    def timing_out():
+        attempts.append(1)
+        raise socket.timeout('timed out')
+
+    with pytest.raises(socket.timeout):
+        resilience.call(timing_out, idempotent=True)
+    assert len(attempts) == 1
+
+    def refused():
+        attempts.append(1)
+        raise socket.error(errno.ECONNREFUSED, 'refused')
+
+    del attempts[:]
+    monkeypatch.setattr(resilience, 'budget', 0)
+    with pytest.raises(socket.error):
+        resilience.call(refused, idempotent=True)
+    assert len(attempts) == 1
+
+
+def test_interrupted_trial_call_frees_the_breaker(monkeypatch):
+    from app.oaxmlapi import resilience
+
+    class DeadlineExceededError(BaseException):
+        pass
+
+    breaker = resilience.CircuitBreaker(window=1, min_calls=1, reset_timeout=0)
+    breaker.record(False)
+    monkeypatch.setattr(resilience, 'breaker', breaker)
+
+    def deadline():
+        raise DeadlineExceededError()
+
+    # the half open trial call is interrupted, the breaker opens again instead of staying half open
+    with pytest.raises(DeadlineExceededError):
+        resilience.call(deadline)
+    assert breaker.state == resilience.OPEN
+    assert resilience.call(lambda: 'ok') == 'ok'
+    assert breaker.state == resilience.CLOSED
+
+
+def test_gzip_responses_are_decoded(paging_api_url):
+    from app.oaxmlapi import wrapper
+
+    stats = dict(transport.pool.stats)
+    records = [task for page in wrapper.read_pages('key', 'un', 'pw', 'company', wrapper.tasks_read(), page_size=100)
+               for task in page]
+
+    assert [task['id'] for task in records] == [str(i) for i in range(TASK_COUNT)]
+    received = transport.pool.stats['bytes_received'] - stats['bytes_received']
+    decoded = transport.pool.stats['bytes_decoded'] - stats['bytes_decoded']
+    assert 0 < received < decoded
+
+
+def test_decoding_reader_raw_deflate():
+    import zlib
+
+    class Response(object):
+        def __init__(self, data):
+            self.data = StringIO.StringIO(data)
+
+        def getheader(self, name):
+            return 'deflate'
+
+        def read(self, size):
+            return self.data.read(size)
+
+    xml_res = '<response>%s</response>' % ('<Projecttask><id>1</id></Projecttask>' * 1000)
+    raw = zlib.compressobj(9, zlib.DEFLATED, -zlib.MAX_WBITS)
+    raw_deflate = raw.compress(xml_res) + raw.flush()
+
+    assert transport.DecodingReader(Response(zlib.compress(xml_res))).read() == xml_res
+    reader = transport.DecodingReader(Response(raw_deflate))
+    assert reader.read(10) + reader.read() == xml_res
+
+
+def test_record_and_replay(paging_api_url, tmpdir):
+    from app.oaxmlapi import standin, wrapper
+
+    cassette = str(tmpdir.join('cassette.jsonl'))
+    transport.record(cassette)
+    try:
+        recorded = list(wrapper.iter_tasks('key', 'un', 's3cret', 'company', page_size=100))
+    finally:
+        transport.record(None)
+    assert 's3cret' not in open(cassette).read()
+
+    app = standin.StandIn(cassette, scale=2)
+    server, url = standin.serve(app)
+    transport.configure(url=url)
+    try:
+        replayed = list(wrapper.iter_tasks('key', 'un', 'pw', 'company', page_size=100))
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    recorded_ids = [task['id'] for task in recorded]
+    max_id = max(int(task_id) for task_id in recorded_ids)
+    replayed_ids = [task['id'] for task in replayed]
+    assert replayed_ids == recorded_ids + [str(int(task_id) + max_id + 1) for task_id in recorded_ids]
+    assert len(set(replayed_ids)) == len(replayed_ids)
+    assert app.stats == {'requests': 1, 'misses': 0}
+
+
+class SlowHandler(StandInHandler):
+    """ Answers the first request and then stalls, counting the requests received """
+    requests = []
+
+    def do_POST(self):
+        self.requests.append(1)
+        if len(self.requests) > 1:
+            self.rfile.read(int(self.headers['Content-Length']))
+            threading.Event().wait(0.5)
+            return
+        StandInHandler.do_POST(self)
+
+
+def test_pool_does_not_resend_timed_out_requests():
+    import socket
+
+    server = serve(SlowHandler)
+    url = 'http://127.0.0.1:%d/api.pl' % server.server_port
+    pool = transport.ConnectionPool(timeout=0.2)
+    try:
+        pool.post(url, '<request/>')
+        # the reused connection times out, the request may be processing and is not sent again
+        with pytest.raises(socket.timeout):
+            pool.post(url, '<request/>')
+        assert len(SlowHandler.requests) == 2
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+class ClosingHandler(StandInHandler):
+    """ Closes every connection after answering, without telling the client """
+    def do_POST(self):
+        StandInHandler.do_POST(self)
+        self.close_connection = 1
+
+
+def test_pool_retries_closed_keep_alive_connections():
+    server = serve(ClosingHandler)
+    url = 'http://127.0.0.1:%d/api.pl' % server.server_port
+    pool = transport.ConnectionPool()
+    try:
+        for _ in range(3):
+            assert pool.post(url, '<request/>') == TIME_RESPONSE
+        assert pool.stats['connections'] == 3
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_stale_connection_errors():
+    import errno
+    import httplib
+    import socket
+
+    assert transport.is_stale_connection(httplib.BadStatusLine("''"))
+    assert transport.is_stale_connection(socket.error(errno.ECONNRESET, 'reset'))
+    assert not transport.is_stale_connection(socket.timeout('timed out'))
+    assert not transport.is_stale_connection(socket.error(errno.ECONNREFUSED, 'refused'))
@@ -0,0 +1,114 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# template compilation of a new instance, with and without the Jinja2 bytecode cache
+#   python template_benchmark.py precompile [--dir app/template_cache]
+#       compiles every template into the bytecode cache, run it before deploying
+#   python template_benchmark.py startup [--runs 5]
+#       times the first load of the dashboard templates in fresh processes, as a new instance would, without the
+#       bytecode cache and then with a precompiled one
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from flask import Flask
+
+from app.templating import BytecodeCache, precompile_templates
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# the templates a user waits for on the first request of a new instance
+DASHBOARD_TEMPLATES = ('index.html', 'richproject.html', 'richtasks.html', 'richtasks_templates.html')
+
+
+def template_environment(cache_dir=None):
+    """ Return the Jinja2 environment of a Flask app configured as app.main, whose templates are app/templates """
+    app = Flask('app.main', root_path=os.path.join(ROOT, 'app'))
+    if cache_dir:
+        app.jinja_env.bytecode_cache = BytecodeCache(cache_dir)
+    return app.jinja_env
+
+
+def precompile(cache_dir):
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    templates, seconds = precompile_templates(template_environment(cache_dir))
+    print 'compiled %d templates into %s in %.3fs' % (len(templates), cache_dir, seconds)
+
+
+def cold_load(cache_dir=None):
+    """ Load the dashboard templates in this fresh process and print the milliseconds taken by each as JSON """
+    environment = template_environment(cache_dir)
+    timings = {}
+    for name in DASHBOARD_TEMPLATES:
+        start = time.time()
+        environment.get_template(name)
+        timings[name] = (time.time() - start) * 1000
+    print json.dumps(timings)
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def startup_benchmark(runs=5):
+    cache_dir = tempfile.mkdtemp()
+    try:
+        precompile(cache_dir)
+        print '%-28s %12s %12s' % ('first load, median ms', 'no cache', 'bytecode')
+
+        results = {}
+        for mode, args in (('no cache', []), ('bytecode', ['--dir', cache_dir])):
+            samples = [json.loads(subprocess.check_output([sys.executable, __file__, 'cold'] + args, cwd=ROOT))
+                       for _ in range(runs)]
+            results[mode] = dict((name, median([sample[name] for sample in samples])) for name in DASHBOARD_TEMPLATES)
+            results[mode]['total'] = median([sum(sample.values()) for sample in samples])
+
+        for name in DASHBOARD_TEMPLATES + ('total',):
+            print '%-28s %12.1f %12.1f' % (name, results['no cache'][name], results['bytecode'][name])
+    finally:
+        shutil.rmtree(cache_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='template compilation benchmarks')
+    commands = parser.add_subparsers(dest='command')
+
+    pre = commands.add_parser('precompile', help='fill the bytecode cache before deploying')
+    pre.add_argument('--dir', default=os.path.join(ROOT, 'app', 'template_cache'))
+
+    startup = commands.add_parser('startup', help='time the first template loads with and without the bytecode cache')
+    startup.add_argument('--runs', type=int, default=5)
+
+    # a single measurement in a fresh process, run by startup
+    cold = commands.add_parser('cold')
+    cold.add_argument('--dir')
+
+    args = parser.parse_args()
+    if args.command == 'precompile':
+        precompile(args.dir)
+    elif args.command == 'startup':
+        startup_benchmark(args.runs)
+    else:
+        cold_load(args.dir)
+
+
+if __name__ == '__main__':
+    main()